@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from metrics_calculator.app import (convert_arrow, get_engines_dict,
+                                    get_metrics_dict, get_model_names,
+                                    get_state_options, metrics_from_state,
+                                    save_results, unpack_metadata)
+from metrics_calculator.instrumentation import stage
+from metrics_calculator.lazy import lazy_import
+from metrics_calculator.results import ResultsBuilder
+from metrics_calculator.states import dump_state, load_state
+from metrics_calculator.validation import (run_validation,
+                                           validate_incremental_groups,
+                                           validate_incremental_options,
+                                           validate_metrics,
+                                           validate_problem_type,
+                                           validate_results_structure)
+
+pd = lazy_import('pandas')
+
+
+class MetricsAccumulator():
+    """ Przyrostowe liczenie metryk dla danych podawanych w partiach.
+        Obiekt przyjmuje ten sam słownik metadata co calculate_metrics,
+        a metoda update() - słownik danych o tej samej strukturze co
+        argument data, zawierający jedną partię obserwacji dla wybranych
+        zbiorów. Każda partia jest walidowana tak samo jak dane
+        w calculate_metrics, po czym dodawana do stanu danego zbioru
+        (macierzy pomyłek lub statystyk reszt), więc zużycie pamięci nie
+        zależy od łącznej liczby obserwacji.
+
+        Pole 'validate' działa tak jak w calculate_metrics. Pola
+        'bootstrap' i 'cache' oraz klucz 'groups' w danych wymagają
+        wszystkich danych naraz, więc zamiast ich pomijania zgłaszane są
+        błędy WrongMetadataValue i WrongGroups.
+
+        Metoda result() zwraca w dowolnym momencie obiekt DataFrame
+        o takiej samej strukturze, jaką zwróciłoby calculate_metrics dla
+        wszystkich dotychczas podanych danych.
+
+        Akumulatory policzone dla rozłącznych części danych (np. w osobnych
+        procesach) można połączyć metodą merge(), a ich stan przesłać
+        w postaci słownika zwracanego przez to_dict().
+    """
+
+    def __init__(self, metadata: dict) -> None:
+        self.problem_type, self.metrics, self.results_file_name, \
+            self.results_structure, self.comment, \
+            self.save = unpack_metadata(metadata)
+        self.metrics_dict = get_metrics_dict()
+        self.dataset_names = metadata.get('dataset_names')
+        self.results_store = metadata.get('results_store')
+        self.compact = metadata.get('compact', False)
+        self.validate = metadata.get('validate', True)
+
+        validate_incremental_options(metadata)
+        validate_results_structure(self.results_structure)
+        validate_problem_type(self.problem_type)
+        validate_metrics(self.metrics, self.problem_type, self.metrics_dict)
+
+        self.engine = get_engines_dict()[self.problem_type]
+        self.state_options = get_state_options(self.problem_type,
+                                               self.metrics, metadata)
+        self.states = {}
+        self.models = {}
+
+    def update(self, data: dict) -> None:
+        for dataset in data.keys():
+            validate_incremental_groups(data[dataset], dataset)
+            real = convert_arrow(data[dataset]['y_real'])
+            predicted = convert_arrow(data[dataset]['y_pred'])
+            if self.validate:
+                with stage('run_validation', dataset):
+                    run_validation(real, predicted, self.metrics,
+                                   self.metrics_dict, self.problem_type,
+                                   dataset, self.results_structure,
+                                   self.dataset_names, self.compact)
+
+            with stage('compute_state', dataset):
+                state = self.engine.compute_state(real, predicted,
+                                                  **self.state_options)
+            if dataset in self.states:
+                state = self.states[dataset].merge(state)
+            self.states[dataset] = state
+            self.models[dataset] = get_model_names(predicted)
+
+    def merge(self, other: 'MetricsAccumulator') -> 'MetricsAccumulator':
+        for dataset, state in other.states.items():
+            if dataset in self.states:
+                state = self.states[dataset].merge(state)
+            self.states[dataset] = state
+            self.models.setdefault(dataset, other.models.get(dataset))
+        return self
+
+    def to_dict(self) -> dict:
+        return {dataset: {**dump_state(state),
+                          'models': self.models.get(dataset)}
+                for dataset, state in self.states.items()}
+
+    @classmethod
+    def from_dict(cls, metadata: dict, states: dict) -> 'MetricsAccumulator':
+        accumulator = cls(metadata)
+        accumulator.states = {dataset: load_state(state)
+                              for dataset, state in states.items()}
+        accumulator.models = {dataset: state.get('models')
+                              for dataset, state in states.items()}
+        return accumulator
+
+    def result(self) -> pd.DataFrame:
+        results_builder = ResultsBuilder(self.metrics, self.results_structure,
+                                         self.comment)
+
+        for dataset, state in self.states.items():
+            with stage('get_results', dataset):
+                values = metrics_from_state(state, self.problem_type,
+                                            self.metrics)
+            results_builder.add(dataset, values, self.models.get(dataset))
+
+        with stage('build_results'):
+            results = results_builder.build()
+        if self.save:
+            with stage('save_results'):
+                save_results(results, self.results_file_name,
+                             results_builder, self.problem_type,
+                             self.results_store)
+        return results
@@ -1,16 +1,29 @@
+from __future__ import annotations
+
 import os
 from datetime import datetime
+from functools import partial
 from typing import Tuple
 
 import numpy as np
-import pandas as pd
-from sklearn.metrics import (accuracy_score, balanced_accuracy_score, f1_score,
-                             mean_absolute_percentage_error,
-                             mean_squared_error, precision_score, r2_score,
-                             recall_score)
 
+import metrics_calculator.classification as classification
+import metrics_calculator.probability as probability
+import metrics_calculator.regression as regression
+from metrics_calculator.bootstrap import bootstrap_intervals
+from metrics_calculator.instrumentation import stage
+from metrics_calculator.lazy import lazy_import
+from metrics_calculator.results import ResultsBuilder
+from metrics_calculator.store import ResultsStore
 from metrics_calculator.validation import (run_validation,
-                                           validate_metadata_dict)
+                                           validate_bootstrap_options,
+                                           validate_dataset_name,
+                                           validate_groups,
+                                           validate_metadata_dict,
+                                           validate_metadata_option,
+                                           validate_results_structure)
+
+pd = lazy_import('pandas')
 
 
 def calculate_metrics(
@@ -20,7 +33,8 @@ def calculate_metrics(
     """ Zadaniem tej funkcji jest zwrócenie obliczonych metryk dla zadanych
         danych wejściowych. Funkcja przyjmuje słownik z obiektami typu Series,
         dla których obliczy metryki oraz słownik z metadanymi:
-        - problem_type: rodzaj problemu (regression/classification),
+        - problem_type: rodzaj problemu (regression/classification/
+          probability),
         - metrics: krotka z metrykami, które zostaną obliczone,
         - results_file_name: nazwa pliku, w którym zapisane zostaną wyniki,
         - results_structure: rodzaj struktury zwracanego obiektu,
@@ -36,6 +50,62 @@ def calculate_metrics(
         równe 'single_row'. Jeśli 'results_structure' przyjmie 'multiple_rows'
         to komentarz zostanie pominięty.
 
+        Wartości rzeczywiste i predykcje mogą być również tablicami
+        np.ndarray lub tablicami Arrow (pyarrow), które przetwarzane są
+        bez kopiowania. Dla obiektów bez indeksu zgodność indeksów nie
+        jest sprawdzana.
+
+        Predykcje mogą być również obiektem DataFrame lub dwuwymiarową
+        tablicą np.ndarray, w której każda kolumna to predykcje innego
+        modelu. Wtedy wartości rzeczywiste przetwarzane są tylko raz,
+        metryki liczone są dla wszystkich kolumn jednocześnie, a wyniki
+        zawierają jeden wiersz na model.
+
+        Opcjonalne pole 'bootstrap' w słowniku metadata (słownik z kluczami
+        'n_resamples', 'confidence_level', 'seed' i 'chunk_size') powoduje
+        dodanie do wyników przedziałów ufności każdej metryki w kolumnach
+        z przyrostkami '_lower' i '_upper'.
+
+        Słownik danych zbioru może zawierać klucz 'groups' z szeregiem
+        kluczy segmentów (np. region, segment klienta) tej samej długości
+        co wartości rzeczywiste. Wtedy metryki liczone są jednym przejściem
+        dla wszystkich grup, a wyniki zawierają jeden wiersz na grupę.
+
+        Opcjonalne pole 'dataset_names' w słowniku metadata pozwala podać
+        własną listę dopuszczalnych nazw zbiorów (np. partycje dzienne)
+        zamiast domyślnych 'train', 'val' i 'test'.
+
+        Jeśli w słowniku metadata podano pole 'results_store' (ścieżka
+        folderu), to przy save=True wyniki dopisywane są do magazynu
+        wyników ResultsStore (pliki Parquet z indeksem SQLite) zamiast do
+        nowego pliku csv.
+
+        Opcjonalne pole 'cache' (obiekt MetricsCache) włącza pamięć
+        podręczną wartości metryk adresowaną zawartością danych. Jeśli
+        metryki dla identycznych y_real i y_pred zostały już policzone, to
+        walidacja danych i obliczenia są pomijane. Pamięć nie jest używana
+        dla grup ani metody bootstrap.
+
+        Pole 'validate' ustawione na False wyłącza walidację danych (np. dla
+        zaufanych potoków, w których dane zostały już sprawdzone).
+
+        Pole 'quantiles' ('exact' albo 'sketch') wymusza dokładny rozkład
+        błędów albo szkic dla percentyli błędu bezwzględnego niezależnie
+        od config.QUANTILE_EXACT_MAX_VALUES. Analogicznie pole 'scores'
+        ('exact' albo 'histogram') wybiera dokładny stan albo histogram
+        dla metryk probabilistycznych niezależnie od
+        config.SCORE_EXACT_MAX_VALUES.
+
+        Pole 'compact' ustawione na True pozwala podać dla klasyfikacji
+        etykiety całkowite, logiczne lub kategoryczne (np. int8 zamiast
+        float64), które trafiają do kerneli zliczających bez konwersji do
+        float. Dane regresyjne typu float32 przetwarzane są w buforach
+        float32 z sumowaniem w float64.
+
+        Czas i pamięć poszczególnych etapów obliczeń można zmierzyć,
+        wywołując funkcję wewnątrz kontekstu Profiler z modułu
+        metrics_calculator.instrumentation.
+
     Args:
         data (dict): słownik z danymi, dla których obliczone zostaną metryki
         metadata (dict): słownik z metadanymi, definiującymi aktualny przypadek
@@ -44,50 +114,196 @@ def calculate_metrics(
         pd.DataFrame: obiekt, zawierający metryki
     """
 
-    problem_type, metrics, results_file_name, \
-        results_structure, comment, save = unpack_metadata(metadata)
+    with stage('unpack_metadata'):
+        problem_type, metrics, results_file_name, \
+            results_structure, comment, save = unpack_metadata(metadata)
     metrics_dict = get_metrics_dict()
-
-    results = pd.DataFrame()
+    bootstrap = metadata.get('bootstrap')
+    if bootstrap is not None:
+        validate_bootstrap_options(bootstrap)
+
+    state_options = get_state_options(problem_type, metrics, metadata)
+    dataset_names = metadata.get('dataset_names')
+    cache = metadata.get('cache')
+    validate = metadata.get('validate', True)
+    compact = metadata.get('compact', False)
+    results_builder = ResultsBuilder(
+        metrics if bootstrap is None else get_interval_names(metrics),
+        results_structure, comment)
 
     for dataset in data.keys():
-        real = data[dataset]['y_real']
-        predicted = data[dataset]['y_pred']
-        run_validation(real, predicted, metrics, metrics_dict,
-                       problem_type, dataset, results_structure)
-
-        results = get_results(results, real, predicted, metrics_dict,
-                              problem_type, dataset, comment,
-                              metrics, results_structure)
+        real = convert_arrow(data[dataset]['y_real'])
+        predicted = convert_arrow(data[dataset]['y_pred'])
+        groups = data[dataset].get('groups')
+
+        key = None
+        if cache is not None and groups is None and bootstrap is None:
+            with stage('cache_lookup', dataset):
+                key = cache.key(real, predicted, problem_type,
+                                get_cache_options(metadata, state_options))
+                values = cache.get(key, metrics)
+            if values is not None:
+                validate_results_structure(results_structure)
+                validate_dataset_name(dataset, dataset_names)
+                results_builder.add(dataset, values,
+                                    get_model_names(predicted))
+                continue
+
+        if validate:
+            with stage('run_validation', dataset):
+                run_validation(real, predicted, metrics, metrics_dict,
+                               problem_type, dataset, results_structure,
+                               dataset_names, compact)
+                if groups is not None:
+                    validate_groups(real, predicted, groups, dataset,
+                                    bootstrap)
+
+        with stage('get_results', dataset):
+            values = get_results(results_builder, real, predicted,
+                                 problem_type, dataset, metrics, bootstrap,
+                                 groups, state_options)
+        if key is not None:
+            cache.put(key, values)
+
+    with stage('build_results'):
+        results = results_builder.build()
     if save:
-        save_results(results, results_file_name)
+        with stage('save_results'):
+            save_results(results, results_file_name, results_builder,
+                         problem_type, metadata.get('results_store'))
     return results
 
 
 def get_results(
-    results: pd.DataFrame,
+    results_builder: ResultsBuilder,
     real: pd.Series,
     predicted: pd.Series,
-    metrics_dict: dict,
     problem_type: str,
     dataset: str,
-    comment: str,
     metrics: Tuple[str, ...],
-    results_structure: str
-) -> pd.DataFrame:
+    bootstrap: dict = None,
+    groups: pd.Series = None,
+    state_options: dict = None
+) -> dict:
+
+    row_labels = get_model_names(predicted)
+    n_groups = 1
+    if groups is not None:
+        groups, row_labels = pd.factorize(np.asarray(groups), sort=True)
+        row_labels = list(row_labels)
+        n_groups = len(row_labels)
+
+    values = compute_metrics(real, predicted, problem_type, metrics,
+                             bootstrap, groups, n_groups, state_options)
+    results_builder.add(dataset, values, row_labels)
+    return values
+
+
+def convert_arrow(values):
+    """ Tablice Arrow (pyarrow.Array, pyarrow.ChunkedArray z jednym
+        fragmentem) zamieniane są na tablice numpy bez kopiowania bufora,
+        jeśli nie zawierają wartości pustych (te zamieniane są na nan
+        i zgłaszane przez walidację). Pozostałe obiekty zwracane są bez
+        zmian, więc pyarrow nie jest importowany, gdy nie jest używany.
+    """
+    if not type(values).__module__.startswith('pyarrow'):
+        return values
+    if hasattr(values, 'num_chunks'):
+        values = values.chunk(0) if values.num_chunks == 1 \
+            else values.combine_chunks()
+    return values.to_numpy(zero_copy_only=False)
+
+
+def get_model_names(predicted) -> list:
+    """ Nazwy modeli dla predykcji w postaci obiektu DataFrame lub tablicy
+        dwuwymiarowej (jedna kolumna na model). Dla pojedynczego szeregu
+        predykcji zwracane jest None.
+    """
+    if isinstance(predicted, pd.DataFrame):
+        return list(predicted.columns)
+    if isinstance(predicted, np.ndarray) and predicted.ndim == 2:
+        return list(range(predicted.shape[1]))
+    return None
+
 
-    if results_structure == 'multiple_rows':
-        for metric in metrics:
-            results.at[dataset, metric] = \
-                metrics_dict[problem_type][metric](real, predicted)
+def compute_metrics(
+    real: pd.Series,
+    predicted: pd.Series,
+    problem_type: str,
+    metrics: Tuple[str, ...],
+    bootstrap: dict = None,
+    groups: np.ndarray = None,
+    n_groups: int = 1,
+    state_options: dict = None
+) -> dict:
+    """ Oblicza zadane metryki dla jednego zbioru. Stan potrzebny do
+        policzenia wszystkich metryk (macierz pomyłek dla klasyfikacji,
+        statystyki reszt dla regresji) budowany jest tylko raz, a metryki
+        są z niego wyprowadzane. Jeśli podano opcje bootstrap, to do
+        wyników dodawane są granice przedziałów ufności. Jeśli podano kody
+        grup, to każda metryka jest tablicą z wartością dla każdej grupy.
+        Opcje compute_state (state_options) domyślnie wynikają z samych
+        metryk (get_state_options bez metadanych).
+    """
 
-    elif results_structure == 'single_row':
-        results.at[0, 'comment'] = comment
-        for metric in metrics:
-            results.at[0, f'{metric}_{dataset}'] = \
-                metrics_dict[problem_type][metric](real, predicted)
+    engine = get_engines_dict()[problem_type]
+    if state_options is None:
+        state_options = get_state_options(problem_type, metrics)
+    with stage('compute_state'):
+        state = engine.compute_state(real, predicted, groups, n_groups,
+                                     **state_options)
+    values = metrics_from_state(state, problem_type, metrics)
+    if bootstrap is not None:
+        with stage('bootstrap'):
+            values.update(bootstrap_intervals(real, predicted, state, engine,
+                                              metrics, bootstrap))
+    return values
 
-    return results
+
+def get_interval_names(metrics: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(name for metric in metrics
+                 for name in (metric, f'{metric}_lower', f'{metric}_upper'))
+
+
+def metrics_from_state(
+    state,
+    problem_type: str,
+    metrics: Tuple[str, ...]
+) -> dict:
+    engine = get_engines_dict()[problem_type]
+    values = {}
+    for metric in metrics:
+        with stage('metric', metric=metric):
+            values[metric] = np.asarray(engine.METRICS[metric](state),
+                                        dtype=np.float64)[()]
+    return values
+
+
+def get_state_options(problem_type: str, metrics: Tuple[str, ...],
+                      metadata: dict = None) -> dict:
+    """ Dodatkowe argumenty compute_state zależne od metryk i metadanych.
+        Rozkład błędów regresji (potrzebny do percentyli błędu
+        bezwzględnego) liczony jest tylko wtedy, gdy zażądano którejś
+        z takich metryk, w trybie z pola 'quantiles' słownika metadata.
+        Rodzaj stanu metryk probabilistycznych wybiera pole 'scores'.
+    """
+    metadata = metadata or {}
+    validate_metadata_option(metadata, 'quantiles', regression.QUANTILE_MODES)
+    validate_metadata_option(metadata, 'scores', probability.SCORE_MODES)
+    if problem_type == 'regression' \
+            and set(metrics) & set(regression.QUANTILE_METRICS):
+        return {'errors': True, 'quantiles': metadata.get('quantiles')}
+    if problem_type == 'probability' and metadata.get('scores') is not None:
+        return {'scores': metadata['scores']}
+    return {}
+
+
+def get_cache_options(metadata: dict, state_options: dict) -> dict:
+    """ Opcje wpływające na wartości metryk, dołączane do klucza pamięci
+        podręcznej.
+    """
+    return {'compact': metadata.get('compact', False),
+            'validate': metadata.get('validate', True), **state_options}
 
 
 def unpack_metadata(metadata: dict) -> Tuple[str, ...]:
@@ -111,20 +327,62 @@ def get_metrics_dict() -> dict:
             'mape': mape,
             'mse': mse,
             'rmse': rmse,
-            'r2': r2
+            'r2': r2,
+            'mae': mae,
+            'median_ae': median_absolute_error,
+            **{f'p{percent}_ae': partial(absolute_error_quantile,
+                                         quantile=percent / 100)
+               for percent in regression.ERROR_PERCENTILES},
+            **{f'pinball_{percent}': partial(pinball_loss,
+                                             quantile=percent / 100)
+               for percent in regression.PINBALL_PERCENTILES}
         },
         'classification': {
             'acc': accuracy,
             'b_acc': balanced_accuracy,
             'f1': f1,
             'precision': precision,
-            'recall': recall
+            'recall': recall,
+            **{f'{function.__name__}_{average}': partial(function,
+                                                         average=average)
+               for function in (f1, precision, recall)
+               for average in ('micro', 'macro', 'weighted')}
+        },
+        'probability': {
+            'roc_auc': roc_auc,
+            'pr_auc': pr_auc,
+            'log_loss': log_loss
         }
     }
     return metrics_dict
 
 
-def save_results(results: pd.DataFrame, file_name: str) -> None:
+def get_engines_dict() -> dict:
+    engines_dict = {
+        'regression': regression,
+        'classification': classification,
+        'probability': probability
+    }
+    return engines_dict
+
+
+def save_results(
+    results: pd.DataFrame,
+    file_name: str,
+    results_builder: ResultsBuilder = None,
+    problem_type: str = None,
+    results_store: str = None
+) -> None:
+    """ Zapisuje wyniki do pliku csv w folderze 'metrics' lub, jeśli podano
+        ścieżkę results_store, dopisuje je do magazynu wyników
+        (ResultsStore), który pozwala na późniejsze zapytania.
+    """
+    if results_store is not None:
+        ResultsStore(results_store).append(
+            results_builder.records(), file_name, problem_type,
+            results_builder.comment)
+        return
+
     file_name = datetime.now().strftime(f"{file_name}   %d-%m-%Y   %H-%M-%S")
     folder_path = 'metrics'
 
@@ -135,30 +393,81 @@ def save_results(results: pd.DataFrame, file_name: str) -> None:
 
 ''' Regression metrics '''
 def mape(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(mean_absolute_percentage_error(real, predicted))
+    stats = regression.compute_state(real, predicted)
+    return np.float64(regression.mape(stats))
 
 def mse(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(mean_squared_error(real, predicted, squared=True))
+    stats = regression.compute_state(real, predicted)
+    return np.float64(regression.mse(stats))
 
 def rmse(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(mean_squared_error(real, predicted, squared=False))
+    stats = regression.compute_state(real, predicted)
+    return np.float64(regression.rmse(stats))
 
 def r2(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(r2_score(real, predicted))
+    stats = regression.compute_state(real, predicted)
+    return np.float64(regression.r2(stats))
 
+def mae(real: pd.Series, predicted: pd.Series) -> np.float64:
+    stats = regression.compute_state(real, predicted)
+    return np.float64(regression.mae(stats))
 
-''' Classification metrics '''
-def accuracy(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(accuracy_score(real, predicted))
+def median_absolute_error(real: pd.Series, predicted: pd.Series) -> np.float64:
+    stats = regression.compute_state(real, predicted, errors=True)
+    return np.float64(regression.median_absolute_error(stats))
 
-def balanced_accuracy(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(balanced_accuracy_score(real, predicted))
+def absolute_error_quantile(real: pd.Series, predicted: pd.Series,
+                            quantile: float) -> np.float64:
+    stats = regression.compute_state(real, predicted, errors=True)
+    return np.float64(regression.absolute_error_quantile(stats, quantile))
 
-def f1(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(f1_score(real, predicted))
+def pinball_loss(real: pd.Series, predicted: pd.Series,
+                 quantile: float) -> np.float64:
+    stats = regression.compute_state(real, predicted)
+    return np.float64(regression.pinball_loss(stats, quantile))
 
-def precision(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(precision_score(real, predicted))
 
-def recall(real: pd.Series, predicted: pd.Series) -> np.float64:
-    return np.float64(recall_score(real, predicted, average='macro'))
+''' Classification metrics '''
+def accuracy(real: pd.Series, predicted: pd.Series) -> np.float64:
+    cm = classification.compute_state(real, predicted)
+    return np.float64(classification.accuracy(cm))
+
+def balanced_accuracy(real: pd.Series, predicted: pd.Series) -> np.float64:
+    cm = classification.compute_state(real, predicted)
+    return np.float64(classification.balanced_accuracy(cm))
+
+def f1(real: pd.Series, predicted: pd.Series,
+       average: str = 'binary') -> np.float64:
+    cm = classification.compute_state(real, predicted)
+    return np.float64(classification.f1(cm, average))
+
+def precision(real: pd.Series, predicted: pd.Series,
+              average: str = 'binary') -> np.float64:
+    cm = classification.compute_state(real, predicted)
+    return np.float64(classification.precision(cm, average))
+
+def recall(real: pd.Series, predicted: pd.Series,
+           average: str = 'macro') -> np.float64:
+    cm = classification.compute_state(real, predicted)
+    return np.float64(classification.recall(cm, average))
+
+def class_report(real: pd.Series, predicted: pd.Series) -> pd.DataFrame:
+    """ Raport dla każdej klasy (liczność, liczba predykcji, precision,
+        recall i f1) z etykietami klas jako indeksem. """
+    cm = classification.compute_state(real, predicted)
+    return pd.DataFrame(classification.class_report(cm),
+                        index=pd.Index(cm.labels, name='label'))
+
+
+''' Probability metrics '''
+def roc_auc(real: pd.Series, predicted: pd.Series) -> np.float64:
+    state = probability.compute_state(real, predicted)
+    return np.float64(probability.roc_auc(state))
+
+def pr_auc(real: pd.Series, predicted: pd.Series) -> np.float64:
+    state = probability.compute_state(real, predicted)
+    return np.float64(probability.pr_auc(state))
+
+def log_loss(real: pd.Series, predicted: pd.Series) -> np.float64:
+    state = probability.compute_state(real, predicted)
+    return np.float64(probability.log_loss(state))
@@ -0,0 +1,33 @@
+import json
+import statistics
+import subprocess
+import sys
+
+
+MODULES = ('metrics_calculator.app', 'metrics_calculator.accumulator',
+           'metrics_calculator.parallel')
+
+CODE = '''import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+'''
+
+
+def measure_import_time(module: str, repeats: int = 7) -> float:
+    """ Mediana czasu importu modułu (w sekundach) w nowym interpreterze,
+        czyli bez modułów wczytanych wcześniej w bieżącym procesie.
+    """
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c',
+                                 CODE.format(module=module)],
+                                capture_output=True, text=True, check=True)
+        times.append(float(output.stdout))
+    return statistics.median(times)
+
+
+if __name__ == '__main__':
+    for module in MODULES:
+        print(json.dumps({'benchmark': 'import_time', 'module': module,
+                          'seconds': measure_import_time(module)}))
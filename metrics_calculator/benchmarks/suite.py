@@ -0,0 +1,211 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.datasets import make_classification, make_regression
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+from metrics_calculator.app import calculate_metrics, get_metrics_dict
+
+
+""" Maksymalna liczba wierszy generowanych przez make_classification
+    i make_regression. Większe zbiory powstają przez powielenie danych. """
+MAX_GENERATED_ROWS = 10 ** 5
+
+ROWS = tuple(10 ** power for power in range(2, 9))
+
+
+def generate_data(problem_type: str, n_rows: int, seed: int = 0) -> dict:
+    """ Dane w formacie calculate_metrics (zbiory train/val/test) z
+        predykcjami drzewa decyzyjnego, tak jak w skrypcie testing.py.
+        Dla metryk probabilistycznych predykcje to prawdopodobieństwa
+        klasy 1 z tego samego klasyfikatora. Dane generowane są dla co
+        najwyżej MAX_GENERATED_ROWS wierszy, a następnie powielane do
+        n_rows.
+    """
+    generating_functions = {
+        'classification': make_classification,
+        'regression': make_regression,
+        'probability': make_classification
+    }
+    models = {
+        'classification': DecisionTreeClassifier,
+        'regression': DecisionTreeRegressor,
+        'probability': DecisionTreeClassifier
+    }
+
+    n_generated = min(n_rows, MAX_GENERATED_ROWS)
+    data = {}
+    for index, dataset in enumerate(['train', 'val', 'test']):
+        X, y = generating_functions[problem_type](
+            n_samples=n_generated, n_features=5, random_state=seed + index)
+        model = models[problem_type](max_depth=3, random_state=seed)
+        model.fit(X, y)
+        if problem_type == 'probability':
+            predicted = model.predict_proba(X)[:, 1]
+        else:
+            predicted = model.predict(X)
+        data[dataset] = {
+            'y_real': pd.Series(np.resize(y.astype(float), n_rows)),
+            'y_pred': pd.Series(np.resize(predicted.astype(float), n_rows))
+        }
+    return data
+
+
+def get_metadata(problem_type: str,
+                 results_structure: str,
+                 validate: bool,
+                 save: bool) -> dict:
+    return {
+        'problem_type': problem_type,
+        'metrics': tuple(get_metrics_dict()[problem_type]),
+        'results_file_name': f'benchmark_{problem_type}',
+        'results_structure': results_structure,
+        'comment': 'benchmark',
+        'validate': validate,
+        'save': save
+    }
+
+
+def get_repeats(n_rows: int) -> int:
+    return int(np.clip(10 ** 7 // n_rows, 3, 50))
+
+
+def run_case(data: dict, metadata: dict, repeats: int) -> dict:
+    """ Czasy kolejnych wywołań calculate_metrics (po jednym wywołaniu
+        rozgrzewającym) oraz szczytowe zużycie pamięci zmierzone przez
+        tracemalloc w osobnym wywołaniu, żeby nie zaburzać pomiaru czasu.
+    """
+    n_rows = sum(len(values['y_real']) for values in data.values())
+    calculate_metrics(data=data, metadata=metadata)
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        calculate_metrics(data=data, metadata=metadata)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    calculate_metrics(data=data, metadata=metadata)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {
+        'rows': n_rows,
+        'repeats': repeats,
+        'latency_p50': p50,
+        'latency_p90': p90,
+        'latency_p99': p99,
+        'rows_per_second': n_rows / p50,
+        'peak_memory_bytes': peak
+    }
+
+
+def get_case_name(problem_type: str, n_rows: int, results_structure: str,
+                  validate: bool, save: bool) -> str:
+    return f'{problem_type}/{n_rows}/{results_structure}/' \
+        f'validate={validate}/save={save}'
+
+
+def run_suite(max_rows: int, repeats: int = None) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            for problem_type, n_rows in itertools.product(
+                    list(get_metrics_dict()),
+                    [rows for rows in ROWS if rows <= max_rows]):
+                data = generate_data(problem_type, n_rows)
+                for results_structure, validate, save in itertools.product(
+                        ['single_row', 'multiple_rows'], [True, False],
+                        [False, True]):
+                    name = get_case_name(problem_type, n_rows,
+                                         results_structure, validate, save)
+                    metadata = get_metadata(problem_type, results_structure,
+                                            validate, save)
+                    result = run_case(data, metadata,
+                                      repeats or get_repeats(n_rows))
+                    results.append({'name': name, **result})
+                    print(f'{name}: {result["latency_p50"]:.6f} s, '
+                          f'{result["rows_per_second"]:.3e} wierszy/s',
+                          file=sys.stderr)
+        finally:
+            os.chdir(working_directory)
+    return results
+
+
+def compare_with_baseline(results: list,
+                          baseline: list,
+                          tolerance: float) -> list:
+    """ Zwraca przypadki, dla których mediana czasu jest gorsza od wartości
+        bazowej o więcej niż tolerance (np. 0.2 oznacza 20%).
+    """
+    baseline = {case['name']: case for case in baseline}
+    regressions = []
+    for case in results:
+        reference = baseline.get(case['name'])
+        if reference is None:
+            continue
+        ratio = case['latency_p50'] / reference['latency_p50']
+        if ratio > 1 + tolerance:
+            regressions.append({'name': case['name'], 'ratio': ratio})
+    return regressions
+
+
+def get_environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor()
+    }
+
+
+def main(arguments: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Benchmark funkcji calculate_metrics')
+    parser.add_argument('--max-rows', type=int, default=10 ** 6)
+    parser.add_argument('--repeats', type=int, default=None)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    arguments = parser.parse_args(arguments)
+
+    results = run_suite(arguments.max_rows, arguments.repeats)
+    report = {'environment': get_environment(), 'results': results}
+
+    exit_code = 0
+    if arguments.baseline is not None:
+        if os.path.exists(arguments.baseline):
+            with open(arguments.baseline) as file:
+                baseline = json.load(file)['results']
+            report['regressions'] = compare_with_baseline(
+                results, baseline, arguments.tolerance)
+            for regression in report['regressions']:
+                print(f'Spadek wydajności: {regression["name"]} '
+                      f'({regression["ratio"]:.2f}x)', file=sys.stderr)
+            exit_code = int(bool(report['regressions']))
+        else:
+            print(f'Brak pliku bazowego {arguments.baseline} (można go '
+                  f'utworzyć poleceniem make benchmark_baseline)',
+                  file=sys.stderr)
+            exit_code = 2
+
+    with open(arguments.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,498 @@
+from __future__ import annotations
+
+from functools import partial
+
+import numpy as np
+
+import metrics_calculator.config as config
+from metrics_calculator.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+class ConfusionMatrix():
+    """ Macierz pomyłek wraz z posortowanymi etykietami klas. Wiersze
+        odpowiadają wartościom rzeczywistym, kolumny predykcjom. Macierz
+        może mieć dodatkowe wymiary wiodące (..., k, k) - wtedy każda
+        metryka liczona jest osobno dla każdego elementu tych wymiarów.
+
+        Metryki korzystają jedynie z sum wierszy, kolumn i przekątnej
+        macierzy, więc gdy gęste macierze wszystkich grup i kolumn
+        predykcji miałyby więcej niż config.DENSE_MAX_CELLS komórek,
+        from_arrays zwraca SparseConfusionMatrix, która nie tworzy gęstych
+        macierzy k x k.
+    """
+
+    def __init__(self, labels: np.ndarray, matrix: np.ndarray) -> None:
+        self.labels = labels
+        self.matrix = matrix
+
+    @classmethod
+    def from_arrays(cls, real, predicted, groups=None,
+                    n_groups: int = 1) -> 'ConfusionMatrix':
+        """ Dla predykcji w postaci tablicy dwuwymiarowej (n, m) zwracana
+            jest macierz o wymiarach (m, k, k), czyli osobna macierz pomyłek
+            dla każdej kolumny predykcji ze wspólnym zbiorem etykiet.
+            Jeśli podano kody grup (liczby z przedziału [0, n_groups)), to
+            zwracana jest macierz (n_groups, k, k) z osobną macierzą pomyłek
+            dla każdej grupy, policzona jednym przejściem po danych.
+
+            Małe nieujemne etykiety całkowite zliczane są bezpośrednio,
+            jeśli macierze o rozmiarze (największa etykieta + 1) mają nie
+            więcej komórek niż fragment danych (config.CHUNK_SIZE).
+            W przeciwnym razie etykiety kodowane są liczbami z przedziału
+            [0, k), gdzie k to liczba różnych etykiet, więc rozmiar stanu
+            zależy od k, a nie od wartości etykiet (np. {0, 1000}).
+        """
+        real = np.asarray(real)
+        predicted = np.asarray(predicted)
+        columns = predicted.reshape(len(predicted), -1)
+        shape = (n_groups, columns.shape[1])
+
+        low = min(real.min(), columns.min())
+        high = max(real.max(), columns.max())
+        direct = low >= 0 and high < config.MAX_DIRECT_LABEL
+        if direct and n_cells(shape, int(high) + 1) <= config.CHUNK_SIZE:
+            matrix = count_matrices(real, columns, int(high) + 1,
+                                    encode_direct, groups, n_groups)
+            present = (matrix.sum(axis=(0, 1, 2))
+                       + matrix.sum(axis=(0, 1, 3))) > 0
+            labels = np.flatnonzero(present).astype(
+                np.result_type(real, predicted))
+            matrix = matrix[..., present, :][..., present]
+        else:
+            if direct:
+                present = present_labels(real, columns, int(high) + 1)
+                labels = np.flatnonzero(present).astype(
+                    np.result_type(real, predicted))
+                lookup = np.cumsum(present) - 1
+                encode = partial(encode_lookup, lookup)
+            else:
+                labels = np.unique(np.concatenate([real, columns.ravel()]))
+                check_discrete(labels)
+                encode = partial(np.searchsorted, labels)
+            if n_cells(shape, len(labels)) > config.DENSE_MAX_CELLS:
+                return SparseConfusionMatrix.from_codes(
+                    labels, real, columns, predicted.ndim, groups, n_groups,
+                    encode)
+            matrix = count_matrices(real, columns, len(labels), encode,
+                                    groups, n_groups)
+
+        if predicted.ndim == 1:
+            matrix = matrix[:, 0]
+        if groups is None:
+            matrix = matrix[0]
+        return cls(labels, matrix)
+
+    def merge(self, other: 'ConfusionMatrix') -> 'ConfusionMatrix':
+        """ Łączy macierze pomyłek dwóch rozłącznych części danych, które
+            mogą zawierać różne zbiory etykiet. Operacja jest łączna
+            i przemienna, a wynik jest dokładny.
+        """
+        labels = np.union1d(self.labels, other.labels)
+        if isinstance(other, SparseConfusionMatrix) or n_cells(
+                self.matrix.shape[:-2], len(labels)) > config.DENSE_MAX_CELLS:
+            return self.to_sparse().merge(other)
+        shape = self.matrix.shape[:-2] + (len(labels), len(labels))
+        matrix = np.zeros(shape, dtype=np.int64)
+        for cm in (self, other):
+            positions = np.searchsorted(labels, cm.labels)
+            matrix[..., positions[:, None], positions] += cm.matrix
+        return ConfusionMatrix(labels, matrix)
+
+    def to_dict(self) -> dict:
+        return {'labels': self.labels.tolist(),
+                'matrix': self.matrix.tolist()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'ConfusionMatrix':
+        return cls(np.asarray(state['labels']),
+                   np.asarray(state['matrix'], dtype=np.int64))
+
+    def to_sparse(self) -> 'SparseConfusionMatrix':
+        shape = self.matrix.shape[:-2]
+        cells = np.flatnonzero(self.matrix)
+        return SparseConfusionMatrix(self.labels, shape, cells,
+                                     self.matrix.ravel()[cells])
+
+    def n_samples(self) -> np.ndarray:
+        return self.matrix.sum(axis=(-2, -1))
+
+    def true_positives(self) -> np.ndarray:
+        return np.diagonal(self.matrix, axis1=-2, axis2=-1)
+
+    def support(self) -> np.ndarray:
+        return self.matrix.sum(axis=-1)
+
+    def predicted_counts(self) -> np.ndarray:
+        return self.matrix.sum(axis=-2)
+
+
+class SparseConfusionMatrix():
+    """ Macierz pomyłek w postaci współrzędnych (COO) dla dużej liczby
+        klas. Przechowywane są tylko niezerowe komórki: cells to numery
+        komórek w spłaszczonej macierzy o wymiarach shape + (k, k),
+        a counts ich liczności. Metody zwracające sumy wierszy, kolumn
+        i przekątnej mają takie same wymiary wyników jak w ConfusionMatrix,
+        więc wszystkie metryki działają bez zmian, a pamięć zależy od
+        liczby niezerowych komórek, a nie od k * k.
+    """
+
+    def __init__(self, labels: np.ndarray, shape: tuple, cells: np.ndarray,
+                 counts: np.ndarray) -> None:
+        self.labels = labels
+        self.shape = tuple(shape)
+        self.cells = cells
+        self.counts = counts
+
+    @classmethod
+    def from_codes(cls, labels: np.ndarray, real_codes: np.ndarray,
+                   pred_codes: np.ndarray, ndim: int, groups=None,
+                   n_groups: int = 1,
+                   encode=None) -> 'SparseConfusionMatrix':
+        """ Zlicza niezerowe komórki dla etykiet zakodowanych liczbami
+            z przedziału [0, k). Dane przetwarzane są fragmentami,
+            a liczności komórek z fragmentów są na końcu sumowane. Jeśli
+            podano funkcję encode, to zamienia ona etykiety na kody osobno
+            dla każdego fragmentu, więc kody całych danych nie są
+            alokowane.
+        """
+        if encode is None:
+            encode = np.asarray
+        size = len(labels)
+        width = pred_codes.shape[1]
+        offsets = np.arange(width, dtype=np.int64) * size * size
+        rows = max(1, config.CHUNK_SIZE // width)
+        parts_cells, parts_counts = [], []
+        for start in range(0, len(real_codes), rows):
+            codes = encode(real_codes[start:start + rows, None]).astype(
+                np.int64) * size + encode(pred_codes[start:start + rows]) \
+                + offsets
+            if groups is not None:
+                codes += groups[start:start + rows, None].astype(np.int64) \
+                    * (width * size * size)
+            cells, counts = np.unique(codes, return_counts=True)
+            parts_cells.append(cells)
+            parts_counts.append(counts)
+
+        shape = (n_groups, width)
+        if ndim == 1:
+            shape = shape[:1]
+        if groups is None:
+            shape = shape[1:]
+        cells, counts = sum_cells(np.concatenate(parts_cells),
+                                  np.concatenate(parts_counts))
+        return cls(labels, shape, cells, counts)
+
+    def merge(self, other) -> 'SparseConfusionMatrix':
+        if isinstance(other, ConfusionMatrix):
+            other = other.to_sparse()
+        labels = np.union1d(self.labels, other.labels)
+        cells, counts = sum_cells(
+            np.concatenate([cm.relabel(labels) for cm in (self, other)]),
+            np.concatenate([self.counts, other.counts]))
+        return SparseConfusionMatrix(labels, self.shape, cells, counts)
+
+    def relabel(self, labels: np.ndarray) -> np.ndarray:
+        """ Numery niezerowych komórek po zamianie etykiet na ich nadzbiór
+            labels.
+        """
+        batch, real, pred = self.coordinates()
+        positions = np.searchsorted(labels, self.labels)
+        size = len(labels)
+        return (batch * size + positions[real]) * size + positions[pred]
+
+    def coordinates(self) -> tuple:
+        size = len(self.labels)
+        batch, cell = np.divmod(self.cells, size * size)
+        real, pred = np.divmod(cell, size)
+        return batch, real, pred
+
+    def to_dict(self) -> dict:
+        return {'labels': self.labels.tolist(), 'shape': list(self.shape),
+                'cells': self.cells.tolist(), 'counts': self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'SparseConfusionMatrix':
+        return cls(np.asarray(state['labels']), tuple(state['shape']),
+                   np.asarray(state['cells'], dtype=np.int64),
+                   np.asarray(state['counts'], dtype=np.int64))
+
+    def count_per_batch(self, codes: np.ndarray, counts: np.ndarray,
+                        size: int) -> np.ndarray:
+        length = int(np.prod(self.shape, dtype=np.int64)) * size
+        return np.bincount(codes, weights=counts, minlength=length).astype(
+            np.int64).reshape(self.shape + ((size,) if size > 1 else ()))
+
+    def n_samples(self) -> np.ndarray:
+        batch, _, _ = self.coordinates()
+        return self.count_per_batch(batch, self.counts, 1)
+
+    def true_positives(self) -> np.ndarray:
+        batch, real, pred = self.coordinates()
+        diagonal = real == pred
+        size = len(self.labels)
+        return self.count_per_batch(batch[diagonal] * size + real[diagonal],
+                                    self.counts[diagonal], size)
+
+    def support(self) -> np.ndarray:
+        batch, real, _ = self.coordinates()
+        size = len(self.labels)
+        return self.count_per_batch(batch * size + real, self.counts, size)
+
+    def predicted_counts(self) -> np.ndarray:
+        batch, _, pred = self.coordinates()
+        size = len(self.labels)
+        return self.count_per_batch(batch * size + pred, self.counts, size)
+
+
+class ClassCounts():
+    """ Sumy macierzy pomyłek potrzebne do policzenia metryk (trafienia,
+        liczności wartości rzeczywistych i predykcji dla każdej klasy) bez
+        samej macierzy. Tablice mają wymiary (..., k), np. (okna, k) dla
+        metryk w oknach przesuwnych liczonych z sum prefiksowych.
+    """
+
+    def __init__(self, labels: np.ndarray, true_positives: np.ndarray,
+                 support: np.ndarray, predicted_counts: np.ndarray) -> None:
+        self.labels = labels
+        self.class_true_positives = true_positives
+        self.class_support = support
+        self.class_predicted_counts = predicted_counts
+
+    def n_samples(self) -> np.ndarray:
+        return self.class_support.sum(axis=-1)
+
+    def true_positives(self) -> np.ndarray:
+        return self.class_true_positives
+
+    def support(self) -> np.ndarray:
+        return self.class_support
+
+    def predicted_counts(self) -> np.ndarray:
+        return self.class_predicted_counts
+
+
+def sum_cells(cells: np.ndarray, counts: np.ndarray) -> tuple:
+    """ Sumuje liczności powtarzających się numerów komórek. """
+    cells, inverse = np.unique(cells, return_inverse=True)
+    return cells, np.bincount(inverse, weights=counts,
+                              minlength=len(cells)).astype(np.int64)
+
+
+def compute_state(real, predicted, groups=None,
+                  n_groups: int = 1) -> ConfusionMatrix:
+    if is_categorical(real) and is_categorical(predicted):
+        return from_categorical(real, predicted, groups, n_groups)
+    return ConfusionMatrix.from_arrays(real, predicted, groups, n_groups)
+
+
+def is_categorical(values) -> bool:
+    return isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype)
+
+
+def from_categorical(real: pd.Series, predicted: pd.Series, groups=None,
+                     n_groups: int = 1) -> ConfusionMatrix:
+    """ Macierz pomyłek dla etykiet kategorycznych liczona na kodach
+        kategorii zamiast na wartościach. Kody obu szeregów sprowadzane są
+        do wspólnego, posortowanego zbioru kategorii i zapisywane
+        w najwęższym wystarczającym typie całkowitym (np. uint8 dla
+        najwyżej 256 klas), a etykiety macierzy zamieniane są na końcu na
+        wartości kategorii.
+    """
+    labels = np.union1d(np.asarray(real.cat.categories),
+                        np.asarray(predicted.cat.categories))
+    check_discrete(labels)
+    dtype = np.min_scalar_type(max(len(labels) - 1, 0))
+    cm = ConfusionMatrix.from_arrays(
+        *(np.searchsorted(labels, np.asarray(values.cat.categories)).astype(
+            dtype)[np.asarray(values.cat.codes)]
+          for values in (real, predicted)),
+        groups, n_groups)
+    cm.labels = labels[cm.labels]
+    return cm
+
+
+def count_matrices(real: np.ndarray,
+                   columns: np.ndarray,
+                   size: int,
+                   encode,
+                   groups: np.ndarray = None,
+                   n_groups: int = 1) -> np.ndarray:
+    """ Zlicza macierze pomyłek (n_groups, m, size, size) dla każdej grupy
+        i każdej z m kolumn predykcji jednym wywołaniem np.bincount na
+        fragment danych. Funkcja encode zamienia etykiety na liczby
+        całkowite z przedziału [0, size). Dane przetwarzane są fragmentami,
+        żeby nie alokować tymczasowych tablic o pełnej długości.
+    """
+    width = columns.shape[1]
+    offsets = np.arange(width) * size * size
+    matrix = np.zeros(n_groups * width * size * size, dtype=np.int64)
+    rows = max(1, config.CHUNK_SIZE // width)
+    for start in range(0, len(real), rows):
+        real_codes = encode(real[start:start + rows]) * size
+        pred_codes = encode(columns[start:start + rows])
+        codes = pred_codes + real_codes[:, None] + offsets
+        if groups is not None:
+            codes += groups[start:start + rows, None] * (width * size * size)
+        matrix += np.bincount(codes.ravel(), minlength=len(matrix))
+    return matrix.reshape(n_groups, width, size, size)
+
+
+def present_labels(real: np.ndarray, columns: np.ndarray,
+                   size: int) -> np.ndarray:
+    """ Maska etykiet z przedziału [0, size) występujących w wartościach
+        rzeczywistych lub predykcjach, liczona fragmentami.
+    """
+    present = np.zeros(size, dtype=bool)
+    rows = max(1, config.CHUNK_SIZE // columns.shape[1])
+    for start in range(0, len(real), rows):
+        for values in (real[start:start + rows], columns[start:start + rows]):
+            present |= np.bincount(encode_direct(values).ravel(),
+                                   minlength=size) > 0
+    return present
+
+
+def encode_lookup(lookup: np.ndarray, values: np.ndarray) -> np.ndarray:
+    return lookup[encode_direct(values)]
+
+
+def n_cells(shape: tuple, size: int) -> int:
+    """ Liczba komórek gęstych macierzy pomyłek shape + (size, size). """
+    return int(np.prod(shape, dtype=np.int64)) * size * size
+
+
+def encode_direct(values: np.ndarray) -> np.ndarray:
+    codes = values.astype(np.intp)
+    if values.dtype.kind not in 'biu' and not np.array_equal(codes, values):
+        raise ValueError('Metryki klasyfikacyjne wymagają dyskretnych '
+                         'etykiet, a otrzymano wartości ciągłe')
+    return codes
+
+
+def check_discrete(labels: np.ndarray) -> None:
+    if labels.dtype.kind == 'f' and not np.array_equal(labels,
+                                                       np.floor(labels)):
+        raise ValueError('Metryki klasyfikacyjne wymagają dyskretnych '
+                         'etykiet, a otrzymano wartości ciągłe')
+
+
+def safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """ Dzielenie, które tak jak sklearn (zero_division='warn') zwraca 0
+        tam, gdzie mianownik jest zerowy.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator == 0, 0.0, numerator / denominator)
+
+
+def binary_counts(cm: ConfusionMatrix) -> tuple:
+    """ Zwraca liczby (tp, rzeczywiste, przewidziane) dla klasy pozytywnej
+        równej 1, zgodnie z domyślnym average='binary' w sklearn.
+    """
+    if len(cm.labels) > 2:
+        raise ValueError('Dane zawierają więcej niż dwie klasy, a metryka '
+                         'wymaga problemu binarnego')
+    positive = np.flatnonzero(cm.labels == 1)
+    if len(positive) == 0:
+        if len(cm.labels) == 2:
+            raise ValueError('Etykieta pozytywna 1 nie występuje w danych '
+                             f'(etykiety: {cm.labels.tolist()})')
+        zeros = np.zeros(cm.n_samples().shape, dtype=np.int64)
+        return zeros, zeros, zeros
+
+    index = positive[0]
+    return (cm.true_positives()[..., index],
+            cm.support()[..., index],
+            cm.predicted_counts()[..., index])
+
+
+def accuracy(cm: ConfusionMatrix) -> np.ndarray:
+    return cm.true_positives().sum(axis=-1) / cm.n_samples()
+
+
+def balanced_accuracy(cm: ConfusionMatrix) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_class = cm.true_positives() / cm.support()
+    return np.nanmean(per_class, axis=-1)
+
+
+def average_scores(cm: ConfusionMatrix,
+                   numerator: np.ndarray,
+                   denominator: np.ndarray,
+                   average: str) -> np.ndarray:
+    """ Uśrednia wyniki klas numerator / denominator tak jak sklearn:
+        - 'micro': iloraz sum po wszystkich klasach,
+        - 'macro': średnia po klasach występujących w wartościach
+          rzeczywistych lub predykcjach (przy macierzach ze wspólnym
+          zbiorem etykiet pomijane są klasy, które dla danej macierzy nie
+          wystąpiły wcale),
+        - 'weighted': średnia ważona licznościami klas w wartościach
+          rzeczywistych.
+    """
+    if average == 'micro':
+        return safe_divide(numerator.sum(axis=-1), denominator.sum(axis=-1))
+
+    per_class = safe_divide(numerator, denominator)
+    support = cm.support()
+    if average == 'weighted':
+        return safe_divide((per_class * support).sum(axis=-1),
+                           support.sum(axis=-1))
+    if average == 'macro':
+        present = (support + cm.predicted_counts()) > 0
+        return per_class.sum(axis=-1) / present.sum(axis=-1)
+    raise ValueError(f'Nieznany sposób uśredniania "{average}"')
+
+
+def f1(cm: ConfusionMatrix, average: str = 'binary') -> np.ndarray:
+    if average == 'binary':
+        true_positives, real_positives, predicted_positives = \
+            binary_counts(cm)
+        return safe_divide(2 * true_positives,
+                           real_positives + predicted_positives)
+    return average_scores(cm, 2 * cm.true_positives(),
+                          cm.support() + cm.predicted_counts(), average)
+
+
+def precision(cm: ConfusionMatrix, average: str = 'binary') -> np.ndarray:
+    if average == 'binary':
+        true_positives, _, predicted_positives = binary_counts(cm)
+        return safe_divide(true_positives, predicted_positives)
+    return average_scores(cm, cm.true_positives(), cm.predicted_counts(),
+                          average)
+
+
+def recall(cm: ConfusionMatrix, average: str = 'macro') -> np.ndarray:
+    if average == 'binary':
+        true_positives, real_positives, _ = binary_counts(cm)
+        return safe_divide(true_positives, real_positives)
+    return average_scores(cm, cm.true_positives(), cm.support(), average)
+
+
+def class_report(cm: ConfusionMatrix) -> dict:
+    """ Liczności i metryki dla każdej klasy (tablice o ostatnim wymiarze
+        równym liczbie klas), liczone bez tworzenia macierzy k x k.
+    """
+    true_positives = cm.true_positives()
+    support = cm.support()
+    predicted_counts = cm.predicted_counts()
+    return {
+        'support': support,
+        'predicted': predicted_counts,
+        'true_positives': true_positives,
+        'precision': safe_divide(true_positives, predicted_counts),
+        'recall': safe_divide(true_positives, support),
+        'f1': safe_divide(2 * true_positives, support + predicted_counts)
+    }
+
+
+METRICS = {
+    'acc': accuracy,
+    'b_acc': balanced_accuracy,
+    'f1': f1,
+    'precision': precision,
+    'recall': recall,
+    **{f'{name}_{average}': partial(function, average=average)
+       for name, function in (('f1', f1), ('precision', precision),
+                              ('recall', recall))
+       for average in ('micro', 'macro', 'weighted')}
+}
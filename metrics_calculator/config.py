@@ -1 +1,66 @@
+import os
+
 PATH_TO_LOGS = './metrics_calculator/logs'
+
+""" Maksymalna wartość etykiety kodowanej bezpośrednio przez np.bincount """
+MAX_DIRECT_LABEL = 1024
+
+""" Maksymalna liczba komórek gęstych macierzy pomyłek (grupy * kolumny
+    predykcji * klasy * klasy); dla większych macierz przechowywana jest
+    jako rzadka (tylko niezerowe komórki) """
+DENSE_MAX_CELLS = 2048 ** 2
+
+""" Maksymalna liczba predykcji oraz komórek stanu jednej klasy (grupy
+    * kolumny * unikalne wartości, również po połączeniu stanów), dla której
+    metryki probabilistyczne liczone są dokładnie; powyżej używany jest
+    histogram o SCORE_BINS przedziałach """
+SCORE_EXACT_MAX_VALUES = 10 ** 6
+SCORE_BINS = 2 ** 12
+
+""" Maksymalna liczba błędów bezwzględnych (łącznie dla wszystkich kolumn
+    i grup), dla której percentyle błędu liczone są dokładnie; powyżej
+    używany jest szkic z co najwyżej QUANTILE_SKETCH_SIZE elementami na
+    poziom (błąd rangi nie większy niż (log2(n / size) + 1) / size) """
+QUANTILE_EXACT_MAX_VALUES = 10 ** 6
+QUANTILE_SKETCH_SIZE = 2 ** 12
+
+""" Liczba wierszy przetwarzanych jednorazowo przez kernele metryk """
+CHUNK_SIZE = 2 ** 18
+
+""" Minimalny rozmiar tablicy (w bajtach) przekazywanej do procesów
+    przez pamięć współdzieloną zamiast przez pickle """
+SHARED_MEMORY_MIN_BYTES = 2 ** 20
+
+""" Domyślne dopuszczalne nazwy zbiorów w słowniku data """
+DATASET_NAMES = ('train', 'val', 'test')
+
+""" Domyślny limit rozmiaru (w bajtach) warstwy MetricsCache w pamięci """
+CACHE_MAX_BYTES = 2 ** 26
+
+""" Tryb zapisu logów: 'sync' (zapis w wątku wywołującym) lub 'async'
+    (kolejka i wątek zapisujący w tle) """
+LOG_MODE = 'sync'
+
+""" Format logów: 'text' lub 'json' (jeden obiekt JSON na linię) """
+LOG_FORMAT = 'text'
+
+""" Rozmiar pliku z logami (w bajtach), po którego przekroczeniu plik jest
+    rotowany, oraz liczba zachowywanych plików (0 wyłącza rotację) """
+LOG_MAX_BYTES = 0
+LOG_BACKUP_COUNT = 0
+
+""" Domyślny limit pamięci (w bajtach) na fragment danych czytanych
+    z plików przez calculate_metrics_from_files """
+OUT_OF_CORE_MEMORY_BUDGET = 2 ** 28
+
+""" Szacowana liczba kopii fragmentu danych (konwersje i tablice
+    pośrednie) używana do wyznaczenia liczby wierszy fragmentu """
+OUT_OF_CORE_COPIES = 4
+
+""" Domyślna liczba procesów, wielkość paczki zadań (liczba zadań i łączny
+    rozmiar plików w bajtach) oraz limit wysłanych, niezakończonych paczek
+    dla python -m metrics_calculator """
+SERVICE_WORKERS = os.cpu_count() or 1
+SERVICE_BATCH_SIZE = 16
+SERVICE_BATCH_BYTES = 2 ** 20
+SERVICE_MAX_PENDING = 32
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import metrics_calculator.logger_utils.logger as logger_module
+from metrics_calculator.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+""" Aktywny obiekt Profiler (None, jeśli pomiary są wyłączone) """
+_active_profiler = contextvars.ContextVar('active_profiler', default=None)
+_disabled = nullcontext()
+
+
+def stage(name: str, dataset: str = None, metric: str = None):
+    """ Kontekst mierzący etap obliczeń. Jeśli żaden Profiler nie jest
+        aktywny, zwracany jest pusty kontekst, więc koszt wyłączonych
+        pomiarów ogranicza się do odczytu zmiennej kontekstowej.
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return _disabled
+    return profiler.stage(name, dataset, metric)
+
+
+class Profiler():
+    """ Zbiera czas rzeczywisty, czas procesora i szczytową liczbę
+        zaalokowanych bajtów dla każdego etapu obliczeń (unpack_metadata,
+        run_validation, get_results, compute_state, metryki,
+        build_results, save_results) z podziałem na zbiory i metryki:
+
+            with Profiler() as profiler:
+                results = calculate_metrics(data=data, metadata=metadata)
+            profile = profiler.to_frame()
+
+        Etapy zagnieżdżone dziedziczą nazwę zbioru po etapie nadrzędnym.
+        Pamięć mierzona jest przez tracemalloc (memory=False wyłącza ten
+        pomiar, który spowalnia obliczenia). Każdy rekord może być
+        dodatkowo przekazany do funkcji callback lub zapisany w logach
+        przez podany logger.
+    """
+
+    def __init__(self,
+                 memory: bool = True,
+                 callback=None,
+                 logger=None) -> None:
+        self.memory = memory
+        self.callback = callback
+        self.logger = logger
+        self.records = []
+        self.frames = []
+        self.token = None
+        self.started_tracing = False
+
+    def __enter__(self) -> 'Profiler':
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.token = _active_profiler.set(self)
+        return self
+
+    def __exit__(self, *args) -> None:
+        _active_profiler.reset(self.token)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str, dataset: str = None, metric: str = None):
+        if dataset is None and self.frames:
+            dataset = self.frames[-1]['dataset']
+        frame = {'dataset': dataset, 'start_bytes': 0, 'peak_bytes': 0}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.frames:
+                self.frames[-1]['peak_bytes'] = max(
+                    self.frames[-1]['peak_bytes'], peak)
+            tracemalloc.reset_peak()
+            frame['start_bytes'] = current
+        self.frames.append(frame)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            self.frames.pop()
+            peak_bytes = None
+            if self.memory:
+                frame['peak_bytes'] = max(frame['peak_bytes'],
+                                          tracemalloc.get_traced_memory()[1])
+                peak_bytes = frame['peak_bytes'] - frame['start_bytes']
+                if self.frames:
+                    self.frames[-1]['peak_bytes'] = max(
+                        self.frames[-1]['peak_bytes'], frame['peak_bytes'])
+                tracemalloc.reset_peak()
+            self.add_record({'stage': name, 'dataset': dataset,
+                             'metric': metric, 'wall_time': wall_time,
+                             'cpu_time': cpu_time, 'peak_bytes': peak_bytes})
+
+    def add_record(self, record: dict) -> None:
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        if self.logger is not None:
+            logger_module.log_info(self.logger, json.dumps(record))
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records,
+                            columns=['stage', 'dataset', 'metric',
+                                     'wall_time', 'cpu_time', 'peak_bytes'])
@@ -0,0 +1,21 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """ Zwraca moduł, który zostanie wczytany dopiero przy pierwszym
+        dostępie do jego atrybutu (importlib.util.LazyLoader). Pozwala to
+        uniknąć kosztu importu ciężkich zależności (np. pandas) przy samym
+        imporcie kalkulatora, np. w krótko żyjących procesach.
+        Jeśli moduł został już zaimportowany, zwracany jest bez zmian.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
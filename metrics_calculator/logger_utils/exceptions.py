@@ -111,6 +111,31 @@ w słowniku') -> None:
 class MetadataKeyMissing(Error):
     def __init__(self, func_name, code_line, message,
                  description='Brakujący klucz w słowniku metadata') -> None:
+        self.message = get_full_message(func_name, code_line,
+                                        description, message)
+        super().__init__(self.message)
+
+
+class WrongBootstrapOptions(Error):
+    def __init__(self, func_name, code_line, message,
+                 description='Niepoprawne opcje metody bootstrap') -> None:
+        self.message = get_full_message(func_name, code_line,
+                                        description, message)
+        super().__init__(self.message)
+
+
+class WrongGroups(Error):
+    def __init__(self, func_name, code_line, message,
+                 description='Niepoprawny szereg kluczy grup') -> None:
+        self.message = get_full_message(func_name, code_line,
+                                        description, message)
+        super().__init__(self.message)
+
+
+class WrongMetadataValue(Error):
+    def __init__(self, func_name, code_line, message,
+                 description='Niepoprawna wartość pola w słowniku \
+metadata') -> None:
         self.message = get_full_message(func_name, code_line,
                                         description, message)
         super().__init__(self.message)
\ No newline at end of file
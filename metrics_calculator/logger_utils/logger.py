@@ -1,29 +1,27 @@
+import atexit
+import json
 import logging
 import logging.handlers
+import os
+import queue
+
+
+""" Wątki zapisujące logi w tle (tryb 'async'), po jednym na logger """
+_listeners = {}
 
 
 class MyFormatter(logging.Formatter):
-    _formats = {}
 
     def __init__(self, *args, **kwargs):
         super(MyFormatter, self).__init__(*args, **kwargs)
+        self._formats = {}
 
     def set_formatter(self, level, formatter):
         self._formats[level] = formatter
 
     def format(self, record):
-        if 'code_line' in record.args:
-            record.code_line = record.args.get("code_line")
-        if 'dataset' in record.args:
-            record.dataset = record.args.get("dataset")
-        if 'horizon' in record.args:
-            record.horizon = record.args.get("horizon")
-        if 'func_name' in record.args:
-            record.func_name = record.args.get("func_name")
-            if record.func_name == '<module>':
-                record.func_name = 'none'
-            else:
-                record.func_name = record.func_name + '()'
+        if isinstance(record.args, dict):
+            set_record_fields(record, record.args)
 
         f = self._formats.get(record.levelno)
         if f is None:
@@ -32,7 +30,107 @@ class MyFormatter(logging.Formatter):
         return f.format(record)
 
 
-def get_module_logger(mod_name: str, file_name: str, log_path: str, level):
+class JsonLinesFormatter(logging.Formatter):
+    """ Zapisuje każdy komunikat jako jeden obiekt JSON w osobnej linii,
+        co ułatwia przetwarzanie logów przez systemy agregujące.
+    """
+
+    def __init__(self, file_name: str):
+        super(JsonLinesFormatter, self).__init__()
+        self.file_name = file_name
+
+    def format(self, record):
+        if isinstance(record.args, dict):
+            set_record_fields(record, record.args)
+
+        entry = {
+            'time': self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            'level': record.levelname,
+            'file_name': self.file_name,
+            'func_name': getattr(record, 'func_name', None),
+            'code_line': getattr(record, 'code_line', None),
+            'message': record.getMessage()
+        }
+        return json.dumps({key: value for key, value in entry.items()
+                           if value is not None}, ensure_ascii=False)
+
+
+def set_record_fields(record, fields: dict) -> None:
+    """ Przepisuje pola przekazane w args (starszy sposób wywołania) do
+        atrybutów rekordu, tak jak robi to parametr extra.
+    """
+    record.args = ()
+    for key in ('code_line', 'dataset', 'horizon'):
+        if key in fields:
+            setattr(record, key, fields[key])
+    if 'func_name' in fields:
+        record.func_name = format_func_name(fields['func_name'])
+
+
+def format_func_name(func_name: str) -> str:
+    if func_name == '<module>':
+        return 'none'
+    return func_name + '()'
+
+
+class LazyFileHandler(logging.handlers.RotatingFileHandler):
+    """ FileHandler, który tworzy katalog i plik z logami dopiero przy
+        zapisie pierwszego komunikatu, a nie przy utworzeniu loggera.
+        Jeśli podano maxBytes, to plik jest rotowany po przekroczeniu tego
+        rozmiaru (backupCount poprzednich plików z przyrostkami .1, .2...).
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        super(LazyFileHandler, self).__init__(filename, *args, delay=True,
+                                              **kwargs)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super(LazyFileHandler, self)._open()
+
+
+def get_module_logger(mod_name: str, file_name: str, log_path: str, level,
+                      mode: str = 'sync', log_format: str = 'text',
+                      max_bytes: int = 0, backup_count: int = 0):
+    """ Zwraca logger zapisujący do pliku log_path. Kolejne wywołania dla
+        tej samej nazwy modułu nie dodają kolejnych handlerów.
+        - mode: 'sync' (zapis w wątku wywołującym) lub 'async' (rekordy
+          trafiają do kolejki, a zapisem na dysk zajmuje się wątek
+          QueueListener, więc wywołujący nie czeka na operacje I/O),
+        - log_format: 'text' (dotychczasowy format) lub 'json' (jeden
+          obiekt JSON na linię),
+        - max_bytes, backup_count: rotacja pliku po przekroczeniu rozmiaru
+          (0 wyłącza rotację).
+    """
+    logger = logging.getLogger(mod_name)
+    logger.setLevel(level)
+    if logger.handlers:
+        return logger
+
+    if log_format == 'json':
+        formatter = JsonLinesFormatter(file_name)
+    else:
+        formatter = get_text_formatter(file_name)
+
+    file_handler = LazyFileHandler(log_path, maxBytes=max_bytes,
+                                   backupCount=backup_count,
+                                   encoding='utf-8')
+    file_handler.setFormatter(formatter)
+
+    if mode == 'async':
+        log_queue = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(
+            log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        _listeners[mod_name] = listener
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_text_formatter(file_name: str) -> MyFormatter:
 
     row_for_error = '[%(asctime)s] || \
 %(levelname)-7s ||' \
@@ -63,25 +161,36 @@ Message: "%(message)s"'
     formatter.set_formatter(logging.INFO, logging.Formatter(row_for_info, "%Y-%m-%d %H:%M:%S"))  # noqa: E501
     formatter.set_formatter(logging.DEBUG, logging.Formatter(row_for_debug, "%Y-%m-%d %H:%M:%S"))  # noqa: E501
 
-    file_handler = logging.FileHandler(log_path)
-    file_handler.setFormatter(formatter)
+    return formatter
 
-    logger = logging.getLogger(mod_name)
-    logger.setLevel(level)
-    logger.addHandler(file_handler)
 
-    return logger
+def flush_logs() -> None:
+    """ Czeka, aż wątki w tle zapiszą wszystkie oczekujące rekordy. """
+    for listener in list(_listeners.values()):
+        listener.queue.join()
+
+
+@atexit.register
+def stop_listeners() -> None:
+    """ Zatrzymuje wątki zapisujące logi w tle po zapisaniu wszystkich
+        oczekujących rekordów. Wywoływana automatycznie przy zakończeniu
+        programu.
+    """
+    while _listeners:
+        _, listener = _listeners.popitem()
+        listener.stop()
 
 
 def log_error(logger, ErrorType, err, func_name, code_line):
-    logger.error(err, {'code_line': code_line, 'func_name': func_name})
+    logger.error(err, extra={'code_line': code_line,
+                             'func_name': format_func_name(func_name)})
     raise ErrorType(func_name, code_line, err)
 
 def log_warning(logger, message, func_name):
-    logger.warning(message, {'func_name': func_name})
+    logger.warning(message, extra={'func_name': format_func_name(func_name)})
 
 def log_info(logger, message):
     logger.info(message)
 
 def log_debug(logger, message, func_name):
-    logger.debug(message, {'func_name': func_name})
+    logger.debug(message, extra={'func_name': format_func_name(func_name)})
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import numpy as np
+
+import metrics_calculator.config as config
+from metrics_calculator.accumulator import MetricsAccumulator
+from metrics_calculator.lazy import lazy_import
+from metrics_calculator.validation import (validate_incremental_groups,
+                                           validate_source_lengths)
+
+pd = lazy_import('pandas')
+
+
+def calculate_metrics_from_files(
+    data: dict,
+    metadata: dict,
+    memory_budget: int = config.OUT_OF_CORE_MEMORY_BUDGET
+) -> pd.DataFrame:
+    """ Oblicza metryki dla danych zapisanych na dysku bez wczytywania ich
+        w całości do pamięci. Słownik data ma taką samą postać jak
+        w calculate_metrics, ale zamiast obiektów Series zawiera ścieżki:
+        - plik .npy (jedno- lub dwuwymiarowy dla wielu modeli), który jest
+          mapowany do pamięci przez np.load(mmap_mode='r'),
+        - plik .parquet z jedną kolumną lub para (ścieżka, kolumna), gdzie
+          kolumna może być listą kolumn predykcji wielu modeli; plik
+          czytany jest partiami (wymaga pakietu pyarrow).
+
+        Dane przetwarzane są fragmentami, których rozmiar wynika
+        z memory_budget (w bajtach). Przed odczytem danych porównywane są
+        liczby wierszy obu plików (z nagłówka .npy lub metadanych Parquet),
+        a następnie każdy fragment jest walidowany tak jak dane
+        w calculate_metrics i dodawany do MetricsAccumulator, więc wynik
+        ma taką samą strukturę jak wynik calculate_metrics. Fragmenty
+        przekazywane są bez kopiowania jako tablice numpy (lub DataFrame
+        dla wielu kolumn Parquet). Pole 'validate' działa tak jak
+        w calculate_metrics, a dla pól 'bootstrap' i 'cache' oraz klucza
+        'groups' zgłaszane są błędy (patrz MetricsAccumulator).
+    """
+    accumulator = MetricsAccumulator(metadata)
+    for dataset, paths in data.items():
+        validate_incremental_groups(paths, dataset)
+
+    for dataset, paths in data.items():
+        real_rows, real_width = get_source_shape(paths['y_real'])
+        predicted_rows, predicted_width = get_source_shape(paths['y_pred'])
+        validate_source_lengths(real_rows, predicted_rows, dataset)
+        bytes_per_row = np.float64().nbytes * (real_width + predicted_width) \
+            * config.OUT_OF_CORE_COPIES
+        rows = max(1, memory_budget // bytes_per_row)
+
+        for real, predicted in zip(iter_chunks(paths['y_real'], rows),
+                                   iter_chunks(paths['y_pred'], rows)):
+            accumulator.update({dataset: {'y_real': real,
+                                          'y_pred': predicted}})
+
+    return accumulator.result()
+
+
+def get_source(source) -> tuple:
+    if isinstance(source, (tuple, list)):
+        return source[0], source[1]
+    return source, None
+
+
+def get_source_shape(source) -> tuple:
+    """ Liczba wierszy i kolumn źródła bez odczytu danych. """
+    path, columns = get_source(source)
+    if str(path).endswith('.npy'):
+        values = np.load(path, mmap_mode='r')
+        return len(values), 1 if values.ndim == 1 else values.shape[1]
+
+    import pyarrow.parquet as pq
+
+    rows = pq.ParquetFile(path).metadata.num_rows
+    if isinstance(columns, (tuple, list)):
+        return rows, len(columns)
+    return rows, 1
+
+
+def iter_chunks(source, rows: int):
+    path, columns = get_source(source)
+    if str(path).endswith('.npy'):
+        return iter_npy_chunks(path, rows)
+    return iter_parquet_chunks(path, columns, rows)
+
+
+def iter_npy_chunks(path: str, rows: int):
+    values = np.load(path, mmap_mode='r')
+    for start in range(0, len(values), rows):
+        yield values[start:start + rows]
+
+
+def iter_parquet_chunks(path: str, columns, rows: int):
+    """ Czyta plik Parquet partiami po rows wierszy. Partie zwracane przez
+        pyarrow mogą być krótsze (kończą się na granicach grup wierszy),
+        więc są sklejane, żeby fragmenty obu plików zbioru były zgodne.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    multiple = isinstance(columns, (tuple, list))
+    selected = list(columns) if multiple else \
+        None if columns is None else [columns]
+
+    pending = []
+    n_pending = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=rows,
+                                                   columns=selected):
+        pending.append(batch)
+        n_pending += batch.num_rows
+        while n_pending >= rows:
+            table = pa.Table.from_batches(pending)
+            yield to_values(table.slice(0, rows), multiple)
+            pending = table.slice(rows).to_batches()
+            n_pending -= rows
+    if n_pending:
+        yield to_values(pa.Table.from_batches(pending), multiple)
+
+
+def to_values(table, multiple: bool):
+    if multiple:
+        return table.to_pandas()
+    return table.column(0).to_numpy()
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics_calculator.config as config
+from metrics_calculator.app import (compute_metrics, convert_arrow,
+                                    get_cache_options, get_interval_names,
+                                    get_metrics_dict, get_model_names,
+                                    get_state_options, save_results,
+                                    unpack_metadata)
+from metrics_calculator.lazy import lazy_import
+from metrics_calculator.results import ResultsBuilder
+from metrics_calculator.validation import (run_validation,
+                                           validate_bootstrap_options,
+                                           validate_dataset_name,
+                                           validate_groups,
+                                           validate_results_structure)
+
+pd = lazy_import('pandas')
+
+
+def calculate_metrics_many(
+    jobs: list,
+    workers: int = None,
+    backend: str = 'process',
+    max_pending: int = None
+) -> list:
+    """ Oblicza metryki dla wielu wywołań calculate_metrics jednocześnie.
+        Każde zadanie w liście jobs to słownik z kluczami 'data' i
+        'metadata' o takiej samej postaci jak argumenty calculate_metrics.
+        Walidacja i odczyt pamięci podręcznej (pole 'cache') wykonywane są
+        w procesie wywołującym, a obliczanie metryk (wraz z przedziałami
+        ufności, jeśli podano pole 'bootstrap') dla każdej pary (zadanie,
+        zbiór) rozdzielane jest między workers procesów (backend='process')
+        lub wątków (backend='thread').
+
+        W trybie procesowym duże tablice przekazywane są przez pamięć
+        współdzieloną (multiprocessing.shared_memory) zamiast kopiowania
+        ich przez pickle. Jednocześnie wysłanych jest co najwyżej
+        max_pending zadań (domyślnie dwa na worker), a bloki pamięci
+        współdzielonej zadania zwalniane są zaraz po odebraniu jego
+        wyników, więc w /dev/shm znajdują się tylko tablice zadań w toku.
+        Zwracana jest lista obiektów DataFrame w tej samej kolejności co
+        zadania, każdy o takiej samej strukturze, jaką zwróciłoby
+        calculate_metrics.
+    """
+
+    executors = {
+        'process': ProcessPoolExecutor,
+        'thread': ThreadPoolExecutor
+    }
+    if backend not in executors:
+        raise ValueError(f'Nieznany backend "{backend}". Dostępne '
+                         f'wartości to: {", ".join(executors)}')
+
+    prepared = [prepare_job(job) for job in jobs]
+    max_pending = max_pending or 2 * (workers or os.cpu_count() or 1)
+
+    results_list = []
+    submitted = deque()
+    try:
+        with executors[backend](max_workers=workers) as executor:
+            for job, preparation in zip(jobs, prepared):
+                submitted.append(submit_job(executor, backend, job,
+                                            preparation))
+                if len(submitted) >= max_pending:
+                    results_list.append(collect_job(*submitted.popleft()))
+            while submitted:
+                results_list.append(collect_job(*submitted.popleft()))
+    finally:
+        for *_, blocks in submitted:
+            release_blocks(blocks)
+
+    return results_list
+
+
+def submit_job(executor, backend: str, job: dict, preparation: tuple) -> tuple:
+    """ Wysyła do puli obliczenia zbiorów zadania, których nie ma w pamięci
+        podręcznej. Zwraca zadanie, wynik prepare_job, słownik obiektów
+        Future dla zbiorów oraz listę bloków pamięci współdzielonej
+        utworzonych dla zadania.
+    """
+    metadata, bootstrap, _, cached, arrays = preparation
+    problem_type, metrics = metadata[:2]
+    state_options = get_state_options(problem_type, metrics, job['metadata'])
+    blocks, futures = [], {}
+    try:
+        for dataset in job['data'].keys():
+            if dataset in cached:
+                continue
+            futures[dataset] = executor.submit(
+                compute_shared_metrics, problem_type, metrics,
+                *[share_array(values, backend, blocks)
+                  for values in arrays[dataset][:3]],
+                len(arrays[dataset][3]), bootstrap, state_options)
+    except BaseException:
+        wait(futures.values())
+        release_blocks(blocks)
+        raise
+    return job, preparation, futures, blocks
+
+
+def collect_job(job: dict, preparation: tuple, futures: dict,
+                blocks: list) -> pd.DataFrame:
+    """ Odbiera wyniki zbiorów zadania, zwalnia jego bloki pamięci
+        współdzielonej, zapisuje wartości w pamięci podręcznej i buduje
+        wynik tak jak calculate_metrics.
+    """
+    metadata, bootstrap, keys, cached, arrays = preparation
+    problem_type, metrics, results_file_name, results_structure, comment, \
+        save = metadata
+    try:
+        values = {dataset: future.result()
+                  for dataset, future in futures.items()}
+    finally:
+        wait(futures.values())
+        release_blocks(blocks)
+
+    results_builder = ResultsBuilder(
+        metrics if bootstrap is None else get_interval_names(metrics),
+        results_structure, comment)
+    for dataset in job['data'].keys():
+        if dataset in cached:
+            values[dataset] = cached[dataset]
+        elif dataset in keys:
+            job['metadata']['cache'].put(keys[dataset], values[dataset])
+        _, predicted, _, labels = arrays[dataset]
+        results_builder.add(dataset, values[dataset],
+                            labels or get_model_names(predicted))
+
+    results = results_builder.build()
+    if save:
+        save_results(results, results_file_name, results_builder,
+                     problem_type, job['metadata'].get('results_store'))
+    return results
+
+
+def release_blocks(blocks: list) -> None:
+    for block in blocks:
+        block.close()
+        block.unlink()
+    blocks.clear()
+
+
+def prepare_job(job: dict) -> tuple:
+    """ Sprawdza metadane i dane zadania w procesie wywołującym tak jak
+        calculate_metrics (z uwzględnieniem pól 'bootstrap', 'cache',
+        'validate', 'compact' i 'dataset_names'). Zwraca rozpakowane
+        metadane, opcje bootstrap, klucze pamięci podręcznej zbiorów,
+        dla których trzeba zapisać wyniki, wartości metryk zbiorów
+        znalezionych w pamięci podręcznej oraz dla każdego zbioru krotkę
+        (wartości rzeczywiste, predykcje, kody grup, etykiety grup). Tablice
+        Arrow zamieniane są na numpy (convert_arrow) przed liczeniem
+        skrótu, walidacją i przekazaniem do workerów, a dla zbiorów bez
+        klucza 'groups' kody i etykiety grup to None i [].
+    """
+    metadata = job['metadata']
+    unpacked = unpack_metadata(metadata)
+    problem_type, metrics, _, results_structure, _, _ = unpacked
+    bootstrap = metadata.get('bootstrap')
+    if bootstrap is not None:
+        validate_bootstrap_options(bootstrap)
+    cache = metadata.get('cache')
+    cache_options = get_cache_options(
+        metadata, get_state_options(problem_type, metrics, metadata))
+    dataset_names = metadata.get('dataset_names')
+
+    keys, cached, arrays = {}, {}, {}
+    for dataset, values in job['data'].items():
+        real = convert_arrow(values['y_real'])
+        predicted = convert_arrow(values['y_pred'])
+        dataset_groups = values.get('groups')
+        arrays[dataset] = real, predicted, None, []
+        if cache is not None and bootstrap is None and dataset_groups is None:
+            key = cache.key(real, predicted, problem_type, cache_options)
+            cached_values = cache.get(key, metrics)
+            if cached_values is not None:
+                validate_results_structure(results_structure)
+                validate_dataset_name(dataset, dataset_names)
+                cached[dataset] = cached_values
+                continue
+            keys[dataset] = key
+
+        if metadata.get('validate', True):
+            run_validation(real, predicted, metrics, get_metrics_dict(),
+                           problem_type, dataset, results_structure,
+                           dataset_names, metadata.get('compact', False))
+            if dataset_groups is not None:
+                validate_groups(real, predicted, dataset_groups, dataset,
+                                bootstrap)
+
+        if dataset_groups is not None:
+            codes, labels = pd.factorize(np.asarray(dataset_groups),
+                                         sort=True)
+            arrays[dataset] = real, predicted, codes, list(labels)
+    return unpacked, bootstrap, keys, cached, arrays
+
+
+def share_array(values, backend: str, blocks: list):
+    """ Zwraca obiekt, który można przekazać do workera. Dla procesów
+        i tablic większych niż config.SHARED_MEMORY_MIN_BYTES jest to opis
+        bloku pamięci współdzielonej, do którego dane zostały skopiowane
+        jednokrotnie (obiekty DataFrame kolumna po kolumnie, bez
+        tymczasowej tablicy np.asarray). Utworzone bloki dopisywane są do
+        listy blocks, żeby można je było zwolnić po odebraniu wyników.
+        Dla wątków oraz danych o typach, których nie można zapisać
+        w buforze (obiekty, typy rozszerzeń pandas), zwracane są same
+        dane.
+    """
+    if values is None or backend != 'process':
+        return values
+    if not isinstance(values, pd.DataFrame):
+        values = np.asarray(values)
+    shape, dtype = get_layout(values)
+    if dtype is None:
+        return values
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if nbytes < config.SHARED_MEMORY_MIN_BYTES:
+        return values
+
+    block = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    blocks.append(block)
+    target = np.ndarray(shape, dtype, buffer=block.buf)
+    if isinstance(values, pd.DataFrame):
+        for index, (_, column) in enumerate(values.items()):
+            target[:, index] = column.to_numpy()
+    else:
+        target[...] = values
+    return ('shared_memory', block.name, dtype.str, shape)
+
+
+def get_layout(values) -> tuple:
+    """ Wymiary i typ tablicy numpy z danymi values bez jej tworzenia.
+        Typ to None, jeśli danych nie można zapisać w pamięci
+        współdzielonej.
+    """
+    dtypes = list(values.dtypes) if isinstance(values, pd.DataFrame) \
+        else [values.dtype]
+    if not all(isinstance(dtype, np.dtype) and dtype.kind not in 'OV'
+               for dtype in dtypes):
+        return values.shape, None
+    return values.shape, np.result_type(*dtypes)
+
+
+def attach_array(descriptor):
+    if not isinstance(descriptor, tuple):
+        return descriptor, None
+
+    _, name, dtype, shape = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, np.dtype(dtype), buffer=block.buf), block
+
+
+def compute_shared_metrics(problem_type: str, metrics: tuple, real,
+                           predicted, groups=None, n_groups: int = 1,
+                           bootstrap: dict = None,
+                           state_options: dict = None) -> dict:
+    real, real_block = attach_array(real)
+    predicted, predicted_block = attach_array(predicted)
+    groups, groups_block = attach_array(groups)
+    try:
+        return compute_metrics(real, predicted, problem_type, metrics,
+                               bootstrap, groups, max(n_groups, 1),
+                               state_options)
+    finally:
+        del real, predicted, groups
+        for block in (real_block, predicted_block, groups_block):
+            if block is not None:
+                block.close()
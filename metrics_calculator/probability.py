@@ -0,0 +1,323 @@
+import numpy as np
+
+import metrics_calculator.config as config
+
+
+EPSILON = np.finfo(np.float64).eps
+
+""" Rodzaje stanu wymuszane polem 'scores' w słowniku metadata (bez tego
+    pola rodzaj zależy od config.SCORE_EXACT_MAX_VALUES) """
+SCORE_MODES = ('exact', 'histogram')
+
+
+class ScoreCounts():
+    """ Dokładny stan metryk probabilistycznych: posortowane rosnąco
+        unikalne wartości prawdopodobieństwa klasy pozytywnej (values) oraz
+        liczności (..., 2, u) wierszy klasy 0 i 1 dla każdej z tych
+        wartości. Krzywe ROC i precision-recall wyznaczane są dla każdego
+        progu równego unikalnej wartości, więc wyniki są takie same jak
+        w sklearn. Wymiary wiodące odpowiadają kolumnom predykcji i grupom
+        tak jak w ConfusionMatrix.
+
+        Jeśli liczba komórek jednej klasy (kolumny * grupy * unikalne
+        wartości) po połączeniu stanów przekroczy
+        config.SCORE_EXACT_MAX_VALUES, to stan zamieniany jest na
+        ScoreHistogram o stałym rozmiarze. Stan w trybie mode = 'exact'
+        (pole 'scores' w słowniku metadata) pozostaje dokładny po każdym
+        połączeniu.
+    """
+
+    def __init__(self, values: np.ndarray, counts: np.ndarray,
+                 mode: str = None) -> None:
+        self.values = values
+        self.counts = counts
+        self.mode = mode
+
+    def merge(self, other):
+        if isinstance(other, ScoreHistogram):
+            return self.to_histogram().merge(other)
+        mode = self.mode or other.mode
+        values = np.union1d(self.values, other.values)
+        if mode != 'exact' and not fits_exact(self.counts.shape[:-2],
+                                              len(values)):
+            return self.to_histogram().merge(other.to_histogram())
+        counts = np.zeros(self.counts.shape[:-1] + (len(values),),
+                          dtype=np.int64)
+        for state in (self, other):
+            counts[..., np.searchsorted(values, state.values)] += \
+                state.counts
+        return ScoreCounts(values, counts, mode)
+
+    def to_histogram(self) -> 'ScoreHistogram':
+        bins = config.SCORE_BINS
+        positions = get_bins(self.values, bins)
+        counts = np.zeros((bins,) + self.counts.shape[:-1], dtype=np.int64)
+        loss_sums = np.zeros(counts.shape)
+        np.add.at(counts, positions, np.moveaxis(self.counts, -1, 0))
+        np.add.at(loss_sums, positions, np.moveaxis(self.loss_sums(), -1, 0))
+        return ScoreHistogram(np.moveaxis(counts, 0, -1),
+                              np.moveaxis(loss_sums, 0, -1))
+
+    def to_dict(self) -> dict:
+        return {'values': self.values.tolist(),
+                'counts': self.counts.tolist(), 'mode': self.mode}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'ScoreCounts':
+        return cls(np.asarray(state['values'], dtype=np.float64),
+                   np.asarray(state['counts'], dtype=np.int64),
+                   state.get('mode'))
+
+    def loss_sums(self) -> np.ndarray:
+        """ Suma składników log loss dla każdej komórki (..., 2, u). """
+        clipped = np.clip(self.values, EPSILON, 1 - EPSILON)
+        return self.counts * np.stack([-np.log1p(-clipped),
+                                       -np.log(clipped)])
+
+
+class ScoreHistogram():
+    """ Przybliżony stan metryk probabilistycznych o stałym rozmiarze:
+        liczności (..., 2, config.SCORE_BINS) wierszy klasy 0 i 1
+        w przedziałach [i / bins, (i + 1) / bins) oraz sumy składników log
+        loss w tych samych komórkach. Histogramy łączone są przez
+        dodawanie, więc stan można liczyć fragmentami i w wielu procesach,
+        a pamięć nie zależy od liczby wierszy.
+
+        Log loss liczony jest dokładnie. Dla ROC AUC i PR AUC każdy
+        przedział traktowany jest jak jeden próg, a błąd względem wyniku
+        dokładnego ograniczają funkcje roc_auc_error_bound
+        i pr_auc_error_bound.
+    """
+
+    def __init__(self, counts: np.ndarray, loss_sums: np.ndarray) -> None:
+        self.counts = counts
+        self.sums = loss_sums
+
+    def merge(self, other) -> 'ScoreHistogram':
+        if isinstance(other, ScoreCounts):
+            other = other.to_histogram()
+        if self.counts.shape != other.counts.shape:
+            raise ValueError('Nie można połączyć histogramów o różnej '
+                             'liczbie przedziałów')
+        return ScoreHistogram(self.counts + other.counts,
+                              self.sums + other.sums)
+
+    def to_histogram(self) -> 'ScoreHistogram':
+        return self
+
+    def to_dict(self) -> dict:
+        return {'counts': self.counts.tolist(),
+                'loss_sums': self.sums.tolist()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'ScoreHistogram':
+        return cls(np.asarray(state['counts'], dtype=np.int64),
+                   np.asarray(state['loss_sums'], dtype=np.float64))
+
+    def loss_sums(self) -> np.ndarray:
+        return self.sums
+
+
+def compute_state(real, predicted, groups=None, n_groups: int = 1,
+                  scores: str = None):
+    """ Wartości rzeczywiste to etykiety 0 i 1, a predykcje to
+        prawdopodobieństwa klasy 1 (dla tablicy dwuwymiarowej (n, m) każda
+        kolumna to inny model). Dokładny stan ScoreCounts zwracany jest,
+        gdy liczba predykcji oraz liczba komórek stanu jednej klasy
+        (grupy * kolumny * unikalne wartości) nie przekraczają
+        config.SCORE_EXACT_MAX_VALUES, a w przeciwnym razie ScoreHistogram
+        liczony bez sortowania. Stan dokładny ma osobną komórkę dla każdej
+        unikalnej wartości w każdej kolumnie i grupie, więc bez drugiego
+        warunku pamięć rosłaby z iloczynem liczby modeli lub grup i liczby
+        unikalnych wartości. Argument scores ('exact' albo 'histogram')
+        wymusza rodzaj stanu niezależnie od liczby predykcji.
+    """
+    real = np.asarray(real)
+    predicted = np.asarray(predicted)
+    columns = predicted.reshape(len(predicted), -1)
+    check_inputs(real, columns)
+
+    values = None
+    if scores == 'exact' or scores is None \
+            and columns.size <= config.SCORE_EXACT_MAX_VALUES:
+        values = np.unique(columns)
+        if scores is None \
+                and not fits_exact((n_groups, columns.shape[1]), len(values)):
+            values = None
+
+    if values is None:
+        bins = config.SCORE_BINS
+        counts, loss_sums = count_scores(
+            real, columns, bins, lambda scores: get_bins(scores, bins),
+            groups, n_groups, with_loss=True)
+        state = ScoreHistogram(counts, loss_sums)
+    else:
+        counts, _ = count_scores(
+            real, columns, len(values),
+            lambda scores: np.searchsorted(values, scores),
+            groups, n_groups)
+        state = ScoreCounts(values.astype(np.float64), counts, scores)
+
+    if predicted.ndim == 1:
+        state = select_column(state)
+    if groups is None:
+        state = select_group(state)
+    return state
+
+
+def fits_exact(shape: tuple, n_values: int) -> bool:
+    """ Czy stan dokładny o wymiarach wiodących shape (grupy, kolumny)
+        i n_values unikalnych wartościach mieści się w limicie.
+    """
+    return int(np.prod(shape)) * n_values <= config.SCORE_EXACT_MAX_VALUES
+
+
+def select_column(state):
+    if isinstance(state, ScoreHistogram):
+        return ScoreHistogram(state.counts[:, 0], state.sums[:, 0])
+    return ScoreCounts(state.values, state.counts[:, 0], state.mode)
+
+
+def select_group(state):
+    if isinstance(state, ScoreHistogram):
+        return ScoreHistogram(state.counts[0], state.sums[0])
+    return ScoreCounts(state.values, state.counts[0], state.mode)
+
+
+def count_scores(real: np.ndarray,
+                 columns: np.ndarray,
+                 size: int,
+                 encode,
+                 groups: np.ndarray = None,
+                 n_groups: int = 1,
+                 with_loss: bool = False) -> tuple:
+    """ Zlicza komórki (n_groups, m, 2, size) jednym wywołaniem np.bincount
+        na fragment danych, tak jak count_matrices w module
+        classification. Jeśli with_loss=True, to zwracane są również sumy
+        składników log loss w tych samych komórkach.
+    """
+    width = columns.shape[1]
+    offsets = np.arange(width) * 2 * size
+    counts = np.zeros(n_groups * width * 2 * size, dtype=np.int64)
+    loss_sums = np.zeros(len(counts)) if with_loss else None
+    rows = max(1, config.CHUNK_SIZE // width)
+    for start in range(0, len(real), rows):
+        labels = real[start:start + rows, None].astype(np.intp)
+        scores = columns[start:start + rows]
+        codes = encode(scores) + labels * size + offsets
+        if groups is not None:
+            codes += groups[start:start + rows, None] * (width * 2 * size)
+        codes = codes.ravel()
+        counts += np.bincount(codes, minlength=len(counts))
+        if with_loss:
+            clipped = np.clip(scores, EPSILON, 1 - EPSILON)
+            loss = -np.where(labels == 1, np.log(clipped),
+                             np.log1p(-clipped))
+            loss_sums += np.bincount(codes, weights=loss.ravel(),
+                                     minlength=len(counts))
+
+    shape = (n_groups, width, 2, size)
+    return counts.reshape(shape), \
+        loss_sums.reshape(shape) if with_loss else None
+
+
+def get_bins(scores: np.ndarray, bins: int) -> np.ndarray:
+    return np.minimum((scores * bins).astype(np.intp), bins - 1)
+
+
+def check_inputs(real: np.ndarray, columns: np.ndarray) -> None:
+    if not np.isin(real, (0, 1)).all():
+        raise ValueError('Metryki probabilistyczne wymagają etykiet 0 i 1 '
+                         'w wartościach rzeczywistych')
+    if columns.size and (columns.min() < 0 or columns.max() > 1):
+        raise ValueError('Predykcje muszą być prawdopodobieństwami '
+                         'z przedziału [0, 1]')
+
+
+def cumulative_counts(state) -> tuple:
+    """ Liczby wierszy pozytywnych i negatywnych w kolejnych progach
+        (od najwyższego) oraz ich skumulowane sumy.
+    """
+    positives = state.counts[..., 1, ::-1]
+    negatives = state.counts[..., 0, ::-1]
+    return positives, negatives, np.cumsum(positives, axis=-1), \
+        np.cumsum(negatives, axis=-1)
+
+
+def divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """ Dzielenie zwracające nan, gdy mianownik jest zerowy (metryka jest
+        nieokreślona, np. w danych występuje tylko jedna klasa).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator == 0, np.nan, numerator / denominator)
+
+
+def roc_auc(state) -> np.ndarray:
+    """ Pole pod krzywą ROC (reguła trapezów, remisy liczone jako 1/2). """
+    positives, negatives, true_positives, false_positives = \
+        cumulative_counts(state)
+    pairs = (negatives * (true_positives - positives / 2)).sum(axis=-1)
+    return divide(pairs, true_positives[..., -1] * false_positives[..., -1])
+
+
+def pr_auc(state) -> np.ndarray:
+    """ Pole pod krzywą precision-recall w postaci average precision
+        (suma precyzji w progach ważona przyrostami recall), tak jak
+        average_precision_score w sklearn.
+    """
+    positives, negatives, true_positives, false_positives = \
+        cumulative_counts(state)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(positives == 0, 0.0, true_positives
+                             / (true_positives + false_positives))
+    return divide((positives * precision).sum(axis=-1),
+                  true_positives[..., -1])
+
+
+def log_loss(state) -> np.ndarray:
+    return divide(state.loss_sums().sum(axis=(-2, -1)),
+                  state.counts.sum(axis=(-2, -1)))
+
+
+def roc_auc_error_bound(state) -> np.ndarray:
+    """ Maksymalna różnica między wynikiem roc_auc dla histogramu
+        a wynikiem dokładnym. Błąd pochodzi jedynie z par (pozytywny,
+        negatywny) w tym samym przedziale, liczonych jako 1/2 zamiast
+        0 lub 1, więc wynosi co najwyżej sum(p_i * n_i) / (2 * P * N).
+        Dla stanu dokładnego zwracane jest 0.
+    """
+    if isinstance(state, ScoreCounts):
+        return np.zeros(state.counts.shape[:-2])
+    positives, negatives, true_positives, false_positives = \
+        cumulative_counts(state)
+    return divide((positives * negatives).sum(axis=-1),
+                  2 * true_positives[..., -1] * false_positives[..., -1])
+
+
+def pr_auc_error_bound(state) -> np.ndarray:
+    """ Maksymalna różnica między wynikiem pr_auc dla histogramu a wynikiem
+        dokładnym. Precyzja w dowolnym progu wewnątrz przedziału i leży
+        między (TP + 1) / (TP + 1 + FP + n_i) a (TP + p_i) / (TP + p_i + FP),
+        gdzie TP i FP to liczności z wyższych przedziałów, a wartość
+        użyta dla histogramu również mieści się w tym zakresie. Błąd wynosi
+        więc co najwyżej suma szerokości tych zakresów ważona p_i / P.
+        Dla stanu dokładnego zwracane jest 0.
+    """
+    if isinstance(state, ScoreCounts):
+        return np.zeros(state.counts.shape[:-2])
+    positives, negatives, true_positives, false_positives = \
+        cumulative_counts(state)
+    previous_tp = true_positives - positives
+    previous_fp = false_positives - negatives
+    with np.errstate(divide='ignore', invalid='ignore'):
+        upper = true_positives / (true_positives + previous_fp)
+        lower = (previous_tp + 1) / (previous_tp + 1 + false_positives)
+        width = np.where(positives == 0, 0.0, upper - lower)
+    return divide((positives * width).sum(axis=-1), true_positives[..., -1])
+
+
+METRICS = {
+    'roc_auc': roc_auc,
+    'pr_auc': pr_auc,
+    'log_loss': log_loss
+}
@@ -0,0 +1,521 @@
+from functools import partial
+
+import numpy as np
+
+import metrics_calculator.config as config
+
+
+EPSILON = np.finfo(np.float64).eps
+
+""" Percentyle błędu bezwzględnego i kwantyle straty pinball (w procentach)
+    dostępne jako metryki, np. 'p95_ae' i 'pinball_90' """
+ERROR_PERCENTILES = (50, 90, 95, 99)
+PINBALL_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+""" Tryby rozkładu błędów wymuszane polem 'quantiles' w słowniku metadata
+    (bez tego pola tryb zależy od config.QUANTILE_EXACT_MAX_VALUES) """
+QUANTILE_MODES = ('exact', 'sketch')
+
+
+class ResidualStats():
+    """ Statystyki dostateczne dla metryk regresyjnych, zbierane w jednym
+        przejściu po danych. Dla wartości rzeczywistych przechowywana jest
+        średnia i suma kwadratów odchyleń od średniej (zamiast surowej sumy
+        kwadratów), co chroni wynik r2 przed utratą precyzji. Pola mogą być
+        tablicami - wtedy każda metryka liczona jest dla każdego elementu.
+
+        Suma błędów ze znakiem (sum_error, predykcja - wartość rzeczywista)
+        razem z sumą błędów bezwzględnych wystarcza do dokładnego policzenia
+        straty pinball dla dowolnego kwantyla. Metryki oparte na
+        percentylach błędu bezwzględnego wymagają dodatkowo rozkładu błędów
+        (errors, obiekt ErrorSketch), liczonego tylko na żądanie.
+    """
+
+    def __init__(self,
+                 count=0,
+                 mean_real=0.0,
+                 m2_real=0.0,
+                 sum_squared_error=0.0,
+                 sum_absolute_error=0.0,
+                 sum_absolute_percentage_error=0.0,
+                 sum_error=0.0,
+                 errors: 'ErrorSketch' = None) -> None:
+        self.count = count
+        self.mean_real = mean_real
+        self.m2_real = m2_real
+        self.sum_squared_error = sum_squared_error
+        self.sum_absolute_error = sum_absolute_error
+        self.sum_absolute_percentage_error = sum_absolute_percentage_error
+        self.sum_error = sum_error
+        self.errors = errors
+
+    @classmethod
+    def from_arrays(cls, real, predicted, groups=None, n_groups: int = 1,
+                    errors: bool = False,
+                    quantiles: str = None) -> 'ResidualStats':
+        """ Dla predykcji w postaci tablicy dwuwymiarowej (n, m) sumy błędów
+            są tablicami o długości m (po jednej wartości na kolumnę),
+            a statystyki wartości rzeczywistych liczone są tylko raz.
+            Jeśli podano kody grup (liczby z przedziału [0, n_groups)), to
+            wszystkie pola są tablicami o długości n_groups. Dla
+            errors=True liczony jest również rozkład błędów bezwzględnych
+            w trybie quantiles (patrz ErrorSketch).
+        """
+        real = np.asarray(real)
+        predicted = np.asarray(predicted)
+
+        stats = cls()
+        if groups is not None:
+            for start in range(0, len(real), config.CHUNK_SIZE):
+                stop = start + config.CHUNK_SIZE
+                stats = stats.merge(cls.from_grouped_chunk(
+                    real[start:stop], predicted[start:stop],
+                    groups[start:stop], n_groups))
+        else:
+            rows = max(1, config.CHUNK_SIZE // np.prod(predicted.shape[1:],
+                                                       dtype=int))
+            for start in range(0, len(real), rows):
+                stop = start + rows
+                stats = stats.merge(
+                    cls.from_chunk(real[start:stop], predicted[start:stop]))
+
+        if errors:
+            stats.errors = ErrorSketch.from_arrays(real, predicted, groups,
+                                                   n_groups, quantiles)
+        return stats
+
+    @classmethod
+    def from_chunk(cls, real: np.ndarray,
+                   predicted: np.ndarray) -> 'ResidualStats':
+        """ Liczy statystyki dla fragmentu danych, alokując co najwyżej
+            dwie tymczasowe tablice o rozmiarze fragmentu.
+
+            Dla danych float32 tablice tymczasowe również mają typ float32
+            (o połowę mniej pamięci i przepustowości), a wszystkie sumy
+            akumulowane są w float64. Suma kwadratów odchyleń jest
+            korygowana o błąd zaokrąglenia średniej do float32, więc
+            względny błąd metryk pozostaje rzędu kilku eps float32.
+        """
+        count = len(real)
+        mean_real = real.sum(dtype=np.float64) / count
+        dtype = get_work_dtype(real, predicted)
+
+        buffer = np.subtract(real, mean_real, dtype=dtype)
+        m2_real = sum_of_products(buffer, buffer)
+        if dtype != np.float64:
+            m2_real -= buffer.sum(dtype=np.float64) ** 2 / count
+
+        real_column = real.reshape((count,) + (1,) * (predicted.ndim - 1))
+        residual = np.subtract(predicted, real_column, dtype=dtype)
+        sum_squared_error = sum_of_products(residual, residual)
+        sum_error = residual.sum(axis=0, dtype=np.float64)
+        np.abs(residual, out=residual)
+        sum_absolute_error = residual.sum(axis=0, dtype=np.float64)
+
+        np.abs(real, out=buffer)
+        np.maximum(buffer, EPSILON, out=buffer)
+        np.divide(residual, buffer.reshape(real_column.shape), out=residual)
+        sum_absolute_percentage_error = residual.sum(axis=0, dtype=np.float64)
+
+        return cls(count, mean_real, m2_real, sum_squared_error,
+                   sum_absolute_error, sum_absolute_percentage_error,
+                   sum_error)
+
+    @classmethod
+    def from_grouped_chunk(cls, real: np.ndarray, predicted: np.ndarray,
+                           groups: np.ndarray,
+                           n_groups: int) -> 'ResidualStats':
+        """ Statystyki wszystkich grup dla fragmentu danych, liczone
+            ważonymi wywołaniami np.bincount, bez pętli po grupach.
+        """
+        def group_sum(values):
+            return np.bincount(groups, weights=values, minlength=n_groups)
+
+        count = np.bincount(groups, minlength=n_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_real = np.where(count == 0, 0.0,
+                                 group_sum(real) / count)
+
+        buffer = np.subtract(real, mean_real[groups], dtype=np.float64)
+        np.multiply(buffer, buffer, out=buffer)
+        m2_real = group_sum(buffer)
+
+        residual = np.subtract(predicted, real, dtype=np.float64)
+        sum_error = group_sum(residual)
+        np.abs(residual, out=residual)
+        sum_absolute_error = group_sum(residual)
+        np.multiply(residual, residual, out=buffer)
+        sum_squared_error = group_sum(buffer)
+
+        np.abs(real, out=buffer)
+        np.maximum(buffer, EPSILON, out=buffer)
+        np.divide(residual, buffer, out=residual)
+        sum_absolute_percentage_error = group_sum(residual)
+
+        return cls(count, mean_real, m2_real, sum_squared_error,
+                   sum_absolute_error, sum_absolute_percentage_error,
+                   sum_error)
+
+    def merge(self, other: 'ResidualStats') -> 'ResidualStats':
+        """ Łączy statystyki dwóch rozłącznych części danych (wzór Chana
+            dla średniej i sumy kwadratów odchyleń). Operacja jest łączna
+            i przemienna z dokładnością do błędów zaokrągleń. Rozkład błędów
+            zachowywany jest tylko wtedy, gdy mają go oba stany.
+        """
+        errors = None
+        if self.errors is not None and other.errors is not None:
+            errors = self.errors.merge(other.errors)
+        count = self.count + other.count
+        delta = other.mean_real - self.mean_real
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(count == 0, 0.0, other.count / count)
+
+        return ResidualStats(
+            count,
+            self.mean_real + delta * weight,
+            self.m2_real + other.m2_real + delta ** 2 * self.count * weight,
+            self.sum_squared_error + other.sum_squared_error,
+            self.sum_absolute_error + other.sum_absolute_error,
+            self.sum_absolute_percentage_error
+            + other.sum_absolute_percentage_error,
+            self.sum_error + other.sum_error,
+            errors)
+
+    def to_dict(self) -> dict:
+        state = {field: np.asarray(value).tolist()
+                 for field, value in vars(self).items() if field != 'errors'}
+        if self.errors is not None:
+            state['errors'] = self.errors.to_dict()
+        return state
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'ResidualStats':
+        errors = state.get('errors')
+        return cls(**{field: np.asarray(value)[()]
+                      for field, value in state.items() if field != 'errors'},
+                   errors=None if errors is None
+                   else ErrorSketch.from_dict(errors))
+
+
+class ErrorSketch():
+    """ Rozkład błędów bezwzględnych |predykcja - wartość rzeczywista|
+        w postaci elementów (wartość, waga) posortowanych według numeru
+        partii (batch, numer elementu wymiarów wiodących shape, np. kolumny
+        predykcji lub grupy), wagi i wartości. Element o wadze w zastępuje
+        w obserwacji. Kwantyle liczone są z interpolacją liniową, tak jak
+        w np.quantile, więc dopóki wszystkie wagi są równe 1, wyniki są
+        dokładne (np. median_ae jest równe median_absolute_error ze
+        sklearn).
+
+        Gdy łączna liczba elementów przekroczy
+        config.QUANTILE_EXACT_MAX_VALUES, stan zamieniany jest na szkic
+        w stylu KLL: poziom (elementy jednej partii o tej samej wadze w),
+        który ma więcej niż k = config.QUANTILE_SKETCH_SIZE elementów, jest
+        zagęszczany - z posortowanych elementów zostaje co 2^j-ty (losowe
+        przesunięcie, 2^j to najmniejsza potęga dwójki, po której zostaje
+        co najwyżej k elementów) z wagą w * 2^j. Szkic pozostaje szkicem po
+        kolejnych połączeniach, więc zajmuje około k * (log2(n / k) + 1)
+        elementów na partię, a stany można łączyć w dowolnej kolejności
+        (fragmenty, procesy, pliki).
+
+        Gwarancja błędu: zagęszczenie poziomu o wadze w co 2^j-ty element
+        zmienia rangę dowolnej wartości co najwyżej o (2^j - 1) * w. Suma
+        tych wartości przechowywana jest w rank_error, więc dla zwracanego
+        kwantyla q rzeczywista ranga względna leży w przedziale
+        q +- rank_error / n (zwraca to funkcja quantile_rank_error).
+        Zagęszczenie odpowiada j kolejnym zagęszczeniom co drugi element,
+        a każdy poziom przyjmuje co najwyżej n / (w * k) takich zagęszczeń,
+        więc ograniczenie nie przekracza około (log2(n / k) + 1) / k, np.
+        0.004 dla k = 2 ** 12 i n = 10 ** 8. Losowe przesunięcie sprawia,
+        że błędy zagęszczeń mają wartość oczekiwaną 0, więc typowy błąd
+        jest kilka razy mniejszy.
+
+        Tryb mode = 'exact' wyłącza zagęszczanie niezależnie od liczby
+        elementów (pamięć rośnie liniowo z liczbą obserwacji), a tryb
+        'sketch' zagęszcza stan przy każdym połączeniu, także dla małych
+        danych. Tryb zachowywany jest w stanach powstałych z połączenia.
+    """
+
+    def __init__(self, shape: tuple, batch: np.ndarray, values: np.ndarray,
+                 weights: np.ndarray, rank_error: np.ndarray,
+                 mode: str = None) -> None:
+        self.shape = tuple(shape)
+        self.batch = batch
+        self.values = values
+        self.weights = weights
+        self.rank_error = rank_error
+        self.mode = mode
+
+    @classmethod
+    def from_arrays(cls, real, predicted, groups=None, n_groups: int = 1,
+                    mode: str = None) -> 'ErrorSketch':
+        """ Dla predykcji (n, m) partiami są kolumny, a dla kodów grup -
+            grupy, tak jak w ResidualStats.from_arrays. Dane przetwarzane
+            są fragmentami: błędy fragmentu są sortowane, a szkic fragmentu
+            łączony z dotychczasowym.
+        """
+        real = np.asarray(real)
+        predicted = np.asarray(predicted)
+        columns = predicted.reshape(len(predicted), -1)
+        width = columns.shape[1]
+        shape = (n_groups, width)
+        if predicted.ndim == 1:
+            shape = shape[:1]
+        if groups is None:
+            shape = shape[1:]
+
+        sketch = cls.empty(shape, mode)
+        rows = max(1, config.CHUNK_SIZE // width)
+        for start in range(0, len(real), rows):
+            stop = start + rows
+            errors = np.abs(np.subtract(columns[start:stop],
+                                        real[start:stop, None],
+                                        dtype=np.float64))
+            if groups is None:
+                batch = np.repeat(np.arange(width, dtype=np.int64),
+                                  len(errors))
+                values = np.sort(errors, axis=0).T.ravel()
+            else:
+                batch = (groups[start:stop, None].astype(np.int64) * width
+                         + np.arange(width)).ravel()
+                order = sort_order(errors.ravel(), batch)
+                batch, values = batch[order], errors.ravel()[order]
+            sketch = sketch.merge(cls(shape, batch, values,
+                                      np.ones(len(values), dtype=np.int64),
+                                      np.zeros(shape), mode))
+        return sketch
+
+    @classmethod
+    def empty(cls, shape: tuple, mode: str = None) -> 'ErrorSketch':
+        return cls(shape, np.zeros(0, dtype=np.int64), np.zeros(0),
+                   np.zeros(0, dtype=np.int64), np.zeros(shape), mode)
+
+    def merge(self, other: 'ErrorSketch') -> 'ErrorSketch':
+        mode = self.mode or other.mode
+        exact = mode == 'exact' or (
+            mode is None
+            and not (self.rank_error.any() or other.rank_error.any())
+            and len(self.values) + len(other.values)
+            <= config.QUANTILE_EXACT_MAX_VALUES)
+        states = (self, other) if exact \
+            else (self.compact(), other.compact())
+        batch, values, weights = (
+            np.concatenate([getattr(state, field) for state in states])
+            for field in ('batch', 'values', 'weights'))
+        order = sort_order(values, weights, batch)
+        sketch = ErrorSketch(self.shape, batch[order], values[order],
+                             weights[order],
+                             states[0].rank_error + states[1].rank_error,
+                             mode)
+        return sketch if exact else sketch.compact()
+
+    def compact(self) -> 'ErrorSketch':
+        """ Zagęszcza poziomy z więcej niż config.QUANTILE_SKETCH_SIZE
+            elementami, aż żaden poziom nie przekracza tego rozmiaru.
+            Przesunięcia losowane są generatorem inicjowanym rozmiarem
+            stanu, więc wynik jest powtarzalny dla tych samych danych.
+        """
+        capacity = config.QUANTILE_SKETCH_SIZE
+        batch, values, weights = self.batch, self.values, self.weights
+        rank_error = self.rank_error.ravel().copy()
+        rng = np.random.default_rng([len(values), int(weights.sum())])
+        while True:
+            starts = np.flatnonzero(np.concatenate([
+                [True], (batch[1:] != batch[:-1])
+                | (weights[1:] != weights[:-1])]))
+            sizes = np.diff(np.append(starts, len(values)))
+            full = sizes > capacity
+            if not full.any():
+                break
+
+            strides = np.where(full, 2 ** np.ceil(np.log2(np.maximum(
+                sizes / capacity, 1))).astype(np.int64), 1)
+            rank_error += np.bincount(
+                batch[starts], weights=(strides - 1) * weights[starts],
+                minlength=len(rank_error))
+            offsets = rng.integers(0, strides)
+            position = np.arange(len(values)) - np.repeat(starts, sizes)
+            stride = np.repeat(strides, sizes)
+            compacted = position < np.repeat(sizes - sizes % strides, sizes)
+            keep = ~compacted \
+                | (position % stride == np.repeat(offsets, sizes))
+            weights = np.where(compacted, weights * stride, weights)
+            batch, values, weights = batch[keep], values[keep], weights[keep]
+            order = sort_order(values, weights, batch)
+            batch, values, weights = \
+                batch[order], values[order], weights[order]
+
+        return ErrorSketch(self.shape, batch, values, weights,
+                           rank_error.reshape(self.shape), self.mode)
+
+    def count(self) -> np.ndarray:
+        return np.bincount(self.batch, weights=self.weights,
+                           minlength=self.rank_error.size).reshape(self.shape)
+
+    def quantile(self, quantile) -> np.ndarray:
+        """ Kwantyl dla każdej partii (nan dla partii bez obserwacji).
+            Argument quantile może być liczbą albo tablicą o wymiarach
+            (..., *shape) z osobnym poziomem dla każdej partii (np. dla
+            prób bootstrapowych).
+        """
+        levels = np.asarray(quantile, dtype=np.float64)
+        leading = levels.shape[:max(levels.ndim - len(self.shape), 0)]
+        levels = np.broadcast_to(levels, leading + self.shape).reshape(
+            leading + (-1,))
+
+        order = sort_order(self.values, self.batch)
+        count = self.count().ravel().astype(np.int64)
+        last = np.maximum(count - 1, 0)
+        position = last * levels
+        lower = np.floor(position)
+        offsets = np.cumsum(count) - count
+        cumulative = np.cumsum(self.weights[order])
+        values = np.append(self.values[order], np.nan)
+
+        def value_at(rank):
+            return values[np.searchsorted(cumulative, offsets + rank,
+                                          side='right')]
+
+        low = value_at(lower)
+        high = value_at(np.minimum(lower + 1, last))
+        result = np.where(count == 0, np.nan,
+                          low + (position - lower) * (high - low))
+        return result.reshape(leading + self.shape)
+
+    def to_dict(self) -> dict:
+        return {'shape': list(self.shape), 'batch': self.batch.tolist(),
+                'values': self.values.tolist(),
+                'weights': self.weights.tolist(),
+                'rank_error': self.rank_error.tolist(), 'mode': self.mode}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'ErrorSketch':
+        return cls(tuple(state['shape']),
+                   np.asarray(state['batch'], dtype=np.int64),
+                   np.asarray(state['values'], dtype=np.float64),
+                   np.asarray(state['weights'], dtype=np.int64),
+                   np.asarray(state['rank_error'], dtype=np.float64),
+                   state.get('mode'))
+
+
+def sort_order(values: np.ndarray, *keys: np.ndarray) -> np.ndarray:
+    """ Kolejność jak w np.lexsort((values, *keys)) (ostatni klucz
+        najważniejszy). Klucze całkowite sortowane są stabilnie w najwęższym
+        typie, więc dla typów do 16 bitów numpy używa sortowania
+        pozycyjnego, a klucze stałe są pomijane. Jest to kilka razy
+        szybsze niż np.lexsort.
+    """
+    order = np.argsort(values)
+    for key in keys:
+        key = key[order]
+        if len(key) and key.min() != key.max():
+            key = key - key.min()
+            key = key.astype(np.min_scalar_type(key.max()))
+            order = order[np.argsort(key, kind='stable')]
+    return order
+
+
+def get_work_dtype(real: np.ndarray, predicted: np.ndarray):
+    """ Typ tablic tymczasowych: float32, jeśli oba wejścia są float32,
+        w przeciwnym razie float64.
+    """
+    if real.dtype == np.float32 and predicted.dtype == np.float32:
+        return np.float32
+    return np.float64
+
+
+def sum_of_products(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """ Suma iloczynów po pierwszej osi akumulowana w float64, bez
+        kopiowania tablic float32 do float64.
+    """
+    return np.einsum('i...,i...->...', left, right, dtype=np.float64)
+
+
+def compute_state(real, predicted, groups=None, n_groups: int = 1,
+                  errors: bool = False,
+                  quantiles: str = None) -> ResidualStats:
+    return ResidualStats.from_arrays(real, predicted, groups, n_groups,
+                                     errors, quantiles)
+
+
+def mape(stats: ResidualStats) -> np.ndarray:
+    return np.divide(stats.sum_absolute_percentage_error, stats.count)
+
+
+def mse(stats: ResidualStats) -> np.ndarray:
+    return np.divide(stats.sum_squared_error, stats.count)
+
+
+def rmse(stats: ResidualStats) -> np.ndarray:
+    return np.sqrt(mse(stats))
+
+
+def mae(stats: ResidualStats) -> np.ndarray:
+    return np.divide(stats.sum_absolute_error, stats.count)
+
+
+def r2(stats: ResidualStats) -> np.ndarray:
+    """ Współczynnik determinacji z tą samą obsługą stałych wartości
+        rzeczywistych co r2_score w sklearn (force_finite=True).
+    """
+    numerator = np.asarray(stats.sum_squared_error)
+    denominator = np.asarray(stats.m2_real)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = 1 - numerator / denominator
+    return np.where(denominator != 0, score,
+                    np.where(numerator != 0, 0.0, 1.0))
+
+
+def absolute_error_quantile(stats: ResidualStats,
+                            quantile: float) -> np.ndarray:
+    if stats.errors is None:
+        raise ValueError('Metryki oparte na percentylach błędu wymagają '
+                         'rozkładu błędów (compute_state z errors=True)')
+    return stats.errors.quantile(quantile)
+
+
+def median_absolute_error(stats: ResidualStats) -> np.ndarray:
+    return absolute_error_quantile(stats, 0.5)
+
+
+def quantile_rank_error(stats: ResidualStats) -> np.ndarray:
+    """ Maksymalna różnica między rangą względną kwantyla błędu
+        zwróconego przez szkic a zadanym poziomem (0 dla stanu
+        dokładnego), patrz ErrorSketch.
+    """
+    if stats.errors is None:
+        raise ValueError('Stan nie zawiera rozkładu błędów')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(stats.count == 0, np.nan,
+                        stats.errors.rank_error / stats.errors.count())
+
+
+def pinball_loss(stats: ResidualStats, quantile: float) -> np.ndarray:
+    """ Średnia strata pinball (kwantylowa) tak jak mean_pinball_loss
+        w sklearn (alpha=quantile). Dla błędu e = predykcja - wartość
+        rzeczywista strata wynosi (1 - q) * e dla e > 0 i -q * e dla e < 0,
+        więc jej suma to (sum|e| + (1 - 2q) * sum(e)) / 2 i jest liczona
+        dokładnie ze statystyk reszt, bez rozkładu błędów.
+    """
+    return np.divide(stats.sum_absolute_error
+                     + (1 - 2 * quantile) * stats.sum_error,
+                     2 * np.asarray(stats.count))
+
+
+METRICS = {
+    'mape': mape,
+    'mse': mse,
+    'rmse': rmse,
+    'r2': r2,
+    'mae': mae,
+    'median_ae': median_absolute_error,
+    **{f'p{percent}_ae': partial(absolute_error_quantile,
+                                 quantile=percent / 100)
+       for percent in ERROR_PERCENTILES},
+    **{f'pinball_{percent}': partial(pinball_loss, quantile=percent / 100)
+       for percent in PINBALL_PERCENTILES}
+}
+
+""" Metryki, dla których compute_state musi policzyć rozkład błędów """
+QUANTILE_METRICS = ('median_ae',) + tuple(f'p{percent}_ae'
+                                          for percent in ERROR_PERCENTILES)
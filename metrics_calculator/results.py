@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+
+from metrics_calculator.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+class ResultsBuilder():
+    """ Zbiera wartości metryk w prealokowanym buforze numpy (powiększanym
+        dwukrotnie w razie potrzeby) i tworzy obiekt DataFrame jednorazowo
+        w metodzie build(). Dzięki temu koszt budowania wyników jest liniowy
+        względem liczby zbiorów, a kolumny metryk mają od razu typ float64.
+        Nazwy i kolejność kolumn są takie same jak w calculate_metrics:
+        - 'multiple_rows': wiersz na zbiór, kolumny to nazwy metryk,
+        - 'single_row': jeden wiersz z kolumną 'comment' i kolumnami
+          '{metryka}_{zbiór}'.
+        Zbiory z etykietami wierszy (modele lub grupy) dają jeden wiersz na
+        etykietę.
+    """
+
+    def __init__(self,
+                 metrics: Tuple[str, ...],
+                 results_structure: str,
+                 comment: str,
+                 capacity: int = 4) -> None:
+        self.metrics = list(metrics)
+        self.results_structure = results_structure
+        self.comment = comment
+        self.buffer = np.empty((capacity, len(self.metrics)))
+        self.size = 0
+        self.datasets = []
+        self.row_labels = []
+        self.segments = []
+
+    def add(self, dataset: str, values: dict, row_labels: list = None) -> None:
+        n_rows = 1 if row_labels is None else len(row_labels)
+        self.reserve(n_rows)
+        for column, metric in enumerate(self.metrics):
+            self.buffer[self.size:self.size + n_rows, column] = values[metric]
+        self.segments.append((dataset, self.size, self.size + n_rows))
+        self.size += n_rows
+        self.datasets.extend([dataset] * n_rows)
+        self.row_labels.extend([None] * n_rows if row_labels is None
+                               else row_labels)
+
+    def reserve(self, n_rows: int) -> None:
+        if self.size + n_rows <= len(self.buffer):
+            return
+        capacity = max(2 * len(self.buffer), self.size + n_rows)
+        buffer = np.empty((capacity, len(self.metrics)))
+        buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = buffer
+
+    def build(self) -> pd.DataFrame:
+        if self.size == 0:
+            return pd.DataFrame()
+
+        values = self.buffer[:self.size]
+        labeled = any(label is not None for label in self.row_labels)
+
+        if self.results_structure == 'multiple_rows':
+            if labeled:
+                index = pd.MultiIndex.from_arrays([self.datasets,
+                                                   self.row_labels])
+            else:
+                index = pd.Index(self.datasets)
+            return pd.DataFrame(values, index=index, columns=self.metrics)
+
+        if not labeled:
+            columns = [f'{metric}_{dataset}' for dataset in self.datasets
+                       for metric in self.metrics]
+            results = pd.DataFrame(values.reshape(1, -1), columns=columns)
+        else:
+            results = pd.concat([
+                pd.DataFrame(values[start:stop],
+                             index=self.row_labels[start:stop],
+                             columns=[f'{metric}_{dataset}'
+                                      for metric in self.metrics])
+                for dataset, start, stop in self.segments
+            ], axis=1)
+        results.insert(0, 'comment', self.comment)
+        return results
+
+    def records(self) -> pd.DataFrame:
+        """ Wyniki w postaci długiej (wiersz na zbiór, etykietę i metrykę),
+            niezależnej od wybranej struktury wyników.
+        """
+        n_metrics = len(self.metrics)
+        labels = np.array([None if label is None else str(label)
+                           for label in self.row_labels], dtype=object)
+        return pd.DataFrame({
+            'dataset': np.repeat(np.array(self.datasets, dtype=object),
+                                 n_metrics),
+            'label': np.repeat(labels, n_metrics),
+            'metric': np.tile(np.array(self.metrics, dtype=object),
+                              self.size),
+            'value': self.buffer[:self.size].ravel()
+        })
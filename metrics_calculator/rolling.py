@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+from collections import Counter, deque
+from typing import Tuple
+
+import numpy as np
+
+import metrics_calculator.classification as classification
+import metrics_calculator.regression as regression
+from metrics_calculator.app import (convert_arrow, get_metrics_dict,
+                                    metrics_from_state)
+from metrics_calculator.lazy import lazy_import
+from metrics_calculator.validation import (validate_increasing_timestamps,
+                                           validate_metrics,
+                                           validate_problem_type,
+                                           validate_rolling_metrics,
+                                           validate_rolling_series,
+                                           validate_window_timestamps)
+
+pd = lazy_import('pandas')
+
+
+""" Względny próg, poniżej którego suma kwadratów odchyleń wartości
+    rzeczywistych w oknie traktowana jest jako zero (stałe wartości).
+    Próg odnosi się do sumy kwadratów przesuniętych wartości wierszy,
+    z których powstała suma dla okna, oraz do średniej z okna, bo od nich
+    zależy błąd zaokrągleń. """
+M2_TOLERANCE = 64 * regression.EPSILON
+
+
+def rolling_metrics(
+    real,
+    predicted,
+    problem_type: str,
+    metrics: Tuple[str, ...],
+    window,
+    timestamps=None
+) -> pd.DataFrame:
+    """ Metryki w oknach przesuwnych kończących się na każdym wierszu
+        danych uporządkowanych w czasie. Okno może obejmować:
+        - ostatnie window wierszy (window typu int),
+        - wiersze z ostatniego okresu, np. '15min' lub pd.Timedelta
+          (wymaga podania timestamps), czyli wiersze o czasie z przedziału
+          (t - window, t].
+
+        Dla klasyfikacji liczone są sumy prefiksowe trafień i liczności
+        klas, a stan każdego okna to różnica dwóch sum. Dla regresji sumy
+        statystyk reszt liczone są od nowa w każdym bloku o długości
+        najdłuższego okna, a stan okna to połączenie sufiksu jednego bloku
+        z prefiksem następnego (block_stats), więc błąd zaokrągleń zależy
+        tylko od wartości z okna, a nie od całej historii danych. Koszt
+        wynosi O(n) niezależnie od rozmiaru okna. Na początku danych okna
+        są krótsze niż window.
+
+        Zwraca obiekt DataFrame indeksowany czasem (lub numerem wiersza,
+        jeśli nie podano timestamps) z kolumnami o nazwach metryk, tak jak
+        w strukturze 'multiple_rows'.
+    """
+    validate_problem_type(problem_type)
+    validate_metrics(metrics, problem_type, get_metrics_dict())
+    validate_rolling_metrics(problem_type, metrics)
+    if not isinstance(window, (int, np.integer)):
+        validate_window_timestamps(window, timestamps)
+
+    real = np.asarray(convert_arrow(real))
+    predicted = np.asarray(convert_arrow(predicted))
+    validate_rolling_series(real, predicted)
+
+    if timestamps is None:
+        index = pd.RangeIndex(len(real), name='row')
+    else:
+        index = pd.Index(convert_arrow(timestamps), name='timestamp')
+    starts = get_window_starts(len(real), window, index)
+    ends = np.arange(1, len(real) + 1)
+
+    if problem_type == 'regression':
+        state = block_stats(real, predicted, starts, ends)
+    else:
+        labels = np.unique(np.concatenate([real, predicted]))
+        classification.check_discrete(labels)
+        state = class_counts_from_prefix(labels, real, predicted, starts,
+                                         ends)
+
+    values = metrics_from_state(state, problem_type, metrics)
+    return pd.DataFrame({metric: values[metric] for metric in metrics},
+                        index=index)
+
+
+class RollingWindow():
+    """ Metryki dla okna przesuwnego w strumieniu danych. Metoda add()
+        dopisuje nowe wiersze (pojedyncze wartości lub tablice), a metoda
+        evict() usuwa najstarsze wiersze. Jeśli podano window, to po każdym
+        dopisaniu usuwane są wiersze spoza okna (ostatnie window wierszy
+        albo wiersze z okresu (t - window, t], gdzie t to najnowszy czas).
+
+        Obiekt przechowuje wiersze z okna (potrzebne do ich późniejszego
+        usunięcia) oraz bieżące sumy statystyk dostatecznych, więc koszt
+        add() i evict() zależy tylko od liczby dodawanych lub usuwanych
+        wierszy, a values() nie przegląda danych z okna. Dla regresji sumy
+        są aktualizowane odejmowaniem, a po usunięciu co najmniej tylu
+        wierszy, ile jest w oknie, liczone są od nowa z przechowywanych
+        wierszy (z przesunięciem o pierwszą wartość z okna). Dzięki temu
+        błąd zaokrągleń nie kumuluje się z całej historii strumienia,
+        a zamortyzowany koszt pozostaje stały na wiersz.
+    """
+
+    def __init__(self,
+                 problem_type: str,
+                 metrics: Tuple[str, ...],
+                 window=None) -> None:
+        validate_problem_type(problem_type)
+        validate_metrics(metrics, problem_type, get_metrics_dict())
+        validate_rolling_metrics(problem_type, metrics)
+
+        self.problem_type = problem_type
+        self.metrics = metrics
+        self.window = window
+        self.by_time = window is not None \
+            and not isinstance(window, (int, np.integer))
+        if self.by_time:
+            self.window = pd.Timedelta(window).to_timedelta64()
+        self.batches = deque()
+        self.n_rows = 0
+        self.n_evicted = 0
+        self.shift = None
+        self.sums = np.zeros(7)
+        self.magnitude = 0.0
+        self.counts = [Counter(), Counter(), Counter()]
+
+    def add(self, real, predicted, timestamps=None) -> None:
+        real = np.atleast_1d(np.asarray(convert_arrow(real)))
+        predicted = np.atleast_1d(np.asarray(convert_arrow(predicted)))
+        validate_rolling_series(real, predicted)
+        if self.by_time:
+            validate_window_timestamps(self.window, timestamps)
+        if timestamps is not None:
+            timestamps = np.atleast_1d(
+                np.asarray(pd.to_datetime(timestamps), dtype='M8[ns]'))
+        if not len(real):
+            return
+
+        if self.problem_type == 'regression':
+            if self.shift is None:
+                self.shift = real[0]
+        else:
+            classification.check_discrete(np.concatenate([real, predicted]))
+        batch = np.stack([real, predicted], axis=1)
+        self.batches.append((batch, timestamps))
+        self.n_rows += len(batch)
+        self.update_sums(batch, 1)
+        self.apply_window()
+
+    def evict(self, n_rows: int) -> None:
+        """ Usuwa n_rows najstarszych wierszy. """
+        n_rows = min(n_rows, self.n_rows)
+        while n_rows > 0:
+            batch, timestamps = self.batches[0]
+            if len(batch) <= n_rows:
+                self.batches.popleft()
+                removed = batch
+            else:
+                removed = batch[:n_rows]
+                self.batches[0] = (batch[n_rows:], None if timestamps is None
+                                   else timestamps[n_rows:])
+            self.update_sums(removed, -1)
+            self.n_rows -= len(removed)
+            self.n_evicted += len(removed)
+            n_rows -= len(removed)
+        if self.problem_type == 'regression' \
+                and self.n_evicted >= max(self.n_rows, 1):
+            self.recompute_sums()
+
+    def recompute_sums(self) -> None:
+        """ Liczy sumy regresji od nowa z wierszy z okna. """
+        self.n_evicted = 0
+        self.sums = np.zeros(7)
+        self.magnitude = 0.0
+        self.shift = self.batches[0][0][0, 0] if self.batches else None
+        for batch, _ in self.batches:
+            self.update_sums(batch, 1)
+
+    def apply_window(self) -> None:
+        if self.window is None:
+            return
+        if not self.by_time:
+            self.evict(self.n_rows - self.window)
+            return
+
+        cutoff = self.batches[-1][1][-1] - self.window
+        n_rows = 0
+        for _, timestamps in self.batches:
+            outside = int(np.searchsorted(timestamps, cutoff, side='right'))
+            n_rows += outside
+            if outside < len(timestamps):
+                break
+        self.evict(n_rows)
+
+    def update_sums(self, batch: np.ndarray, sign: int) -> None:
+        real, predicted = batch[:, 0], batch[:, 1]
+        if self.problem_type == 'regression':
+            totals = regression_rows(real, predicted, self.shift).sum(axis=0)
+            self.sums += sign * totals
+            self.magnitude += totals[2]
+            return
+
+        for counter, values in zip(self.counts,
+                                   (real[real == predicted], real,
+                                    predicted)):
+            labels, counts = np.unique(values, return_counts=True)
+            counter.update(dict(zip(labels.tolist(),
+                                    (sign * counts).tolist())))
+            for label in [label for label in counter if counter[label] <= 0]:
+                del counter[label]
+
+    def values(self) -> dict:
+        """ Słownik z wartościami metryk dla wierszy z okna. """
+        if self.n_rows == 0:
+            return {metric: np.nan for metric in self.metrics}
+
+        if self.problem_type == 'regression':
+            state = clip_m2(stats_from_sums(self.sums, self.shift),
+                            self.magnitude)
+        else:
+            labels = np.array(sorted(set(self.counts[1])
+                                     | set(self.counts[2])))
+            true_positives, support, predicted_counts = (
+                np.array([counter[label] for label in labels.tolist()],
+                         dtype=np.int64)
+                for counter in self.counts)
+            state = classification.ClassCounts(labels, true_positives,
+                                               support, predicted_counts)
+        return metrics_from_state(state, self.problem_type, self.metrics)
+
+
+def get_window_starts(n_rows: int, window, index: pd.Index) -> np.ndarray:
+    """ Numer pierwszego wiersza okna kończącego się na każdym wierszu. """
+    if isinstance(window, (int, np.integer)):
+        return np.maximum(np.arange(n_rows) - window + 1, 0)
+
+    if not isinstance(index, pd.DatetimeIndex):
+        index = pd.DatetimeIndex(index)
+    validate_increasing_timestamps(index)
+    return index.searchsorted(index - pd.Timedelta(window), side='right')
+
+
+def block_stats(real: np.ndarray,
+                predicted: np.ndarray,
+                starts: np.ndarray,
+                ends: np.ndarray) -> regression.ResidualStats:
+    """ Statystyki reszt w oknach [starts, ends). Wiersze dzielone są na
+        bloki o długości najdłuższego okna i w każdym bloku liczone są
+        osobno sumy prefiksowe i sufiksowe (z przesunięciem o pierwszą
+        wartość rzeczywistą bloku). Okno obejmuje więc co najwyżej dwa
+        bloki: jego stan to sufiks bloku, w którym się zaczyna, połączony
+        (wzorem Chana) z prefiksem bloku, w którym się kończy. Tylko okno
+        czasowe leżące w środku jednego bloku liczone jest jako różnica
+        dwóch prefiksów tego bloku.
+    """
+    n_rows = len(real)
+    size = max(1, int((ends - starts).max())) if n_rows else 1
+    n_blocks = -(-n_rows // size)
+    shift = real[np.arange(n_blocks) * size]
+    rows = np.zeros((n_blocks * size, 7))
+    rows[:n_rows] = regression_rows(real, predicted,
+                                    np.repeat(shift, size)[:n_rows])
+    rows = rows.reshape(n_blocks, size, 7)
+    prefix = np.cumsum(rows, axis=1)
+    suffix = np.cumsum(rows[:, ::-1], axis=1)[:, ::-1]
+
+    block, position = np.divmod(ends - 1, size)
+    start_block, start_position = np.divmod(starts, size)
+    split = (start_block < block)[:, None]
+    inside = ~split & (start_position > 0)[:, None]
+    head = prefix[block, position]
+    tail = np.where(split, suffix[start_block, start_position], 0.0)
+    before = np.where(inside,
+                      prefix[block, np.maximum(start_position - 1, 0)], 0.0)
+
+    stats = stats_from_sums(tail, shift[start_block]).merge(
+        stats_from_sums(head - before, shift[block]))
+    return clip_m2(stats, tail[:, 2] + head[:, 2])
+
+
+def regression_rows(real: np.ndarray, predicted: np.ndarray,
+                    shift) -> np.ndarray:
+    """ Wkłady wierszy w sumy statystyk dostatecznych regresji: liczność,
+        przesunięta wartość rzeczywista i jej kwadrat, kwadrat błędu, błąd
+        bezwzględny, procentowy i ze znakiem. Przesunięcie o wartość
+        rzeczywistą z początku bloku lub okna (liczbę albo tablicę
+        z wartością dla każdego wiersza) ogranicza utratę precyzji przy
+        liczeniu sumy kwadratów odchyleń.
+    """
+    shifted = np.subtract(real, shift, dtype=np.float64)
+    error = np.subtract(predicted, real, dtype=np.float64)
+    residual = np.abs(error)
+    scale = np.maximum(np.abs(real), regression.EPSILON)
+    return np.stack([np.ones(len(real)), shifted, shifted ** 2,
+                     residual ** 2, residual, residual / scale, error],
+                    axis=1)
+
+
+def stats_from_sums(sums: np.ndarray, shift) -> regression.ResidualStats:
+    """ Statystyki reszt z sum wkładów wierszy. Sumy nieujemnych wkładów
+        obcinane są do zera, bo różnica sum może dać wynik ujemny na
+        poziomie błędów zaokrągleń.
+    """
+    count, sum_shifted, sum_squared = sums[..., 0], sums[..., 1], sums[..., 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_shifted = np.where(count == 0, 0.0, sum_shifted / count)
+    return regression.ResidualStats(
+        np.rint(count).astype(np.int64), mean_shifted + shift,
+        np.maximum(sum_squared - mean_shifted * sum_shifted, 0.0),
+        np.maximum(sums[..., 3], 0.0), np.maximum(sums[..., 4], 0.0),
+        np.maximum(sums[..., 5], 0.0), sums[..., 6])
+
+
+def clip_m2(stats: regression.ResidualStats,
+            magnitude) -> regression.ResidualStats:
+    """ Zeruje sumę kwadratów odchyleń wartości rzeczywistych, jeśli jest
+        na poziomie błędów zaokrągleń (stałe wartości w oknie). magnitude
+        to suma kwadratów przesuniętych wartości rzeczywistych wszystkich
+        wierszy, z których powstały sumy dla okna.
+    """
+    tolerance = M2_TOLERANCE * magnitude \
+        + stats.count * (M2_TOLERANCE * stats.mean_real) ** 2
+    stats.m2_real = np.where(stats.m2_real <= tolerance, 0.0, stats.m2_real)
+    return stats
+
+
+def class_counts_from_prefix(labels: np.ndarray,
+                             real: np.ndarray,
+                             predicted: np.ndarray,
+                             starts: np.ndarray,
+                             ends: np.ndarray) -> classification.ClassCounts:
+    """ Trafienia i liczności klas w każdym oknie jako różnice sum
+        prefiksowych wektorów wskaźnikowych (n + 1, k).
+    """
+    real_codes = np.searchsorted(labels, real)
+    predicted_codes = np.searchsorted(labels, predicted)
+    rows = np.arange(1, len(real) + 1)
+    counts = []
+    for codes, mask in ((real_codes, real_codes == predicted_codes),
+                        (real_codes, None), (predicted_codes, None)):
+        prefix = np.zeros((len(real) + 1, len(labels)), dtype=np.int64)
+        selected = slice(None) if mask is None else mask
+        prefix[rows[selected], codes[selected]] = 1
+        np.cumsum(prefix, axis=0, out=prefix)
+        counts.append(prefix[ends] - prefix[starts])
+    return classification.ClassCounts(labels, *counts)
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics_calculator.config as config
+from metrics_calculator.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+class JobRunner():
+    """ Wykonuje zadania obliczania metryk w puli stale działających
+        procesów (workers), więc import pandas i przygotowanie modułów
+        odbywają się tylko raz na proces, a nie dla każdego zadania.
+        Zadanie to słownik z kluczami:
+        - 'id': dowolny identyfikator zwracany razem z wynikiem,
+        - 'data': słownik zbiorów ze ścieżkami plików .npy lub .parquet,
+          tak jak w calculate_metrics_from_files,
+        - 'metadata': słownik metadata jak w calculate_metrics (listy
+          z JSON zamieniane są na krotki).
+
+        Kolejne małe zadania (o łącznym rozmiarze plików poniżej
+        batch_bytes, co najwyżej batch_size zadań) wysyłane są do procesu
+        razem, co ogranicza koszt komunikacji między procesami. Liczba
+        wysłanych, a niezakończonych paczek jest ograniczona przez
+        max_pending (wspólnie dla wszystkich wywołań run), więc czytanie
+        kolejnych zadań wstrzymywane jest, dopóki pula nie nadąża.
+
+        Dla workers=0 zadania wykonywane są w bieżącym procesie.
+    """
+
+    def __init__(self,
+                 workers: int = config.SERVICE_WORKERS,
+                 batch_size: int = config.SERVICE_BATCH_SIZE,
+                 batch_bytes: int = config.SERVICE_BATCH_BYTES,
+                 max_pending: int = config.SERVICE_MAX_PENDING) -> None:
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.executor = None
+        if workers:
+            self.executor = ProcessPoolExecutor(workers, initializer=warm_up)
+
+    def __enter__(self) -> 'JobRunner':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def run(self, jobs):
+        """ Generator zwracający wyniki zadań w kolejności ich
+            zakończenia.
+        """
+        if self.executor is None:
+            for batch in get_batches(jobs, self.batch_size, self.batch_bytes):
+                yield from run_batch(batch)
+            return
+
+        pending = set()
+        for batch in get_batches(jobs, self.batch_size, self.batch_bytes):
+            while not self.slots.acquire(timeout=0.05 if pending else None):
+                done, pending = wait(pending, timeout=0,
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            future = self.executor.submit(run_batch, batch)
+            future.add_done_callback(lambda _: self.slots.release())
+            pending.add(future)
+
+            done, pending = wait(pending, timeout=0,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def warm_up() -> None:
+    """ Importuje zależności i wykonuje małe obliczenie w nowym procesie
+        puli, żeby pierwsze zadanie nie ponosiło kosztu inicjalizacji.
+    """
+    from metrics_calculator.app import calculate_metrics
+
+    values = pd.Series([0.0, 1.0, 1.0])
+    for problem_type, metrics in (('regression', ('rmse',)),
+                                  ('classification', ('acc',))):
+        calculate_metrics(
+            data={'test': {'y_real': values, 'y_pred': values}},
+            metadata={'problem_type': problem_type, 'metrics': metrics,
+                      'results_file_name': 'warm_up',
+                      'results_structure': 'multiple_rows', 'comment': '',
+                      'save': False})
+
+
+def get_batches(jobs, batch_size: int, batch_bytes: int):
+    batch, size = [], 0
+    for job in jobs:
+        job_size = get_job_size(job)
+        if batch and (len(batch) >= batch_size
+                      or size + job_size > batch_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append(job)
+        size += job_size
+    if batch:
+        yield batch
+
+
+def get_job_size(job) -> int:
+    """ Łączny rozmiar plików zadania (zadania z błędami mają rozmiar 0,
+        a błąd zgłaszany jest dopiero przy ich wykonaniu).
+    """
+    size = 0
+    try:
+        for paths in job['data'].values():
+            for source in paths.values():
+                path = source[0] if isinstance(source, list) else source
+                size += os.path.getsize(path)
+    except (TypeError, KeyError, AttributeError, OSError):
+        pass
+    return size
+
+
+def run_batch(batch: list) -> list:
+    return [run_job(job) for job in batch]
+
+
+def run_job(job) -> dict:
+    """ Wynik zadania: obiekt DataFrame w postaci 'split' (index, columns,
+        data) albo opis błędu. Błąd jednego zadania nie przerywa
+        pozostałych.
+    """
+    from metrics_calculator.out_of_core import calculate_metrics_from_files
+
+    job_id = job.get('id') if isinstance(job, dict) else None
+    if not isinstance(job, dict) or 'invalid' in job:
+        reason = job['invalid'] if isinstance(job, dict) else repr(job)
+        return {'id': job_id, 'status': 'error',
+                'error': f'Niepoprawna linia zadania: {reason}'}
+    try:
+        metadata = {key: tuple(value) if key == 'metrics' else value
+                    for key, value in job['metadata'].items()}
+        results = calculate_metrics_from_files(job['data'], metadata)
+        return {'id': job_id, 'status': 'ok',
+                'results': json.loads(results.to_json(orient='split',
+                                                     double_precision=15))}
+    except Exception as error:
+        return {'id': job_id, 'status': 'error',
+                'error': f'{type(error).__name__}: {error}'}
+
+
+def read_jobs(lines):
+    """ Zadania z kolejnych linii JSON (puste linie są pomijane). Linia,
+        której nie można odczytać, zamieniana jest na zadanie z błędem.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            yield {'id': None, 'invalid': str(error)}
+
+
+def write_results(results, stream) -> None:
+    for result in results:
+        stream.write(json.dumps(result) + '\n')
+        stream.flush()
+
+
+def make_server(runner: JobRunner, host: str, port: int) \
+        -> ThreadingHTTPServer:
+    """ Serwer HTTP: POST /jobs przyjmuje zadania w postaci linii JSON
+        i odsyła wyniki jako linie JSON w miarę ich kończenia, a GET
+        /health zwraca stan serwera.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:
+            if self.path != '/health':
+                self.send_error(404)
+                return
+            self.send_json_lines([{'status': 'ok'}])
+
+        def do_POST(self) -> None:
+            if self.path != '/jobs':
+                self.send_error(404)
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            lines = self.rfile.read(length).decode().splitlines()
+            self.send_json_lines(runner.run(read_jobs(lines)))
+
+        def send_json_lines(self, results) -> None:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            for result in results:
+                self.wfile.write((json.dumps(result) + '\n').encode())
+                self.wfile.flush()
+
+        def log_message(self, *args) -> None:
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(arguments: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m metrics_calculator',
+        description='Wykonywanie zadań obliczania metryk w puli procesów')
+    parser.add_argument('--workers', type=int, default=config.SERVICE_WORKERS)
+    parser.add_argument('--batch-size', type=int,
+                        default=config.SERVICE_BATCH_SIZE)
+    parser.add_argument('--batch-bytes', type=int,
+                        default=config.SERVICE_BATCH_BYTES)
+    parser.add_argument('--max-pending', type=int,
+                        default=config.SERVICE_MAX_PENDING)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser(
+        'run', help='zadania z pliku JSON lines lub standardowego wejścia')
+    run_parser.add_argument('--input', default='-')
+    run_parser.add_argument('--output', default='-')
+    serve_parser = commands.add_parser('serve', help='lokalny serwer HTTP')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    arguments = parser.parse_args(arguments)
+
+    with JobRunner(arguments.workers, arguments.batch_size,
+                   arguments.batch_bytes, arguments.max_pending) as runner:
+        if arguments.command == 'serve':
+            server = make_server(runner, arguments.host, arguments.port)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return 0
+
+        input_stream = sys.stdin if arguments.input == '-' \
+            else open(arguments.input)
+        output_stream = sys.stdout if arguments.output == '-' \
+            else open(arguments.output, 'w')
+        try:
+            write_results(runner.run(read_jobs(input_stream)), output_stream)
+        finally:
+            for stream in (input_stream, output_stream):
+                if stream not in (sys.stdin, sys.stdout):
+                    stream.close()
+    return 0
@@ -0,0 +1,45 @@
+from functools import reduce
+
+from metrics_calculator.app import get_metrics_dict
+from metrics_calculator.classification import ConfusionMatrix, \
+    SparseConfusionMatrix
+from metrics_calculator.probability import ScoreCounts, ScoreHistogram
+from metrics_calculator.regression import ResidualStats
+
+
+def get_states_dict() -> dict:
+    """ Typ stanu częściowego dla każdej metryki z get_metrics_dict. Stany
+        częściowe można liczyć niezależnie dla rozłącznych części danych
+        (np. w osobnych procesach lub dla osobnych plików) i łączyć metodą
+        merge, otrzymując dokładne wartości metryk dla całości danych.
+    """
+    state_types = {
+        'regression': ResidualStats,
+        'classification': ConfusionMatrix,
+        'probability': ScoreCounts
+    }
+    states_dict = {
+        problem_type: {metric: state_types[problem_type]
+                       for metric in metrics}
+        for problem_type, metrics in get_metrics_dict().items()
+    }
+    return states_dict
+
+
+def merge_states(states: list):
+    return reduce(lambda left, right: left.merge(right), states)
+
+
+def dump_state(state) -> dict:
+    """ Zamienia stan na słownik, który można zapisać jako JSON. """
+    return {'type': type(state).__name__, 'state': state.to_dict()}
+
+
+def load_state(dumped: dict):
+    state_types = {
+        state_type.__name__: state_type
+        for state_type in (ResidualStats, ConfusionMatrix,
+                           SparseConfusionMatrix, ScoreCounts,
+                           ScoreHistogram)
+    }
+    return state_types[dumped['type']].from_dict(dumped['state'])
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from metrics_calculator.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+class ResultsStore():
+    """ Magazyn wyników kolejnych uruchomień kalkulatora. Wartości metryk
+        zapisywane są w postaci długiej (wiersz na zbiór, etykietę
+        i metrykę) do plików Parquet, które są tylko dopisywane i dzielone
+        na partycje dzienne:
+            {path}/parts/{RRRR-MM-DD}/{run_id}.parquet
+        Obok plików utrzymywany jest mały indeks SQLite ({path}/index.sqlite)
+        z identyfikatorem uruchomienia, nazwą pliku wyników, typem problemu,
+        czasem zapisu i ścieżką pliku, w którym znajdują się wartości.
+        Zapytania najpierw wybierają uruchomienia z indeksu, a następnie
+        czytają jedynie pasujące pliki, więc nie wymagają przeglądania
+        całego magazynu.
+
+        Czasy zapisywane są w UTC (również dni partycji), a kolumna
+        created_at zwracana przez runs() i query() ma strefę czasową UTC.
+        Czasy bez strefy czasowej (created_at, since, until) traktowane są
+        jako czas lokalny, tak jak w datetime.now().
+
+        Metoda compact() łączy pliki jednej partycji dziennej (dnia UTC)
+        w jeden plik, co ogranicza liczbę plików przy setkach tysięcy
+        uruchomień.
+
+        Zapis i odczyt plików Parquet wymaga pakietu pyarrow.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.join(path, 'parts'), exist_ok=True)
+        with self.connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs ('
+                'run_id TEXT PRIMARY KEY, file_name TEXT, '
+                'problem_type TEXT, comment TEXT, created_at REAL, '
+                'partition TEXT)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS runs_file_name '
+                'ON runs (file_name, created_at)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS runs_created_at '
+                'ON runs (created_at)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS runs_partition '
+                'ON runs (partition)')
+
+    @contextmanager
+    def connect(self):
+        """ Połączenie z indeksem, zatwierdzane i zamykane po wyjściu
+            z bloku with.
+        """
+        connection = sqlite3.connect(os.path.join(self.path, 'index.sqlite'),
+                                     timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def append(self,
+               records: pd.DataFrame,
+               file_name: str,
+               problem_type: str,
+               comment: str = '',
+               created_at: datetime = None) -> str:
+        """ Dopisuje wyniki jednego uruchomienia (ramka w postaci długiej
+            z kolumnami 'dataset', 'label', 'metric' i 'value') i zwraca
+            jego identyfikator. Plik z wartościami zapisywany jest przed
+            wpisem do indeksu, więc przerwany zapis nie zostawia w indeksie
+            uruchomień bez danych.
+        """
+        created_at = to_utc(created_at or datetime.now(timezone.utc))
+        run_id = uuid.uuid4().hex
+        day = created_at.strftime('%Y-%m-%d')
+        partition = os.path.join('parts', day, f'{run_id}.parquet')
+
+        os.makedirs(os.path.join(self.path, 'parts', day), exist_ok=True)
+        records = records.assign(run_id=run_id)
+        records.to_parquet(os.path.join(self.path, partition), index=False)
+
+        with self.connect() as connection:
+            connection.execute(
+                'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)',
+                (run_id, file_name, problem_type, comment,
+                 created_at.timestamp(), partition))
+        return run_id
+
+    def runs(self,
+             file_name: str = None,
+             problem_type: str = None,
+             since: datetime = None,
+             until: datetime = None) -> pd.DataFrame:
+        """ Zwraca wpisy indeksu pasujące do zadanych warunków (bez
+            odczytu plików z wartościami).
+        """
+        conditions, parameters = [], []
+        for column, operator, value in (
+            ('file_name', '=', file_name),
+            ('problem_type', '=', problem_type),
+            ('created_at', '>=', since),
+            ('created_at', '<', until)
+        ):
+            if value is None:
+                continue
+            if column == 'created_at':
+                value = to_utc(value).timestamp()
+            conditions.append(f'{column} {operator} ?')
+            parameters.append(value)
+
+        query = 'SELECT * FROM runs'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self.connect() as connection:
+            runs = pd.read_sql_query(query + ' ORDER BY created_at',
+                                     connection, params=parameters)
+        runs['created_at'] = pd.to_datetime(runs['created_at'], unit='s',
+                                            utc=True)
+        return runs
+
+    def query(self,
+              file_name: str = None,
+              problem_type: str = None,
+              since: datetime = None,
+              until: datetime = None,
+              dataset: str = None,
+              metric: str = None) -> pd.DataFrame:
+        """ Zwraca wartości metryk w postaci długiej dla uruchomień
+            wybranych z indeksu, np. wszystkie wartości f1 na zbiorze
+            testowym dla pliku wyników X z ostatniego miesiąca:
+                store.query(file_name='X', dataset='test', metric='f1',
+                            since=datetime.now() - timedelta(days=30))
+        """
+        runs = self.runs(file_name, problem_type, since, until)
+        columns = ['run_id', 'dataset', 'label', 'metric', 'value']
+        if runs.empty:
+            return pd.DataFrame(columns=columns)
+
+        filters = [('run_id', 'in', list(runs['run_id']))]
+        if dataset is not None:
+            filters.append(('dataset', '=', dataset))
+        if metric is not None:
+            filters.append(('metric', '=', metric))
+
+        values = pd.concat([
+            pd.read_parquet(os.path.join(self.path, partition),
+                            columns=columns, filters=filters)
+            for partition in runs['partition'].unique()
+        ], ignore_index=True)
+        return runs.drop(columns='partition').merge(values, on='run_id')
+
+    def compact(self, day: str) -> None:
+        """ Łączy wszystkie pliki partycji dziennej (RRRR-MM-DD) w jeden
+            plik i aktualizuje indeks. Stare pliki usuwane są dopiero po
+            zatwierdzeniu zmian w indeksie.
+        """
+        prefix = os.path.join('parts', day, '')
+        with self.connect() as connection:
+            partitions = [row[0] for row in connection.execute(
+                'SELECT DISTINCT partition FROM runs WHERE partition LIKE ?',
+                (prefix + '%',))]
+        if len(partitions) < 2:
+            return
+
+        compacted = os.path.join('parts', day,
+                                 f'compacted-{uuid.uuid4().hex}.parquet')
+        pd.concat([
+            pd.read_parquet(os.path.join(self.path, partition))
+            for partition in partitions
+        ], ignore_index=True).to_parquet(
+            os.path.join(self.path, compacted), index=False)
+
+        with self.connect() as connection:
+            connection.executemany(
+                'UPDATE runs SET partition = ? WHERE partition = ?',
+                [(compacted, partition) for partition in partitions])
+        for partition in partitions:
+            os.remove(os.path.join(self.path, partition))
+
+
+def to_utc(value) -> datetime:
+    """ Czas (datetime, pd.Timestamp lub tekst) w strefie UTC. Czas bez
+        strefy czasowej traktowany jest jako czas lokalny.
+    """
+    return pd.Timestamp(value).to_pydatetime().astimezone(timezone.utc)
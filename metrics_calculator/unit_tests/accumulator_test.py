@@ -0,0 +1,64 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.accumulator import MetricsAccumulator
+from metrics_calculator.app import calculate_metrics
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+@pytest.mark.parametrize("problem_type", ['classification', 'regression'])
+@pytest.mark.parametrize("results_structure", ['single_row', 'multiple_rows'])
+def test_accumulator_matches_calculate_metrics(problem_type,
+                                               results_structure, make_data,
+                                               make_metadata):
+    data = make_data(problem_type)
+    metadata = make_metadata(problem_type, results_structure)
+
+    accumulator = MetricsAccumulator(metadata)
+    for start in range(0, 1000, 300):
+        accumulator.update({
+            dataset: {'y_real': values['y_real'][start:start + 300],
+                      'y_pred': values['y_pred'][start:start + 300]}
+            for dataset, values in data.items()
+        })
+
+    expected = calculate_metrics(data=data, metadata=metadata)
+    pd.testing.assert_frame_equal(accumulator.result(), expected)
+
+
+def test_accumulator_validates_batches(make_metadata):
+    metadata = make_metadata('regression')
+    accumulator = MetricsAccumulator(metadata)
+
+    with pytest.raises(exceptions.NanValuesDetected):
+        accumulator.update({
+            'train': {'y_real': pd.Series([1.0, 2.0]),
+                      'y_pred': pd.Series([1.0, np.nan])}
+        })
+
+
+@pytest.mark.parametrize("problem_type", ['classification', 'regression'])
+def test_accumulator_merges_serialized_shards(problem_type, make_data,
+                                              make_metadata):
+    import json
+
+    data = make_data(problem_type)
+    metadata = make_metadata(problem_type)
+
+    shards = []
+    for start in range(0, 1000, 250):
+        accumulator = MetricsAccumulator(metadata)
+        accumulator.update({
+            dataset: {'y_real': values['y_real'][start:start + 250],
+                      'y_pred': values['y_pred'][start:start + 250]}
+            for dataset, values in data.items()
+        })
+        shards.append(json.loads(json.dumps(accumulator.to_dict())))
+
+    merged = MetricsAccumulator.from_dict(metadata, shards[0])
+    for shard in shards[1:]:
+        merged.merge(MetricsAccumulator.from_dict(metadata, shard))
+
+    expected = calculate_metrics(data=data, metadata=metadata)
+    pd.testing.assert_frame_equal(merged.result(), expected)
@@ -0,0 +1,36 @@
+import json
+
+from metrics_calculator.app import get_metrics_dict
+from metrics_calculator.benchmarks.suite import compare_with_baseline, main
+
+
+def test_benchmark_suite_report(tmp_path):
+    output = tmp_path / 'results.json'
+    assert main(['--max-rows', '100', '--repeats', '1',
+                 '--output', str(output)]) == 0
+
+    with open(output) as file:
+        results = json.load(file)['results']
+
+    assert len(results) == len(get_metrics_dict()) * 2 * 2 * 2
+    assert {result['name'].split('/')[0] for result in results} == \
+        set(get_metrics_dict())
+    assert {'latency_p50', 'latency_p99', 'rows_per_second',
+            'peak_memory_bytes'} <= set(results[0])
+
+
+def test_compare_with_baseline():
+    baseline = [{'name': 'a', 'latency_p50': 1.0},
+                {'name': 'b', 'latency_p50': 1.0}]
+    results = [{'name': 'a', 'latency_p50': 1.1},
+               {'name': 'b', 'latency_p50': 1.5},
+               {'name': 'c', 'latency_p50': 9.0}]
+
+    assert compare_with_baseline(results, baseline, 0.2) == [
+        {'name': 'b', 'ratio': 1.5}]
+
+
+def test_missing_baseline_fails(tmp_path):
+    assert main(['--max-rows', '100', '--repeats', '1',
+                 '--output', str(tmp_path / 'results.json'),
+                 '--baseline', str(tmp_path / 'baseline.json')]) == 2
@@ -0,0 +1,93 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.bootstrap import resample_residual_stats
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+@pytest.mark.parametrize("problem_type", ['classification', 'regression'])
+def test_bootstrap_intervals_contain_estimate(problem_type, make_metadata):
+    rng = np.random.default_rng(0)
+    if problem_type == 'classification':
+        real = rng.integers(0, 2, 2000).astype(float)
+        predicted = np.where(rng.random(2000) < 0.8, real, 1 - real)
+    else:
+        real = rng.normal(10, 2, 2000)
+        predicted = real + rng.normal(0, 1, 2000)
+    data = {'test': {'y_real': pd.Series(real),
+                     'y_pred': pd.Series(predicted)}}
+    bootstrap = {'n_resamples': 200, 'seed': 0, 'chunk_size': 10000}
+    metadata = make_metadata(problem_type, bootstrap=bootstrap)
+
+    results = calculate_metrics(data=data, metadata=metadata)
+    repeated = calculate_metrics(data=data, metadata=metadata)
+
+    pd.testing.assert_frame_equal(results, repeated)
+    for metric in metadata['metrics']:
+        lower, value, upper = results.loc[
+            'test', [f'{metric}_lower', metric, f'{metric}_upper']]
+        assert lower < value < upper, \
+            f'Przedział ufności nie zawiera wartości metryki {metric}'
+
+
+def test_bootstrap_columns_in_single_row(make_metadata):
+    data = {'train': {'y_real': pd.Series([0, 1, 0, 1], dtype=float),
+                      'y_pred': pd.Series([0, 1, 1, 1], dtype=float)}}
+    metadata = make_metadata('classification', 'single_row',
+                             metrics=('acc',),
+                             bootstrap={'n_resamples': 10, 'seed': 0})
+
+    results = calculate_metrics(data=data, metadata=metadata)
+
+    assert list(results.columns) == ['comment', 'acc_train',
+                                     'acc_lower_train', 'acc_upper_train']
+
+
+@pytest.mark.parametrize("bootstrap", [{'n_resamples': 0},
+                                       {'confidence_level': 1.5},
+                                       {'wrong_option': 1}])
+def test_WrongBootstrapOptions(bootstrap, make_metadata):
+    data = {'train': {'y_real': pd.Series([0, 1, 0, 1], dtype=float),
+                      'y_pred': pd.Series([0, 1, 1, 1], dtype=float)}}
+    metadata = make_metadata('classification', 'single_row',
+                             bootstrap=bootstrap)
+
+    with pytest.raises(exceptions.WrongBootstrapOptions):
+        calculate_metrics(data=data, metadata=metadata)
+
+
+class CountingGenerator():
+    """ Generator liczb losowych zliczający wywołania i losowane wartości
+        dla każdej metody. """
+
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+        self.calls = {}
+        self.draws = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.rng, name)
+
+        def counted(*args, **kwargs):
+            values = method(*args, **kwargs)
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.draws[name] = self.draws.get(name, 0) + np.size(values)
+            return values
+        return counted
+
+
+def test_regression_bootstrap_draws_one_index_per_row():
+    n_rows, n_resamples = 10000, 50
+    rng = np.random.default_rng(0)
+    real = rng.normal(size=n_rows)
+    predicted = real + rng.normal(size=n_rows)
+    counting = CountingGenerator(0)
+
+    stats = resample_residual_stats(real, predicted, n_resamples, 1000,
+                                    counting)
+
+    np.testing.assert_array_equal(stats.count.ravel(), n_rows)
+    assert counting.calls['multinomial'] == 1
+    assert counting.draws['integers'] == n_rows * n_resamples
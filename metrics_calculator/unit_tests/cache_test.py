@@ -0,0 +1,89 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.cache import MetricsCache
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+def test_cache_returns_computed_results(make_data, make_metadata):
+    cache = MetricsCache()
+    data = make_data('regression', datasets=('test',))
+    metadata = make_metadata('regression', 'single_row')
+
+    expected = calculate_metrics(data=data, metadata=metadata)
+    first = calculate_metrics(data=data,
+                              metadata={**metadata, 'cache': cache})
+    second = calculate_metrics(data=make_data('regression',
+                                              datasets=('test',)),
+                               metadata={**metadata, 'cache': cache})
+
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(second, expected)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_cache_key_depends_on_content(make_data):
+    cache = MetricsCache()
+    data = make_data('regression', datasets=('test',))
+    key = cache.key(data['test']['y_real'], data['test']['y_pred'],
+                    'regression')
+
+    changed = data['test']['y_pred'].copy()
+    changed.iloc[500] += 1e-9
+    reindexed = data['test']['y_pred'].set_axis(np.arange(1, 1001))
+
+    assert key == cache.key(data['test']['y_real'].copy(),
+                            data['test']['y_pred'].copy(), 'regression')
+    assert key != cache.key(data['test']['y_real'], changed, 'regression')
+    assert key != cache.key(data['test']['y_real'], reindexed, 'regression')
+    assert key != cache.key(data['test']['y_real'], data['test']['y_pred'],
+                            'classification')
+
+
+def test_cache_evicts_least_recently_used():
+    cache = MetricsCache(max_bytes=3 * 8)
+    for key in ['a', 'b', 'c']:
+        cache.put(key, {'mse': 1.0})
+    assert cache.get('a', ('mse',)) is not None
+
+    cache.put('d', {'mse': 1.0})
+
+    assert cache.get('b', ('mse',)) is None
+    assert cache.get('a', ('mse',)) is not None
+    assert cache.stats()['bytes'] == 3 * 8
+
+
+def test_cache_disk_tier(tmp_path, make_data, make_metadata):
+    data = make_data('regression', datasets=('test',))
+    metadata = make_metadata('regression', 'single_row')
+    expected = calculate_metrics(
+        data=data,
+        metadata={**metadata, 'cache': MetricsCache(path=str(tmp_path))})
+
+    cache = MetricsCache(path=str(tmp_path))
+    results = calculate_metrics(data=data,
+                                metadata={**metadata, 'cache': cache})
+
+    pd.testing.assert_frame_equal(results, expected)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['disk_hits'] == len(metadata['metrics'])
+
+
+def test_cache_key_depends_on_options(make_data, make_metadata):
+    cache = MetricsCache()
+    data = make_data('regression', datasets=('test',))
+    data['test']['y_pred'].iloc[0] = np.nan
+    metadata = make_metadata('regression', 'single_row', cache=cache)
+
+    calculate_metrics(data=data, metadata={**metadata, 'validate': False})
+
+    with pytest.raises(exceptions.NanValuesDetected):
+        calculate_metrics(data=data, metadata=metadata)
+    keys = {cache.key(data['test']['y_real'], data['test']['y_pred'],
+                      'regression', options)
+            for options in ({}, {'compact': True}, {'validate': False},
+                            {'compact': False, 'validate': True})}
+    assert len(keys) == 4
@@ -0,0 +1,108 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+CLASSIFICATION_METRICS = ('acc', 'b_acc', 'recall', 'f1_macro',
+                          'precision_weighted')
+REGRESSION_METRICS = ('rmse', 'r2', 'mape', 'mse', 'mae')
+
+
+def get_results(real, predicted, problem_type, metrics, compact=True):
+    metadata = {
+        'problem_type': problem_type,
+        'metrics': metrics,
+        'results_file_name': f'metrics_{problem_type}',
+        'results_structure': 'multiple_rows',
+        'comment': 'Komentarz testowy',
+        'save': False,
+        'compact': compact
+    }
+    return calculate_metrics(
+        data={'test': {'y_real': real, 'y_pred': predicted}},
+        metadata=metadata)
+
+
+def get_labels(n_rows=5000, n_classes=5):
+    rng = np.random.default_rng(0)
+    real = rng.integers(0, n_classes, n_rows)
+    predicted = np.where(rng.random(n_rows) < 0.6, real,
+                         rng.integers(0, n_classes, n_rows))
+    return real, predicted
+
+
+@pytest.mark.parametrize("dtype", [np.int8, np.uint16, np.int64, 'category'])
+def test_compact_labels_match_float_labels(dtype):
+    real, predicted = get_labels()
+    expected = get_results(pd.Series(real, dtype=float),
+                           pd.Series(predicted, dtype=float),
+                           'classification', CLASSIFICATION_METRICS,
+                           compact=False)
+
+    results = get_results(pd.Series(real).astype(dtype),
+                          pd.Series(predicted).astype(dtype),
+                          'classification', CLASSIFICATION_METRICS)
+
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_compact_categorical_labels_with_different_categories():
+    real = pd.Series(['b', 'a', 'c', 'a', 'b'], dtype='category')
+    predicted = pd.Series(['b', 'a', 'a', 'd', 'b'], dtype='category')
+    codes = {'a': 0.0, 'b': 1.0, 'c': 2.0, 'd': 3.0}
+    expected = get_results(real.astype(str).map(codes),
+                           predicted.astype(str).map(codes),
+                           'classification', CLASSIFICATION_METRICS,
+                           compact=False)
+
+    results = get_results(real, predicted, 'classification',
+                          CLASSIFICATION_METRICS)
+
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_compact_bool_labels():
+    real, predicted = get_labels(n_classes=2)
+    metrics = ('acc', 'f1', 'precision', 'recall')
+    expected = get_results(pd.Series(real, dtype=float),
+                           pd.Series(predicted, dtype=float),
+                           'classification', metrics, compact=False)
+
+    results = get_results(pd.Series(real, dtype=bool),
+                          pd.Series(predicted, dtype=bool),
+                          'classification', metrics)
+
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_compact_float32_regression():
+    rng = np.random.default_rng(0)
+    real = rng.normal(1000, 50, 100000)
+    predicted = real + rng.normal(0, 5, len(real))
+    expected = get_results(pd.Series(real), pd.Series(predicted),
+                           'regression', REGRESSION_METRICS)
+
+    results = get_results(pd.Series(real, dtype=np.float32),
+                          pd.Series(predicted, dtype=np.float32),
+                          'regression', REGRESSION_METRICS)
+
+    pd.testing.assert_frame_equal(results, expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize("dtype", [np.int8, 'category'])
+def test_compact_labels_require_compact_mode(dtype):
+    real, predicted = get_labels(n_rows=10)
+    with pytest.raises(exceptions.WrongValuesType):
+        get_results(pd.Series(real).astype(dtype),
+                    pd.Series(predicted).astype(dtype),
+                    'classification', CLASSIFICATION_METRICS, compact=False)
+
+
+def test_compact_mode_keeps_float_requirement_for_regression():
+    real, predicted = get_labels(n_rows=10)
+    with pytest.raises(exceptions.WrongValuesType):
+        get_results(pd.Series(real), pd.Series(predicted), 'regression',
+                    REGRESSION_METRICS)
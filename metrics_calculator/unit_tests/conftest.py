@@ -0,0 +1,49 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+
+METRICS = {
+    'classification': ('acc', 'b_acc', 'recall', 'f1', 'precision'),
+    'regression': ('rmse', 'r2', 'mape', 'mse', 'mae')
+}
+
+
+@pytest.fixture
+def make_data():
+    """ Tworzy dane testowe w formacie argumentu data funkcji
+        calculate_metrics. """
+    def make(problem_type='classification', n_rows=1000,
+             datasets=('train', 'test'), seed=0):
+        rng = np.random.default_rng(seed)
+        data = {}
+        for dataset in datasets:
+            if problem_type == 'classification':
+                real = rng.integers(0, 2, n_rows).astype(float)
+                predicted = rng.integers(0, 2, n_rows).astype(float)
+            else:
+                real = rng.normal(10, 2, n_rows)
+                predicted = real + rng.normal(0, 1, n_rows)
+            data[dataset] = {'y_real': pd.Series(real),
+                             'y_pred': pd.Series(predicted)}
+        return data
+    return make
+
+
+@pytest.fixture
+def make_metadata():
+    """ Tworzy metadane testowe; dodatkowe argumenty nazwane są dopisywane
+        do metadanych jako opcje. """
+    def make(problem_type='classification', results_structure='multiple_rows',
+             metrics=None, **options):
+        metadata = {
+            'problem_type': problem_type,
+            'metrics': METRICS[problem_type] if metrics is None else metrics,
+            'results_file_name': f'metrics_{problem_type}',
+            'results_structure': results_structure,
+            'comment': 'Komentarz testowy',
+            'save': False
+        }
+        metadata.update(options)
+        return metadata
+    return make
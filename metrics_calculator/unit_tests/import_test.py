@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+
+def test_import_has_no_side_effects(tmp_path):
+    code = '''import sys
+import metrics_calculator.app
+import metrics_calculator.accumulator
+import metrics_calculator.parallel
+print(type(sys.modules['pandas']).__name__)
+'''
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    output = subprocess.run([sys.executable, '-c', code], cwd=tmp_path,
+                            env={**os.environ, 'PYTHONPATH': root},
+                            capture_output=True, text=True, check=True)
+
+    assert output.stdout.strip() == '_LazyModule'
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,39 @@
+import pandas as pd
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.instrumentation import Profiler
+
+
+def test_profiler_records_stages(make_data, make_metadata):
+    data = make_data(n_rows=10000)
+    metadata = make_metadata(metrics=('acc', 'f1'))
+    records = []
+    with Profiler(callback=records.append) as profiler:
+        results = calculate_metrics(data=data, metadata=metadata)
+
+    profile = profiler.to_frame()
+    pd.testing.assert_frame_equal(
+        results, calculate_metrics(data=data, metadata=metadata))
+    assert len(records) == len(profile)
+    assert {'unpack_metadata', 'run_validation', 'get_results',
+            'compute_state', 'metric', 'build_results'} \
+        == set(profile['stage'])
+
+    metrics = profile[profile['stage'] == 'metric']
+    assert sorted(zip(metrics['dataset'], metrics['metric'])) == [
+        ('test', 'acc'), ('test', 'f1'), ('train', 'acc'), ('train', 'f1')]
+
+    compute_state = profile[profile['stage'] == 'compute_state']
+    get_results = profile[profile['stage'] == 'get_results']
+    assert (compute_state['peak_bytes'].values > 0).all()
+    assert (get_results['peak_bytes'].values
+            >= compute_state['peak_bytes'].values).all()
+    assert (profile['wall_time'] >= 0).all()
+
+
+def test_profiler_disabled_outside_context(make_data, make_metadata):
+    with Profiler(memory=False) as profiler:
+        pass
+    calculate_metrics(data=make_data(), metadata=make_metadata())
+
+    assert profiler.records == []
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+import metrics_calculator.logger_utils.exceptions as exceptions
+import metrics_calculator.logger_utils.logger as logger_module
+
+
+@pytest.mark.parametrize("mode", ['sync', 'async'])
+def test_json_lines_logger(tmp_path, mode):
+    log_path = str(tmp_path / 'logs' / 'test.log')
+    logger = logger_module.get_module_logger(
+        f'json_lines_{mode}', 'validation.py', log_path, 1, mode=mode,
+        log_format='json')
+
+    logger_module.log_warning(logger, 'Ostrzeżenie 50%', 'validate_type')
+    with pytest.raises(exceptions.MetricNotImplemented):
+        logger_module.log_error(logger, exceptions.MetricNotImplemented,
+                                'Błędna metryka', 'validate_metrics', 12)
+    logger_module.flush_logs()
+    for handler in logger.handlers:
+        handler.flush()
+
+    with open(log_path, encoding='utf-8') as file:
+        entries = [json.loads(line) for line in file]
+
+    assert [entry['level'] for entry in entries] == ['WARNING', 'ERROR']
+    assert entries[0]['message'] == 'Ostrzeżenie 50%'
+    assert entries[1]['func_name'] == 'validate_metrics()'
+    assert entries[1]['code_line'] == 12
+
+
+def test_logger_has_no_duplicate_handlers(tmp_path):
+    log_path = str(tmp_path / 'test.log')
+    for _ in range(3):
+        logger = logger_module.get_module_logger(
+            'no_duplicates', 'validation.py', log_path, 1, mode='async')
+
+    assert len(logger.handlers) == 1
+    assert not os.path.exists(log_path)
+
+
+def test_text_logger_rotation(tmp_path):
+    log_path = str(tmp_path / 'test.log')
+    logger = logger_module.get_module_logger(
+        'rotation', 'validation.py', log_path, 1, max_bytes=500,
+        backup_count=2)
+
+    for _ in range(20):
+        logger_module.log_warning(logger, 'Ostrzeżenie', 'validate_type')
+
+    assert sorted(os.listdir(tmp_path)) == ['test.log', 'test.log.1',
+                                            'test.log.2']
+    with open(log_path, encoding='utf-8') as file:
+        assert 'Function name: validate_type() ||' in file.readline()
@@ -295,3 +295,300 @@ def test_WrongResultsStructureName():
         }
 
         calculate_metrics(data=data, metadata=metadata)
+
+
+@pytest.mark.parametrize("n_classes, metrics",
+                         [(2, ('acc', 'b_acc', 'recall', 'f1', 'precision')),
+                          (5, ('acc', 'b_acc', 'recall'))])
+def test_classification_engine_matches_sklearn(n_classes, metrics):
+    from sklearn.metrics import (accuracy_score, balanced_accuracy_score,
+                                 f1_score, precision_score, recall_score)
+
+    sklearn_metrics = {
+        'acc': accuracy_score,
+        'b_acc': balanced_accuracy_score,
+        'f1': f1_score,
+        'precision': precision_score,
+        'recall': lambda real, pred: recall_score(real, pred, average='macro')
+    }
+
+    rng = np.random.default_rng(0)
+    real = pd.Series(rng.integers(0, n_classes, 1000), dtype=float)
+    predicted = pd.Series(rng.integers(0, n_classes, 1000), dtype=float)
+    data = {'test': {'y_real': real, 'y_pred': predicted}}
+
+    metadata = {
+        'problem_type': 'classification',
+        'metrics': metrics,
+        'results_file_name': 'metrics_classification',
+        'results_structure': 'multiple_rows',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+
+    results = calculate_metrics(data=data, metadata=metadata)
+
+    for metric in metrics:
+        assert results.at['test', metric] == pytest.approx(
+            sklearn_metrics[metric](real, predicted)), \
+            f'Niepoprawna wartość metryki {metric}'
+
+
+@pytest.mark.parametrize("chunk_size", [7, 2 ** 18])
+def test_regression_engine_matches_sklearn(monkeypatch, chunk_size):
+    from sklearn.metrics import (mean_absolute_error,
+                                 mean_absolute_percentage_error,
+                                 mean_squared_error, r2_score)
+    import metrics_calculator.config as config
+
+    monkeypatch.setattr(config, 'CHUNK_SIZE', chunk_size)
+
+    rng = np.random.default_rng(0)
+    real = pd.Series(rng.normal(100, 10, 1000))
+    predicted = pd.Series(real + rng.normal(0, 5, 1000))
+    data = {'val': {'y_real': real, 'y_pred': predicted}}
+
+    metadata = {
+        'problem_type': 'regression',
+        'metrics': ('mape', 'mse', 'rmse', 'r2', 'mae'),
+        'results_file_name': 'metrics_regression',
+        'results_structure': 'multiple_rows',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+
+    results = calculate_metrics(data=data, metadata=metadata)
+
+    expected = {
+        'mape': mean_absolute_percentage_error(real, predicted),
+        'mse': mean_squared_error(real, predicted),
+        'rmse': np.sqrt(mean_squared_error(real, predicted)),
+        'r2': r2_score(real, predicted),
+        'mae': mean_absolute_error(real, predicted)
+    }
+    for metric, value in expected.items():
+        assert results.at['val', metric] == pytest.approx(value, rel=1e-12), \
+            f'Niepoprawna wartość metryki {metric}'
+
+
+@pytest.mark.parametrize("predicted, error",
+                         [(pd.Series([0.0, 1.0, 1], dtype=object),
+                           exceptions.WrongValuesType),
+                          (pd.Series([0.0, 1.0, np.nan], dtype=object),
+                           exceptions.NanValuesDetected),
+                          (pd.Series([0.0, 1.0, np.inf]), None)])
+def test_validation_object_and_non_finite_values(predicted, error):
+    data = {
+        'train': {
+            'y_real': pd.Series([0.0, 1.0, 1.0]),
+            'y_pred': predicted
+        }
+    }
+
+    metadata = {
+        'problem_type': 'regression',
+        'metrics': ('mse',),
+        'results_file_name': 'metrics_regression',
+        'results_structure': 'single_row',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+
+    if error is None:
+        calculate_metrics(data=data, metadata=metadata)
+    else:
+        with pytest.raises(error):
+            calculate_metrics(data=data, metadata=metadata)
+
+
+@pytest.mark.parametrize("problem_type, metrics",
+                         [('classification', ('acc', 'b_acc', 'recall')),
+                          ('regression', ('rmse', 'r2', 'mape', 'mae'))])
+def test_many_models_match_single_model_results(problem_type, metrics):
+    rng = np.random.default_rng(0)
+    if problem_type == 'classification':
+        real = pd.Series(rng.integers(0, 3, 500), dtype=float)
+        predicted = pd.DataFrame(rng.integers(0, 3, (500, 4)), dtype=float,
+                                 columns=['a', 'b', 'c', 'd'])
+    else:
+        real = pd.Series(rng.normal(10, 2, 500))
+        predicted = pd.DataFrame(rng.normal(10, 2, (500, 4)),
+                                 columns=['a', 'b', 'c', 'd'])
+
+    metadata = {
+        'problem_type': problem_type,
+        'metrics': metrics,
+        'results_file_name': f'metrics_{problem_type}',
+        'results_structure': 'multiple_rows',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+
+    results = calculate_metrics(
+        data={'test': {'y_real': real, 'y_pred': predicted}},
+        metadata=metadata)
+
+    assert list(results.index) == [('test', model) for model in 'abcd']
+    for model in 'abcd':
+        expected = calculate_metrics(
+            data={'test': {'y_real': real, 'y_pred': predicted[model]}},
+            metadata=metadata)
+        for metric in metrics:
+            assert results.at[('test', model), metric] == pytest.approx(
+                expected.at['test', metric]), \
+                f'Niepoprawna wartość metryki {metric} dla modelu {model}'
+
+
+@pytest.mark.parametrize("problem_type, metrics",
+                         [('classification',
+                           ('acc', 'b_acc', 'recall', 'f1', 'precision')),
+                          ('regression', ('rmse', 'r2', 'mape', 'mse', 'mae'))])
+def test_grouped_metrics_match_per_group_results(problem_type, metrics):
+    rng = np.random.default_rng(0)
+    if problem_type == 'classification':
+        real = pd.Series(rng.integers(0, 2, 600), dtype=float)
+        predicted = pd.Series(rng.integers(0, 2, 600), dtype=float)
+    else:
+        real = pd.Series(rng.normal(10, 2, 600))
+        predicted = pd.Series(rng.normal(10, 2, 600))
+    groups = pd.Series(rng.choice(['north', 'south', 'east'], 600))
+
+    metadata = {
+        'problem_type': problem_type,
+        'metrics': metrics,
+        'results_file_name': f'metrics_{problem_type}',
+        'results_structure': 'single_row',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+
+    results = calculate_metrics(
+        data={'test': {'y_real': real, 'y_pred': predicted,
+                       'groups': groups}},
+        metadata=metadata)
+
+    assert list(results.index) == ['east', 'north', 'south']
+    for group in ['east', 'north', 'south']:
+        mask = groups == group
+        expected = calculate_metrics(
+            data={'test': {'y_real': real[mask], 'y_pred': predicted[mask]}},
+            metadata=metadata)
+        for metric in metrics:
+            assert results.at[group, f'{metric}_test'] == pytest.approx(
+                expected[f'{metric}_test'].values[0]), \
+                f'Niepoprawna wartość metryki {metric} dla grupy {group}'
+
+
+def test_WrongGroups():
+    with pytest.raises(exceptions.WrongGroups):
+        data = {
+            'train': {
+                'y_real': pd.Series([0, 0, 0, 0, 1, 1, 1, 1], dtype=float),
+                'y_pred': pd.Series([0, 0, 0, 0, 1, 1, 1, 1], dtype=float),
+                'groups': pd.Series(['a', 'b', 'a', 'b', 'a', 'b', 'a'])
+            }
+        }
+
+        metadata = {
+            'problem_type': 'regression',
+            'metrics': ('rmse', 'r2', 'mape', 'mse'),
+            'results_file_name': 'metrics_regression',
+            'results_structure': 'single_row',
+            'comment': 'Komentarz testowy',
+            'save': False
+        }
+
+        calculate_metrics(data=data, metadata=metadata)
+
+
+@pytest.mark.parametrize("results_structure", ['single_row', 'multiple_rows'])
+def test_many_datasets(results_structure):
+    from sklearn.metrics import mean_squared_error
+
+    rng = np.random.default_rng(0)
+    dataset_names = tuple(f'day_{day}' for day in range(200))
+    data = {
+        dataset: {'y_real': pd.Series(rng.normal(10, 2, 50)),
+                  'y_pred': pd.Series(rng.normal(10, 2, 50))}
+        for dataset in dataset_names
+    }
+    metrics = ('rmse', 'r2', 'mape', 'mse')
+    metadata = {
+        'problem_type': 'regression',
+        'metrics': metrics,
+        'results_file_name': 'metrics_regression',
+        'results_structure': results_structure,
+        'comment': 'Komentarz testowy',
+        'dataset_names': dataset_names,
+        'save': False
+    }
+
+    results = calculate_metrics(data=data, metadata=metadata)
+
+    for dataset in ['day_0', 'day_123', 'day_199']:
+        expected = np.sqrt(mean_squared_error(data[dataset]['y_real'],
+                                              data[dataset]['y_pred']))
+        if results_structure == 'single_row':
+            value = results[f'rmse_{dataset}'].values[0]
+        else:
+            value = results.at[dataset, 'rmse']
+        assert value == pytest.approx(expected)
+    if results_structure == 'single_row':
+        assert results.shape == (1, 1 + len(metrics) * len(dataset_names))
+    else:
+        assert list(results.index) == list(dataset_names)
+
+
+@pytest.mark.parametrize("problem_type", ['classification', 'regression'])
+def test_array_inputs(problem_type):
+    rng = np.random.default_rng(0)
+    real = rng.integers(0, 2, 1000).astype(float)
+    predicted = rng.integers(0, 2, 1000).astype(float)
+    metadata = {
+        'problem_type': problem_type,
+        'metrics': {'classification': ('acc', 'f1'),
+                    'regression': ('rmse', 'r2')}[problem_type],
+        'results_file_name': f'metrics_{problem_type}',
+        'results_structure': 'single_row',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+
+    expected = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real),
+                       'y_pred': pd.Series(predicted)}},
+        metadata=metadata)
+    inputs = [(real, predicted)]
+    try:
+        import pyarrow as pa
+        inputs.append((pa.array(real), pa.chunked_array([predicted])))
+    except ImportError:
+        pass
+
+    for real_input, predicted_input in inputs:
+        results = calculate_metrics(
+            data={'test': {'y_real': real_input, 'y_pred': predicted_input}},
+            metadata=metadata)
+        pd.testing.assert_frame_equal(results, expected)
+
+
+def test_arrow_nulls_are_detected():
+    pa = pytest.importorskip('pyarrow')
+    with pytest.raises(exceptions.NanValuesDetected):
+        data = {
+            'train': {
+                'y_real': pa.array([0.0, 1.0, None, 1.0]),
+                'y_pred': np.array([0.0, 1.0, 0.0, 1.0])
+            }
+        }
+
+        metadata = {
+            'problem_type': 'regression',
+            'metrics': ('rmse', 'r2', 'mape', 'mse'),
+            'results_file_name': 'metrics_regression',
+            'results_structure': 'single_row',
+            'comment': 'Komentarz testowy',
+            'save': False
+        }
+
+        calculate_metrics(data=data, metadata=metadata)
@@ -0,0 +1,157 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+import metrics_calculator.classification as classification
+import metrics_calculator.config as config
+from metrics_calculator.app import calculate_metrics, class_report
+from metrics_calculator.bootstrap import bootstrap_intervals
+from metrics_calculator.states import dump_state, load_state
+
+
+AVERAGED_METRICS = tuple(f'{name}_{average}'
+                         for name in ('f1', 'precision', 'recall')
+                         for average in ('micro', 'macro', 'weighted'))
+
+
+def get_data(n_classes, n_rows=2000, offset=0, seed=0):
+    rng = np.random.default_rng(seed)
+    real = rng.integers(0, n_classes, n_rows) + offset
+    predicted = np.where(rng.random(n_rows) < 0.6, real,
+                         rng.integers(0, n_classes, n_rows) + offset)
+    return real.astype(float), predicted.astype(float)
+
+
+def test_averaged_metrics_match_sklearn():
+    from sklearn.metrics import f1_score, precision_score, recall_score
+
+    sklearn_metrics = {
+        'f1': f1_score,
+        'precision': precision_score,
+        'recall': recall_score
+    }
+
+    real, predicted = get_data(n_classes=7)
+    data = {'test': {'y_real': pd.Series(real),
+                     'y_pred': pd.Series(predicted)}}
+    metadata = {
+        'problem_type': 'classification',
+        'metrics': AVERAGED_METRICS,
+        'results_file_name': 'metrics_classification',
+        'results_structure': 'multiple_rows',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+
+    results = calculate_metrics(data=data, metadata=metadata)
+
+    for metric in AVERAGED_METRICS:
+        name, average = metric.split('_')
+        assert results.at['test', metric] == pytest.approx(
+            sklearn_metrics[name](real, predicted, average=average)), \
+            f'Niepoprawna wartość metryki {metric}'
+
+
+@pytest.mark.parametrize("columns, groups", [(1, False), (3, False),
+                                             (1, True)])
+def test_sparse_matrix_matches_dense(monkeypatch, columns, groups):
+    real, _ = get_data(n_classes=40, offset=10 ** 6)
+    predicted = np.stack([get_data(n_classes=40, offset=10 ** 6,
+                                   seed=seed)[1]
+                          for seed in range(columns)], axis=1)
+    if columns == 1:
+        predicted = predicted[:, 0]
+    group_codes = np.arange(len(real)) % 4 if groups else None
+    n_groups = 4 if groups else 1
+
+    dense = classification.compute_state(real, predicted, group_codes,
+                                         n_groups)
+    monkeypatch.setattr(config, 'DENSE_MAX_CELLS', 64)
+    monkeypatch.setattr(config, 'CHUNK_SIZE', 301)
+    sparse = classification.compute_state(real, predicted, group_codes,
+                                          n_groups)
+
+    assert isinstance(dense, classification.ConfusionMatrix)
+    assert isinstance(sparse, classification.SparseConfusionMatrix)
+    for metric in ('acc', 'b_acc', 'recall') + AVERAGED_METRICS:
+        np.testing.assert_allclose(classification.METRICS[metric](sparse),
+                                   classification.METRICS[metric](dense))
+
+
+def test_sparse_merge_and_serialization(monkeypatch):
+    monkeypatch.setattr(config, 'DENSE_MAX_CELLS', 64)
+    real, predicted = get_data(n_classes=30, offset=-100)
+    whole = classification.compute_state(real, predicted)
+
+    left = classification.compute_state(real[:700], predicted[:700])
+    right = classification.compute_state(real[700:], predicted[700:])
+    merged = load_state(dump_state(left)).merge(right)
+
+    np.testing.assert_array_equal(merged.labels, whole.labels)
+    np.testing.assert_array_equal(merged.cells, whole.cells)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+
+    monkeypatch.setattr(config, 'DENSE_MAX_CELLS', 10 ** 4)
+    small = classification.compute_state(real[:50], predicted[:50])
+    assert isinstance(small, classification.ConfusionMatrix)
+    assert classification.f1(small.merge(right), 'macro') == \
+        pytest.approx(classification.f1(right.merge(small), 'macro'))
+
+
+def test_sparse_bootstrap(monkeypatch):
+    monkeypatch.setattr(config, 'DENSE_MAX_CELLS', 64)
+    real, predicted = get_data(n_classes=20, offset=-100)
+    state = classification.compute_state(real, predicted)
+
+    intervals = bootstrap_intervals(real, predicted, state, classification,
+                                    ('acc', 'f1_macro'),
+                                    {'n_resamples': 200, 'seed': 0})
+
+    for metric in ('acc', 'f1_macro'):
+        value = classification.METRICS[metric](state)
+        assert intervals[f'{metric}_lower'] <= value \
+            <= intervals[f'{metric}_upper']
+
+
+def test_state_size_depends_on_distinct_labels(monkeypatch):
+    real, predicted = get_data(n_classes=2)
+    groups = np.arange(len(real)) % 100
+    columns = np.repeat(predicted[:, None], 200, axis=1)
+
+    expected = classification.compute_state(real, predicted, groups, 100)
+    state = classification.compute_state(real * 1000, predicted * 1000,
+                                         groups, 100)
+    models = classification.compute_state(real * 1000, columns * 1000)
+
+    assert isinstance(state, classification.ConfusionMatrix)
+    np.testing.assert_array_equal(state.labels, [0, 1000])
+    np.testing.assert_array_equal(state.matrix, expected.matrix)
+    assert models.matrix.shape == (200, 2, 2)
+
+    monkeypatch.setattr(config, 'DENSE_MAX_CELLS', 200 * 4 - 1)
+    sparse = classification.compute_state(real * 1000, columns * 1000)
+    assert isinstance(sparse, classification.SparseConfusionMatrix)
+    np.testing.assert_allclose(classification.accuracy(sparse),
+                               classification.accuracy(models))
+
+
+def test_class_report():
+    from sklearn.metrics import precision_recall_fscore_support
+
+    real, predicted = get_data(n_classes=5)
+    report = class_report(pd.Series(real), pd.Series(predicted))
+    precision, recall, f1, support = precision_recall_fscore_support(
+        real, predicted)
+
+    assert list(report.index) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    np.testing.assert_allclose(report['precision'], precision)
+    np.testing.assert_allclose(report['recall'], recall)
+    np.testing.assert_allclose(report['f1'], f1)
+    np.testing.assert_array_equal(report['support'], support)
+
+
+def test_unknown_average():
+    real, predicted = get_data(n_classes=3)
+    cm = classification.compute_state(real, predicted)
+    with pytest.raises(ValueError):
+        classification.f1(cm, 'samples')
@@ -0,0 +1,135 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+import metrics_calculator.config as config
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.out_of_core import calculate_metrics_from_files
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+def get_arrays(problem_type, n_rows=10000, n_models=None):
+    rng = np.random.default_rng(0)
+    shape = n_rows if n_models is None else (n_rows, n_models)
+    if problem_type == 'classification':
+        real = rng.integers(0, 2, n_rows).astype(float)
+        predicted = rng.integers(0, 2, shape).astype(float)
+    else:
+        real = rng.normal(10, 2, n_rows)
+        predicted = rng.normal(10, 2, shape)
+    return real, predicted
+
+
+@pytest.mark.parametrize("problem_type", ['classification', 'regression'])
+@pytest.mark.parametrize("n_models", [None, 3])
+def test_npy_files_match_calculate_metrics(tmp_path, problem_type,
+                                           n_models, make_metadata):
+    real, predicted = get_arrays(problem_type, n_models=n_models)
+    np.save(tmp_path / 'real.npy', real)
+    np.save(tmp_path / 'pred.npy', predicted)
+    metadata = make_metadata(problem_type)
+
+    results = calculate_metrics_from_files(
+        data={'test': {'y_real': str(tmp_path / 'real.npy'),
+                       'y_pred': str(tmp_path / 'pred.npy')}},
+        metadata=metadata, memory_budget=2 ** 14)
+    expected = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real),
+                       'y_pred': predicted if n_models
+                       else pd.Series(predicted)}},
+        metadata=metadata)
+
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_parquet_files_match_calculate_metrics(tmp_path, make_metadata):
+    pytest.importorskip('pyarrow')
+    real, predicted = get_arrays('regression')
+    pd.DataFrame({'real': real}).to_parquet(tmp_path / 'real.parquet',
+                                            row_group_size=3000)
+    pd.DataFrame({'a': predicted, 'b': predicted + 1}).to_parquet(
+        tmp_path / 'pred.parquet', row_group_size=700)
+    metadata = make_metadata('regression')
+
+    results = calculate_metrics_from_files(
+        data={'test': {'y_real': str(tmp_path / 'real.parquet'),
+                       'y_pred': (str(tmp_path / 'pred.parquet'), 'b')}},
+        metadata=metadata, memory_budget=2 ** 14)
+    expected = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real),
+                       'y_pred': pd.Series(predicted + 1)}},
+        metadata=metadata)
+
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_files_are_validated_per_chunk(tmp_path, make_metadata):
+    real, predicted = get_arrays('regression')
+    predicted[-1] = np.nan
+    np.save(tmp_path / 'real.npy', real)
+    np.save(tmp_path / 'pred.npy', predicted)
+    np.save(tmp_path / 'short.npy', predicted[:5000])
+
+    with pytest.raises(exceptions.NanValuesDetected):
+        calculate_metrics_from_files(
+            data={'test': {'y_real': str(tmp_path / 'real.npy'),
+                           'y_pred': str(tmp_path / 'pred.npy')}},
+            metadata=make_metadata('regression'), memory_budget=2 ** 14)
+    with pytest.raises(exceptions.IncompatibleLengths):
+        calculate_metrics_from_files(
+            data={'test': {'y_real': str(tmp_path / 'real.npy'),
+                           'y_pred': str(tmp_path / 'short.npy')}},
+            metadata=make_metadata('regression'), memory_budget=2 ** 14)
+
+
+@pytest.mark.parametrize("extension", ['npy', 'parquet'])
+def test_files_with_different_lengths(tmp_path, extension, make_metadata):
+    if extension == 'parquet':
+        pytest.importorskip('pyarrow')
+    real, predicted = get_arrays('regression')
+    rows = 2 ** 14 // (8 * 2 * config.OUT_OF_CORE_COPIES)
+    for name, values in (('real', real), ('short', predicted[:2 * rows])):
+        if extension == 'npy':
+            np.save(tmp_path / f'{name}.npy', values)
+        else:
+            pd.DataFrame({name: values}).to_parquet(
+                tmp_path / f'{name}.parquet')
+
+    with pytest.raises(exceptions.IncompatibleLengths):
+        calculate_metrics_from_files(
+            data={'test': {'y_real': str(tmp_path / f'real.{extension}'),
+                           'y_pred': str(tmp_path / f'short.{extension}')}},
+            metadata=make_metadata('regression'), memory_budget=2 ** 14)
+
+
+@pytest.mark.parametrize("options, values, exception", [
+    ({'bootstrap': {'n_resamples': 10}}, {}, exceptions.WrongMetadataValue),
+    ({'cache': {}}, {}, exceptions.WrongMetadataValue),
+    ({}, {'groups': 'groups.npy'}, exceptions.WrongGroups)
+])
+def test_unsupported_options_are_rejected(tmp_path, options, values,
+                                          exception, make_metadata):
+    real, predicted = get_arrays('regression')
+    np.save(tmp_path / 'real.npy', real)
+    np.save(tmp_path / 'pred.npy', predicted)
+
+    with pytest.raises(exception):
+        calculate_metrics_from_files(
+            data={'test': {'y_real': str(tmp_path / 'real.npy'),
+                           'y_pred': str(tmp_path / 'pred.npy'), **values}},
+            metadata=make_metadata('regression', **options))
+
+
+def test_files_without_validation(tmp_path, make_metadata):
+    real, predicted = get_arrays('regression')
+    predicted[-1] = np.nan
+    np.save(tmp_path / 'real.npy', real)
+    np.save(tmp_path / 'pred.npy', predicted)
+
+    results = calculate_metrics_from_files(
+        data={'test': {'y_real': str(tmp_path / 'real.npy'),
+                       'y_pred': str(tmp_path / 'pred.npy')}},
+        metadata=make_metadata('regression', validate=False),
+        memory_budget=2 ** 14)
+
+    assert np.isnan(results.loc['test', 'mse'])
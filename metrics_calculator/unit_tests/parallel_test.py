@@ -0,0 +1,196 @@
+from multiprocessing import shared_memory
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.cache import MetricsCache
+from metrics_calculator.parallel import calculate_metrics_many
+import metrics_calculator.config as config
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+def get_jobs(n_jobs=3, n_rows=500):
+    rng = np.random.default_rng(0)
+    jobs = []
+    for job in range(n_jobs):
+        problem_type = ['classification', 'regression'][job % 2]
+        metrics = {
+            'classification': ('acc', 'b_acc', 'recall', 'f1', 'precision'),
+            'regression': ('rmse', 'r2', 'mape', 'mse', 'mae')
+        }
+        data = {}
+        for dataset in ['train', 'val', 'test']:
+            if problem_type == 'classification':
+                real = rng.integers(0, 2, n_rows).astype(float)
+                predicted = rng.integers(0, 2, n_rows).astype(float)
+            else:
+                real = rng.normal(10, 2, n_rows)
+                predicted = real + rng.normal(0, 1, n_rows)
+            data[dataset] = {'y_real': pd.Series(real),
+                             'y_pred': pd.Series(predicted)}
+
+        metadata = {
+            'problem_type': problem_type,
+            'metrics': metrics[problem_type],
+            'results_file_name': f'metrics_{problem_type}',
+            'results_structure': ['single_row', 'multiple_rows'][job % 2],
+            'comment': 'Komentarz testowy',
+            'save': False
+        }
+        jobs.append({'data': data, 'metadata': metadata})
+    return jobs
+
+
+@pytest.mark.parametrize("backend", ['thread', 'process'])
+def test_calculate_metrics_many_matches_calculate_metrics(monkeypatch,
+                                                          backend):
+    monkeypatch.setattr(config, 'SHARED_MEMORY_MIN_BYTES', 0)
+    jobs = get_jobs()
+
+    results_list = calculate_metrics_many(jobs, workers=2, backend=backend)
+
+    assert len(results_list) == len(jobs)
+    for job, results in zip(jobs, results_list):
+        expected = calculate_metrics(data=job['data'],
+                                     metadata=job['metadata'])
+        pd.testing.assert_frame_equal(results, expected)
+
+
+@pytest.mark.parametrize("backend", ['thread', 'process'])
+def test_calculate_metrics_many_arrow(monkeypatch, backend):
+    pa = pytest.importorskip('pyarrow')
+    monkeypatch.setattr(config, 'SHARED_MEMORY_MIN_BYTES', 0)
+    jobs = get_jobs(n_jobs=2)
+    arrow_jobs = [{'data': {dataset: {'y_real': pa.array(values['y_real']),
+                                      'y_pred': pa.chunked_array(
+                                          [values['y_pred'].to_numpy()])}
+                            for dataset, values in job['data'].items()},
+                   'metadata': job['metadata']} for job in jobs]
+
+    results_list = calculate_metrics_many(arrow_jobs, workers=2,
+                                          backend=backend)
+
+    for job, results in zip(jobs, results_list):
+        expected = calculate_metrics(data=job['data'],
+                                     metadata=job['metadata'])
+        pd.testing.assert_frame_equal(results, expected)
+
+
+def test_calculate_metrics_many_releases_shared_memory(monkeypatch):
+    class CountingMemory(shared_memory.SharedMemory):
+        alive, peak = 0, 0
+
+        def __init__(self, *args, create=False, **kwargs):
+            super().__init__(*args, create=create, **kwargs)
+            if create:
+                CountingMemory.alive += 1
+                CountingMemory.peak = max(CountingMemory.peak,
+                                          CountingMemory.alive)
+
+        def unlink(self):
+            super().unlink()
+            CountingMemory.alive -= 1
+
+    monkeypatch.setattr(config, 'SHARED_MEMORY_MIN_BYTES', 0)
+    monkeypatch.setattr(shared_memory, 'SharedMemory', CountingMemory)
+    jobs = get_jobs(n_jobs=6)
+    for job in jobs[::2]:
+        job['data']['test']['y_pred'] = pd.DataFrame({
+            'a': job['data']['test']['y_pred'],
+            'b': job['data']['test']['y_pred'].astype(np.float32)})
+
+    results_list = calculate_metrics_many(jobs, workers=2, backend='process',
+                                          max_pending=2)
+
+    for job, results in zip(jobs, results_list):
+        expected = calculate_metrics(data=job['data'],
+                                     metadata=job['metadata'])
+        pd.testing.assert_frame_equal(results, expected)
+    assert CountingMemory.alive == 0
+    assert 0 < CountingMemory.peak <= 2 * 6
+
+
+def test_calculate_metrics_many_validates_in_caller():
+    jobs = get_jobs(n_jobs=1)
+    jobs[0]['data']['train']['y_pred'] = jobs[0]['data']['train']['y_pred'][1:]
+
+    with pytest.raises(exceptions.IncompatibleLengths):
+        calculate_metrics_many(jobs, workers=2, backend='thread')
+
+
+@pytest.mark.parametrize("backend", ['thread', 'process'])
+def test_calculate_metrics_many_bootstrap(backend):
+    jobs = get_jobs(n_jobs=2)
+    for job in jobs:
+        job['metadata']['bootstrap'] = {'n_resamples': 50, 'seed': 0}
+
+    results_list = calculate_metrics_many(jobs, workers=2, backend=backend)
+
+    for job, results in zip(jobs, results_list):
+        expected = calculate_metrics(data=job['data'],
+                                     metadata=job['metadata'])
+        assert results.columns.str.contains('_upper').any()
+        pd.testing.assert_frame_equal(results, expected)
+
+
+def test_calculate_metrics_many_cache():
+    jobs = get_jobs(n_jobs=2)
+    cache = MetricsCache()
+    for job in jobs:
+        job['metadata']['cache'] = cache
+
+    first = calculate_metrics_many(jobs, workers=2, backend='thread')
+    second = calculate_metrics_many(jobs, workers=2, backend='thread')
+
+    assert cache.stats()['misses'] == 6
+    assert cache.stats()['hits'] == 6
+    for job, results, cached in zip(jobs, first, second):
+        expected = calculate_metrics(data=job['data'],
+                                     metadata=job['metadata'])
+        pd.testing.assert_frame_equal(results, expected)
+        pd.testing.assert_frame_equal(cached, expected)
+
+
+def test_calculate_metrics_many_without_validation():
+    jobs = get_jobs(n_jobs=1)
+    jobs[0]['data']['holdout'] = jobs[0]['data'].pop('train')
+    jobs[0]['metadata']['validate'] = False
+
+    results, = calculate_metrics_many(jobs, workers=2, backend='thread')
+
+    pd.testing.assert_frame_equal(
+        results, calculate_metrics(data=jobs[0]['data'],
+                                   metadata=jobs[0]['metadata']))
+    jobs[0]['metadata']['validate'] = True
+    with pytest.raises(exceptions.WrongDatasetName):
+        calculate_metrics_many(jobs, workers=2, backend='thread')
+
+
+@pytest.mark.parametrize("backend", ['thread', 'process'])
+def test_calculate_metrics_many_groups(monkeypatch, backend):
+    monkeypatch.setattr(config, 'SHARED_MEMORY_MIN_BYTES', 0)
+    jobs = get_jobs(n_jobs=2)
+    rng = np.random.default_rng(1)
+    for job in jobs:
+        for values in job['data'].values():
+            values['groups'] = pd.Series(
+                rng.choice(['north', 'south', 'east'], len(values['y_real'])))
+
+    results_list = calculate_metrics_many(jobs, workers=2, backend=backend)
+
+    for job, results in zip(jobs, results_list):
+        expected = calculate_metrics(data=job['data'],
+                                     metadata=job['metadata'])
+        pd.testing.assert_frame_equal(results, expected)
+
+
+def test_calculate_metrics_many_groups_without_bootstrap():
+    jobs = get_jobs(n_jobs=1)
+    jobs[0]['metadata']['bootstrap'] = {'n_resamples': 50, 'seed': 0}
+    jobs[0]['data']['test']['groups'] = pd.Series(
+        np.arange(len(jobs[0]['data']['test']['y_real'])) % 2)
+
+    with pytest.raises(exceptions.WrongGroups):
+        calculate_metrics_many(jobs, workers=2, backend='thread')
@@ -0,0 +1,205 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+import metrics_calculator.config as config
+import metrics_calculator.probability as probability
+from metrics_calculator.accumulator import MetricsAccumulator
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.states import dump_state, load_state
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+METRICS = ('roc_auc', 'pr_auc', 'log_loss')
+
+
+def get_scores(n_rows=5000, decimals=None, seed=0):
+    rng = np.random.default_rng(seed)
+    real = rng.integers(0, 2, n_rows).astype(float)
+    scores = 1 / (1 + np.exp(-(real - 0.5) * 2 - rng.normal(0, 1, n_rows)))
+    if decimals is not None:
+        scores = np.round(scores, decimals)
+    return real, scores
+
+
+@pytest.fixture
+def metadata(make_metadata):
+    """ Metadane testowe z metrykami sprawdzanymi w tym module. """
+    return make_metadata('probability', metrics=METRICS)
+
+
+@pytest.mark.parametrize("decimals", [None, 2])
+def test_exact_metrics_match_sklearn(decimals, metadata):
+    from sklearn.metrics import (average_precision_score, log_loss,
+                                 roc_auc_score)
+
+    sklearn_metrics = {
+        'roc_auc': roc_auc_score,
+        'pr_auc': average_precision_score,
+        'log_loss': log_loss
+    }
+
+    real, scores = get_scores(decimals=decimals)
+    data = {'test': {'y_real': pd.Series(real), 'y_pred': pd.Series(scores)}}
+
+    results = calculate_metrics(data=data, metadata=metadata)
+
+    for metric in METRICS:
+        assert results.at['test', metric] == pytest.approx(
+            sklearn_metrics[metric](real, scores)), \
+            f'Niepoprawna wartość metryki {metric}'
+
+
+def test_histogram_is_within_error_bound(monkeypatch):
+    real, scores = get_scores(n_rows=20000)
+    exact = probability.compute_state(real, scores)
+
+    monkeypatch.setattr(config, 'SCORE_EXACT_MAX_VALUES', 1000)
+    monkeypatch.setattr(config, 'SCORE_BINS', 64)
+    histogram = probability.compute_state(real, scores)
+
+    assert isinstance(exact, probability.ScoreCounts)
+    assert isinstance(histogram, probability.ScoreHistogram)
+    for metric, bound in (('roc_auc', probability.roc_auc_error_bound),
+                          ('pr_auc', probability.pr_auc_error_bound)):
+        error = abs(probability.METRICS[metric](histogram)
+                    - probability.METRICS[metric](exact))
+        assert 0 < bound(histogram) < 0.1
+        assert error <= bound(histogram)
+    assert probability.log_loss(histogram) == \
+        pytest.approx(probability.log_loss(exact))
+
+
+def test_merged_states_match_whole_data(monkeypatch):
+    monkeypatch.setattr(config, 'SCORE_EXACT_MAX_VALUES', 3000)
+    real, scores = get_scores()
+
+    parts = [probability.compute_state(real[start:start + 1000],
+                                       scores[start:start + 1000])
+             for start in range(0, 5000, 1000)]
+    assert all(isinstance(part, probability.ScoreCounts) for part in parts)
+
+    merged = parts[0]
+    for part in parts[1:]:
+        merged = load_state(dump_state(merged)).merge(part)
+    assert isinstance(merged, probability.ScoreHistogram)
+
+    whole = probability.compute_state(real, scores)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    np.testing.assert_allclose(merged.sums, whole.sums)
+
+
+def test_many_models_and_groups(metadata):
+    real, scores = get_scores()
+    _, other_scores = get_scores(seed=1)
+    predicted = pd.DataFrame({'a': scores, 'b': other_scores})
+    groups = pd.Series(np.where(np.arange(len(real)) % 3 == 0, 'x', 'y'))
+
+    models = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real), 'y_pred': predicted}},
+        metadata=metadata)
+    grouped = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real), 'y_pred': pd.Series(scores),
+                       'groups': groups}},
+        metadata=metadata)
+
+    for model in ('a', 'b'):
+        single = calculate_metrics(
+            data={'test': {'y_real': pd.Series(real),
+                           'y_pred': predicted[model]}},
+            metadata=metadata)
+        np.testing.assert_allclose(
+            models.loc[('test', model), list(METRICS)].values,
+            single.loc['test', list(METRICS)].values)
+    for group in ('x', 'y'):
+        selected = (groups == group).values
+        single = calculate_metrics(
+            data={'test': {'y_real': pd.Series(real[selected]),
+                           'y_pred': pd.Series(scores[selected])}},
+            metadata=metadata)
+        np.testing.assert_allclose(
+            grouped.loc[('test', group), list(METRICS)].values,
+            single.loc['test', list(METRICS)].values)
+
+
+def test_exact_state_size_includes_models_and_groups(monkeypatch):
+    monkeypatch.setattr(config, 'SCORE_EXACT_MAX_VALUES', 20000)
+    real, scores = get_scores()
+    columns = np.stack([get_scores(seed=seed)[1] for seed in range(4)], axis=1)
+    groups = np.arange(len(real)) % 10
+
+    assert isinstance(probability.compute_state(real, scores),
+                      probability.ScoreCounts)
+    assert isinstance(probability.compute_state(real, columns),
+                      probability.ScoreHistogram)
+    assert isinstance(probability.compute_state(real, scores, groups, 10),
+                      probability.ScoreHistogram)
+    assert isinstance(probability.compute_state(real, scores, groups, 10,
+                                                scores='exact'),
+                      probability.ScoreCounts)
+
+
+def test_accumulator_and_bootstrap(metadata):
+    real, scores = get_scores()
+    data = {'test': {'y_real': pd.Series(real), 'y_pred': pd.Series(scores)}}
+
+    accumulator = MetricsAccumulator(metadata)
+    for start in range(0, 5000, 1500):
+        accumulator.update({'test': {
+            'y_real': data['test']['y_real'][start:start + 1500],
+            'y_pred': data['test']['y_pred'][start:start + 1500]}})
+    pd.testing.assert_frame_equal(
+        accumulator.result(), calculate_metrics(data=data,
+                                                metadata=metadata))
+
+    metadata = {**metadata, 'bootstrap': {'n_resamples': 100, 'seed': 0}}
+    results = calculate_metrics(data=data, metadata=metadata)
+    for metric in METRICS:
+        assert results.at['test', f'{metric}_lower'] <= \
+            results.at['test', metric] <= results.at['test', f'{metric}_upper']
+
+
+def test_wrong_inputs():
+    with pytest.raises(ValueError):
+        probability.compute_state(np.array([0.0, 2.0]), np.array([0.1, 0.2]))
+    with pytest.raises(ValueError):
+        probability.compute_state(np.array([0.0, 1.0]), np.array([0.1, 1.5]))
+
+
+@pytest.mark.parametrize("mode", ['exact', 'histogram'])
+def test_score_mode_option(monkeypatch, mode, metadata):
+    from sklearn.metrics import roc_auc_score
+
+    monkeypatch.setattr(config, 'SCORE_EXACT_MAX_VALUES',
+                        {'exact': 1000, 'histogram': 10 ** 6}[mode])
+    monkeypatch.setattr(config, 'SCORE_BINS', 64)
+    real, scores = get_scores()
+    data = {'test': {'y_real': pd.Series(real), 'y_pred': pd.Series(scores)}}
+    metadata = {**metadata, 'scores': mode}
+
+    state = probability.compute_state(real, scores, scores=mode)
+    results = calculate_metrics(data=data, metadata=metadata)
+    accumulator = MetricsAccumulator(metadata)
+    for start in range(0, 5000, 1500):
+        accumulator.update({'test': {
+            'y_real': data['test']['y_real'][start:start + 1500],
+            'y_pred': data['test']['y_pred'][start:start + 1500]}})
+
+    expected = roc_auc_score(real, scores)
+    pd.testing.assert_frame_equal(accumulator.result(), results)
+    if mode == 'exact':
+        assert isinstance(state, probability.ScoreCounts)
+        assert results.at['test', 'roc_auc'] == pytest.approx(expected)
+    else:
+        assert isinstance(state, probability.ScoreHistogram)
+        assert 0 < abs(results.at['test', 'roc_auc'] - expected) \
+            <= probability.roc_auc_error_bound(state)
+
+
+def test_score_mode_option_is_validated(metadata):
+    real, scores = get_scores(n_rows=10)
+    with pytest.raises(exceptions.WrongMetadataValue):
+        calculate_metrics(
+            data={'test': {'y_real': pd.Series(real),
+                           'y_pred': pd.Series(scores)}},
+            metadata={**metadata, 'scores': 'approximate'})
@@ -0,0 +1,237 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+import metrics_calculator.config as config
+import metrics_calculator.regression as regression
+from metrics_calculator.accumulator import MetricsAccumulator
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.rolling import rolling_metrics
+from metrics_calculator.states import dump_state, load_state
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+METRICS = ('median_ae', 'p50_ae', 'p90_ae', 'p95_ae', 'p99_ae',
+           'pinball_10', 'pinball_50', 'pinball_90')
+
+
+def get_arrays(n_rows=5001, seed=0):
+    rng = np.random.default_rng(seed)
+    real = rng.normal(100, 10, n_rows)
+    predicted = real + rng.standard_t(3, n_rows) + 0.3
+    return real, predicted
+
+
+def get_expected(real, predicted):
+    from sklearn.metrics import mean_pinball_loss, median_absolute_error
+
+    errors = np.abs(predicted - real)
+    expected = {'median_ae': median_absolute_error(real, predicted)}
+    for percent in (50, 90, 95, 99):
+        expected[f'p{percent}_ae'] = np.percentile(errors, percent)
+    for percent in (10, 50, 90):
+        expected[f'pinball_{percent}'] = mean_pinball_loss(
+            real, predicted, alpha=percent / 100)
+    return expected
+
+
+def get_rank_error(errors, quantile, value):
+    """ Odległość rangi względnej wartości od poziomu kwantyla. """
+    errors = np.sort(errors)
+    low = np.searchsorted(errors, value, side='left') / len(errors)
+    high = np.searchsorted(errors, value, side='right') / len(errors)
+    return max(0.0, low - quantile, quantile - high)
+
+
+@pytest.fixture
+def metadata(make_metadata):
+    """ Metadane testowe z metrykami sprawdzanymi w tym module. """
+    return make_metadata('regression', metrics=METRICS)
+
+
+def test_exact_metrics_match_sklearn(metadata):
+    real, predicted = get_arrays()
+    data = {'test': {'y_real': pd.Series(real),
+                     'y_pred': pd.Series(predicted)}}
+
+    results = calculate_metrics(data=data, metadata=metadata)
+
+    for metric, value in get_expected(real, predicted).items():
+        assert results.at['test', metric] == pytest.approx(value), \
+            f'Niepoprawna wartość metryki {metric}'
+
+
+def test_many_models_and_groups(metadata):
+    real, predicted = get_arrays()
+    _, other = get_arrays(seed=1)
+    groups = np.random.default_rng(2).choice(['a', 'b', 'c'], len(real))
+
+    models = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real),
+                       'y_pred': pd.DataFrame({'x': predicted,
+                                               'y': other})}},
+        metadata=metadata)
+    grouped = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real),
+                       'y_pred': pd.Series(predicted),
+                       'groups': pd.Series(groups)}},
+        metadata=metadata)
+
+    for model, values in (('x', predicted), ('y', other)):
+        for metric, value in get_expected(real, values).items():
+            assert models.at[('test', model), metric] == pytest.approx(value)
+    for group in ('a', 'b', 'c'):
+        selected = groups == group
+        expected = get_expected(real[selected], predicted[selected])
+        for metric, value in expected.items():
+            assert grouped.at[('test', group), metric] == \
+                pytest.approx(value)
+
+
+@pytest.mark.parametrize("groups", [False, True])
+def test_sketch_is_within_rank_error_bound(monkeypatch, groups):
+    monkeypatch.setattr(config, 'QUANTILE_EXACT_MAX_VALUES', 2000)
+    monkeypatch.setattr(config, 'QUANTILE_SKETCH_SIZE', 64)
+    monkeypatch.setattr(config, 'CHUNK_SIZE', 997)
+    real, predicted = get_arrays(n_rows=50000)
+    codes = np.arange(len(real)) % 2 if groups else None
+
+    stats = regression.compute_state(real, predicted, codes, 2,
+                                     errors=True)
+
+    bound = np.atleast_1d(regression.quantile_rank_error(stats))
+    size = config.QUANTILE_SKETCH_SIZE
+    assert len(stats.errors.values) < 2 * size * np.log2(len(real))
+    assert (bound > 0).all()
+    assert (bound <= (np.log2(len(real) / size) + 1) / size).all()
+    errors = np.abs(predicted - real)
+    for percent in (50, 90, 95, 99):
+        values = np.atleast_1d(regression.METRICS[f'p{percent}_ae'](stats))
+        for index, value in enumerate(values):
+            selected = errors if codes is None else errors[codes == index]
+            assert get_rank_error(selected, percent / 100, value) \
+                <= bound[index]
+
+
+def test_merged_sketches(monkeypatch):
+    monkeypatch.setattr(config, 'QUANTILE_EXACT_MAX_VALUES', 2000)
+    monkeypatch.setattr(config, 'QUANTILE_SKETCH_SIZE', 64)
+    real, predicted = get_arrays(n_rows=20000)
+
+    parts = [regression.compute_state(real[start:start + 1000],
+                                      predicted[start:start + 1000],
+                                      errors=True)
+             for start in range(0, 20000, 1000)]
+    assert not any(part.errors.rank_error for part in parts)
+
+    merged = parts[0]
+    for part in parts[1:]:
+        merged = load_state(dump_state(merged)).merge(part)
+
+    bound = regression.quantile_rank_error(merged)
+    assert 0 < bound < 0.1
+    assert merged.errors.count() == len(real)
+    for percent in (50, 95, 99):
+        value = regression.METRICS[f'p{percent}_ae'](merged)
+        assert get_rank_error(np.abs(predicted - real), percent / 100,
+                              value) <= bound
+
+
+def test_accumulator_matches_whole_data(metadata):
+    real, predicted = get_arrays()
+    accumulator = MetricsAccumulator(metadata)
+    for start in range(0, len(real), 1000):
+        accumulator.update({'test': {
+            'y_real': pd.Series(real[start:start + 1000]),
+            'y_pred': pd.Series(predicted[start:start + 1000])}})
+
+    restored = MetricsAccumulator.from_dict(metadata,
+                                            accumulator.to_dict())
+    results = restored.result()
+
+    for metric, value in get_expected(real, predicted).items():
+        assert results.at['test', metric] == pytest.approx(value)
+
+
+def test_bootstrap_intervals(make_metadata):
+    real, predicted = get_arrays()
+    metadata = make_metadata('regression',
+                             metrics=('median_ae', 'p95_ae', 'pinball_90'),
+                             bootstrap={'n_resamples': 200, 'seed': 0})
+
+    results = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real),
+                       'y_pred': pd.Series(predicted)}},
+        metadata=metadata)
+
+    for metric in ('median_ae', 'p95_ae', 'pinball_90'):
+        assert results.at['test', f'{metric}_lower'] \
+            < results.at['test', metric] \
+            < results.at['test', f'{metric}_upper']
+
+
+def test_rolling_pinball_and_quantile_metrics():
+    real, predicted = get_arrays(n_rows=300)
+
+    results = rolling_metrics(real, predicted, 'regression',
+                              ('pinball_10', 'pinball_90'), 50)
+
+    expected = get_expected(real[-50:], predicted[-50:])
+    for metric in ('pinball_10', 'pinball_90'):
+        assert results[metric].iloc[-1] == pytest.approx(expected[metric])
+    with pytest.raises(exceptions.MetricNotImplemented):
+        rolling_metrics(real, predicted, 'regression', ('p95_ae',), 50)
+
+
+def test_quantile_metrics_require_errors():
+    real, predicted = get_arrays(n_rows=10)
+    with pytest.raises(ValueError):
+        regression.median_absolute_error(
+            regression.compute_state(real, predicted))
+
+
+@pytest.mark.parametrize("mode", ['exact', 'sketch'])
+def test_quantile_mode_option(monkeypatch, mode, metadata):
+    monkeypatch.setattr(config, 'QUANTILE_EXACT_MAX_VALUES',
+                        {'exact': 2000, 'sketch': 10 ** 6}[mode])
+    monkeypatch.setattr(config, 'QUANTILE_SKETCH_SIZE', 256)
+    monkeypatch.setattr(config, 'CHUNK_SIZE', 997)
+    real, predicted = get_arrays(n_rows=20000)
+    metadata = {**metadata, 'quantiles': mode}
+
+    stats = regression.compute_state(real, predicted, errors=True,
+                                     quantiles=mode)
+    results = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real),
+                       'y_pred': pd.Series(predicted)}},
+        metadata=metadata)
+    accumulator = MetricsAccumulator(metadata)
+    for start in range(0, len(real), 1000):
+        accumulator.update({'test': {
+            'y_real': pd.Series(real[start:start + 1000]),
+            'y_pred': pd.Series(predicted[start:start + 1000])}})
+    restored = MetricsAccumulator.from_dict(metadata, accumulator.to_dict())
+
+    bound = regression.quantile_rank_error(stats)
+    errors = np.abs(predicted - real)
+    if mode == 'exact':
+        assert bound == 0
+        assert len(stats.errors.values) == len(real)
+        for values in (results, restored.result()):
+            for metric, value in get_expected(real, predicted).items():
+                assert values.at['test', metric] == pytest.approx(value)
+    else:
+        assert 0 < bound < 0.05
+        assert len(stats.errors.values) < len(real) / 4
+        for percent in (50, 90, 95, 99):
+            value = results.at['test', f'p{percent}_ae']
+            assert get_rank_error(errors, percent / 100, value) <= bound
+
+
+def test_quantile_mode_option_is_validated(metadata):
+    real, predicted = get_arrays(n_rows=10)
+    with pytest.raises(exceptions.WrongMetadataValue):
+        calculate_metrics(
+            data={'test': {'y_real': pd.Series(real),
+                           'y_pred': pd.Series(predicted)}},
+            metadata={**metadata, 'quantiles': 'approximate'})
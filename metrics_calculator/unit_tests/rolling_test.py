@@ -0,0 +1,144 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.rolling import RollingWindow, rolling_metrics
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+METRICS = {
+    'classification': ('acc', 'b_acc', 'recall', 'f1_macro',
+                       'precision_weighted'),
+    'regression': ('rmse', 'r2', 'mape', 'mse', 'mae')
+}
+
+
+def get_data(problem_type, n_rows=200):
+    rng = np.random.default_rng(0)
+    if problem_type == 'classification':
+        real = rng.integers(0, 3, n_rows).astype(float)
+        predicted = np.where(rng.random(n_rows) < 0.7, real,
+                             rng.integers(0, 3, n_rows)).astype(float)
+    else:
+        real = rng.normal(1000, 2, n_rows)
+        real[50:70] = 1000.0
+        predicted = real + rng.normal(0, 1, n_rows)
+    timestamps = pd.Timestamp('2024-01-01') + pd.to_timedelta(
+        np.cumsum(rng.integers(1, 120, n_rows)), unit='s')
+    return real, predicted, timestamps
+
+
+def get_expected(real, predicted, problem_type, start, stop):
+    metadata = {
+        'problem_type': problem_type,
+        'metrics': METRICS[problem_type],
+        'results_file_name': f'metrics_{problem_type}',
+        'results_structure': 'multiple_rows',
+        'comment': 'Komentarz testowy',
+        'save': False
+    }
+    results = calculate_metrics(
+        data={'test': {'y_real': pd.Series(real[start:stop]),
+                       'y_pred': pd.Series(predicted[start:stop])}},
+        metadata=metadata)
+    return results.loc['test']
+
+
+@pytest.mark.parametrize("problem_type", ['classification', 'regression'])
+@pytest.mark.parametrize("window", [15, '10min'])
+def test_rolling_matches_calculate_metrics(problem_type, window):
+    real, predicted, timestamps = get_data(problem_type)
+
+    results = rolling_metrics(real, predicted, problem_type,
+                              METRICS[problem_type], window,
+                              timestamps=timestamps)
+
+    assert list(results.columns) == list(METRICS[problem_type])
+    assert results.index.equals(pd.Index(timestamps, name='timestamp'))
+    for stop in range(1, len(real) + 1):
+        if isinstance(window, int):
+            start = max(0, stop - window)
+        else:
+            start = timestamps.searchsorted(
+                timestamps[stop - 1] - pd.Timedelta(window), side='right')
+        expected = get_expected(real, predicted, problem_type, start, stop)
+        np.testing.assert_allclose(results.iloc[stop - 1].values,
+                                   expected.values.astype(float),
+                                   rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize("problem_type", ['classification', 'regression'])
+@pytest.mark.parametrize("window", [15, '10min'])
+def test_rolling_window_matches_batch(problem_type, window):
+    real, predicted, timestamps = get_data(problem_type)
+    expected = rolling_metrics(real, predicted, problem_type,
+                               METRICS[problem_type], window,
+                               timestamps=timestamps)
+
+    online = RollingWindow(problem_type, METRICS[problem_type], window)
+    for start in range(0, len(real), 7):
+        stop = start + 7
+        online.add(real[start:stop], predicted[start:stop],
+                   timestamps[start:stop])
+        values = online.values()
+        np.testing.assert_allclose(
+            [values[metric] for metric in METRICS[problem_type]],
+            expected.iloc[min(stop, len(real)) - 1].values,
+            rtol=1e-6, atol=1e-9)
+
+
+def test_rolling_window_evict():
+    real, predicted, _ = get_data('regression')
+    online = RollingWindow('regression', METRICS['regression'])
+    online.add(real, predicted)
+    online.evict(150)
+
+    expected = get_expected(real, predicted, 'regression', 150, len(real))
+    assert online.n_rows == 50
+    np.testing.assert_allclose(
+        [online.values()[metric] for metric in METRICS['regression']],
+        expected.values.astype(float), rtol=1e-6)
+
+
+@pytest.mark.parametrize("window", [100, '100s'])
+def test_rolling_precision_with_drifting_errors(window):
+    n_rows = 50000
+    rng = np.random.default_rng(0)
+    real = rng.normal(0, 1, n_rows)
+    predicted = real + rng.normal(0, 1, n_rows) * np.logspace(3, -3, n_rows)
+    timestamps = pd.date_range('2024-01-01', periods=n_rows, freq='s')
+    metrics = ('mse', 'r2', 'mae')
+
+    results = rolling_metrics(real, predicted, 'regression', metrics,
+                              window, timestamps=timestamps)
+    online = RollingWindow('regression', metrics, window)
+    for start in range(0, n_rows, 7):
+        online.add(real[start:start + 7], predicted[start:start + 7],
+                   timestamps[start:start + 7])
+
+    for stop in (n_rows // 2, n_rows - 1234, n_rows):
+        expected = get_expected(real, predicted, 'regression', stop - 100,
+                                stop)[list(metrics)].values.astype(float)
+        np.testing.assert_allclose(results.iloc[stop - 1].values, expected,
+                                   rtol=1e-6)
+    np.testing.assert_allclose([online.values()[metric] for metric in metrics],
+                               expected, rtol=1e-6)
+
+
+def test_rolling_validation():
+    real, predicted, timestamps = get_data('regression', n_rows=10)
+
+    with pytest.raises(exceptions.IncompatibleLengths):
+        rolling_metrics(real, predicted[:-1], 'regression', ('mse',), 5)
+    with pytest.raises(exceptions.IncompatibleLengths):
+        RollingWindow('regression', ('mse',), 5).add(real, predicted[:-1])
+    with pytest.raises(exceptions.WrongType):
+        rolling_metrics(real, predicted, 'regression', ('mse',), '5s')
+    with pytest.raises(exceptions.WrongType):
+        RollingWindow('regression', ('mse',), '5s').add(real, predicted)
+    with pytest.raises(exceptions.WrongValuesType):
+        rolling_metrics(real, predicted, 'regression', ('mse',), '5s',
+                        timestamps=timestamps[::-1])
+    with pytest.raises(exceptions.ProblemTypeNotImplemented):
+        RollingWindow('probability', ('log_loss',), 5)
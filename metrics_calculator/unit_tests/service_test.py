@@ -0,0 +1,91 @@
+import json
+import threading
+import urllib.request
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.service import JobRunner, main, make_server
+
+
+def get_jobs(tmp_path, make_data, make_metadata, n_jobs=5):
+    jobs, expected = [], {}
+    for index in range(n_jobs):
+        problem_type = ['classification', 'regression'][index % 2]
+        data = make_data(problem_type, datasets=('test',), seed=index)
+        np.save(tmp_path / f'real_{index}.npy', data['test']['y_real'])
+        np.save(tmp_path / f'pred_{index}.npy', data['test']['y_pred'])
+        metadata = make_metadata(problem_type)
+        jobs.append({'id': index, 'metadata': metadata, 'data': {'test': {
+            'y_real': str(tmp_path / f'real_{index}.npy'),
+            'y_pred': str(tmp_path / f'pred_{index}.npy')}}})
+        expected[index] = calculate_metrics(data=data, metadata=metadata)
+    return jobs, expected
+
+
+def check_results(results, expected):
+    assert sorted(result['id'] for result in results) == sorted(expected)
+    for result in results:
+        assert result['status'] == 'ok'
+        frame = pd.DataFrame(**result['results'])
+        np.testing.assert_allclose(frame.values.astype(float),
+                                   expected[result['id']].values.astype(float))
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_run_jobs_from_file(tmp_path, workers, make_data, make_metadata):
+    jobs, expected = get_jobs(tmp_path, make_data, make_metadata)
+    lines = [json.dumps(job) for job in jobs] + ['', 'niepoprawna linia']
+    (tmp_path / 'jobs.jsonl').write_text('\n'.join(lines))
+
+    main(['--workers', str(workers), '--batch-size', '2', 'run',
+          '--input', str(tmp_path / 'jobs.jsonl'),
+          '--output', str(tmp_path / 'results.jsonl')])
+
+    results = [json.loads(line) for line in
+               (tmp_path / 'results.jsonl').read_text().splitlines()]
+    errors = [result for result in results if result['status'] == 'error']
+    assert len(errors) == 1 and errors[0]['id'] is None
+    check_results([result for result in results if result not in errors],
+                  expected)
+
+
+def test_job_errors_do_not_stop_other_jobs(tmp_path, make_data,
+                                           make_metadata):
+    jobs, expected = get_jobs(tmp_path, make_data, make_metadata, n_jobs=2)
+    jobs.append({'id': 'wrong',
+                 'metadata': make_metadata('regression', metrics=['wrong']),
+                 'data': jobs[1]['data']})
+
+    with JobRunner(workers=0) as runner:
+        results = list(runner.run(jobs))
+
+    assert [result['status'] for result in results] == ['ok', 'ok', 'error']
+    assert 'MetricNotImplemented' in results[2]['error']
+    check_results(results[:2], expected)
+
+
+def test_http_server(tmp_path, make_data, make_metadata):
+    jobs, expected = get_jobs(tmp_path, make_data, make_metadata)
+
+    with JobRunner(workers=0, max_pending=2) as runner:
+        server = make_server(runner, '127.0.0.1', 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            address = f'http://127.0.0.1:{server.server_address[1]}'
+            with urllib.request.urlopen(f'{address}/health') as response:
+                assert json.loads(response.read()) == {'status': 'ok'}
+
+            request = urllib.request.Request(
+                f'{address}/jobs', method='POST',
+                data='\n'.join(json.dumps(job) for job in jobs).encode())
+            with urllib.request.urlopen(request) as response:
+                results = [json.loads(line) for line in response]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    check_results(results, expected)
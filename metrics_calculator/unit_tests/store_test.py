@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.store import ResultsStore
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """ Strefa czasowa procesu inna niż UTC. """
+    if not hasattr(time, 'tzset'):
+        pytest.skip('Zmiana strefy czasowej wymaga time.tzset')
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_calculate_metrics_appends_to_store(tmp_path, make_data,
+                                            make_metadata):
+    path = str(tmp_path / 'store')
+    metadata = make_metadata('classification', 'single_row',
+                             metrics=('acc', 'f1'), save=True,
+                             results_store=path)
+    expected = []
+    for seed in range(3):
+        results = calculate_metrics(
+            data=make_data(n_rows=100, seed=seed),
+            metadata={**metadata, 'results_file_name': 'model_a'})
+        expected.append(results['f1_test'].values[0])
+    calculate_metrics(data=make_data(n_rows=100, seed=10),
+                      metadata={**metadata, 'results_file_name': 'model_b'})
+
+    values = ResultsStore(path).query(file_name='model_a', dataset='test',
+                                      metric='f1')
+
+    assert len(values) == 3
+    assert list(values['file_name'].unique()) == ['model_a']
+    np.testing.assert_allclose(values['value'], expected)
+
+
+def test_store_query_by_time_and_compact(tmp_path):
+    store = ResultsStore(str(tmp_path / 'store'))
+    records = pd.DataFrame({'dataset': ['test', 'test'],
+                            'label': [None, None],
+                            'metric': ['acc', 'f1'],
+                            'value': [0.5, 0.25]})
+    now = datetime(2024, 5, 31, 12)
+    for days in [0, 0, 10, 40]:
+        store.append(records, 'model_a', 'classification',
+                     created_at=now - timedelta(days=days))
+
+    since = now - timedelta(days=30)
+    values = store.query(file_name='model_a', metric='f1', since=since)
+    assert len(values) == 3
+
+    store.compact(now.strftime('%Y-%m-%d'))
+
+    assert store.runs()['partition'].nunique() == 3
+    pd.testing.assert_frame_equal(
+        store.query(file_name='model_a', metric='f1', since=since),
+        values)
+
+
+def test_store_times_are_utc(tmp_path, local_timezone):
+    store = ResultsStore(str(tmp_path / 'store'))
+    records = pd.DataFrame({'dataset': ['test'], 'label': [None],
+                            'metric': ['acc'], 'value': [0.5]})
+    store.append(records, 'model_a', 'classification',
+                 created_at=datetime(2024, 6, 1, 8))
+    store.append(records, 'model_b', 'classification',
+                 created_at=pd.Timestamp('2024-05-31 20:00',
+                                         tz='America/New_York'))
+
+    runs = store.runs()
+
+    assert list(runs['created_at']) == [
+        pd.Timestamp('2024-05-31 23:00', tz='UTC'),
+        pd.Timestamp('2024-06-01 00:00', tz='UTC')]
+    assert list(runs['partition'].str[6:16]) == ['2024-05-31', '2024-06-01']
+    utc = datetime(2024, 5, 31, 23, 30, tzinfo=timezone.utc)
+    for since in [utc, pd.Timestamp(utc), '2024-06-01 08:30',
+                  datetime(2024, 6, 1, 8, 30)]:
+        assert list(store.runs(since=since)['file_name']) == ['model_b']
+        assert list(store.runs(until=since)['file_name']) == ['model_a']
@@ -0,0 +1,61 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+from metrics_calculator.app import calculate_metrics
+from metrics_calculator.thresholds import (DEFAULT_METRICS, best_threshold,
+                                           threshold_sweep)
+import metrics_calculator.logger_utils.exceptions as exceptions
+
+
+def get_scores(n_rows=500):
+    rng = np.random.default_rng(0)
+    real = rng.integers(0, 2, n_rows).astype(float)
+    scores = np.round(real + rng.normal(0, 1, n_rows), 1)
+    return real, scores
+
+
+@pytest.mark.parametrize("thresholds", [None, [-10.0, -0.25, 0.5, 1.3, 10.0]])
+def test_sweep_matches_calculate_metrics(thresholds, make_metadata):
+    real, scores = get_scores()
+    metadata = make_metadata(metrics=DEFAULT_METRICS)
+    sweep = threshold_sweep(pd.Series(real), pd.Series(scores), thresholds)
+
+    expected_thresholds = np.unique(scores) if thresholds is None \
+        else thresholds
+    np.testing.assert_array_equal(sweep.index, expected_thresholds)
+    for threshold in expected_thresholds:
+        predicted = (scores >= threshold).astype(float)
+        expected = calculate_metrics(
+            data={'test': {'y_real': pd.Series(real),
+                           'y_pred': pd.Series(predicted)}},
+            metadata=metadata)
+        for metric in DEFAULT_METRICS:
+            assert sweep.at[threshold, metric] == pytest.approx(
+                expected.at['test', metric]), \
+                f'Niepoprawna wartość metryki {metric} dla progu {threshold}'
+
+
+def test_best_threshold():
+    real, scores = get_scores()
+    sweep = threshold_sweep(real, scores)
+
+    threshold, value = best_threshold(sweep, 'f1')
+
+    assert value == sweep['f1'].max()
+    assert sweep.at[threshold, 'f1'] == value
+
+
+def test_wrong_labels():
+    with pytest.raises(exceptions.WrongValuesType):
+        threshold_sweep(np.array([0.0, 2.0]), np.array([0.1, 0.2]))
+
+
+def test_wrong_lengths():
+    with pytest.raises(exceptions.IncompatibleLengths):
+        threshold_sweep(np.array([0.0, 1.0]), np.array([0.1, 0.2, 0.3]))
+
+
+def test_nan_scores():
+    with pytest.raises(exceptions.NanValuesDetected):
+        threshold_sweep(np.array([0.0, 1.0]), np.array([0.1, np.nan]))
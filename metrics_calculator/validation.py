@@ -1,28 +1,34 @@
+from __future__ import annotations
+
 import inspect
 import os
 import sys
 from datetime import datetime
 from typing import Tuple
 
-import pandas as pd
+import numpy as np
 
 import metrics_calculator.config as config
 import metrics_calculator.logger_utils.exceptions as exceptions
 import metrics_calculator.logger_utils.logger as logger_module
+import metrics_calculator.regression as regression
+from metrics_calculator.lazy import lazy_import
 
-
-""" Utworzenie katalogu z logami """
-if not os.path.exists(config.PATH_TO_LOGS):
-    os.makedirs(config.PATH_TO_LOGS)
+pd = lazy_import('pandas')
 
 
-""" Wczytanie loggera """
+""" Wczytanie loggera (katalog i plik z logami tworzone są dopiero przy
+    zapisie pierwszego komunikatu) """
 log_file_name = f"{config.PATH_TO_LOGS}/%d-%m-%Y   %H-%M-%S.log"
 log_path = datetime.now().strftime(log_file_name)
 logger = logger_module.get_module_logger(mod_name=__name__,
                                          file_name=os.path.basename(__file__),
                                          log_path=log_path,
-                                         level=1)
+                                         level=1,
+                                         mode=config.LOG_MODE,
+                                         log_format=config.LOG_FORMAT,
+                                         max_bytes=config.LOG_MAX_BYTES,
+                                         backup_count=config.LOG_BACKUP_COUNT)
 
 
 def run_validation(
@@ -32,14 +38,17 @@ def run_validation(
     metrics_dict: dict,
     problem_type: str,
     dataset: str,
-    results_structure: str
+    results_structure: str,
+    dataset_names: Tuple[str, ...] = None,
+    compact: bool = False
 ) -> None:
 
     validate_results_structure(results_structure)
-    validate_dataset_name(dataset)
+    validate_dataset_name(dataset, dataset_names)
     validate_problem_type(problem_type)
     validate_metrics(metrics, problem_type, metrics_dict)
-    validate_series(real, predicted, dataset)
+    validate_series(real, predicted, dataset,
+                    compact and problem_type == 'classification')
 
 
 def validate_results_structure(results_structure: str) -> None:
@@ -54,11 +63,14 @@ Poprawne nazwy struktury to: "single_row" oraz "multiple_rows"'
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
 
-def validate_dataset_name(dataset: str) -> None:
+def validate_dataset_name(dataset: str,
+                          dataset_names: Tuple[str, ...] = None) -> None:
+    if dataset_names is None:
+        dataset_names = config.DATASET_NAMES
     message = f'Klucz "{dataset}" w słowniku jest nieprawidłowy. \
-Poprawne nazwy kluczy to: "train", "val" oraz "test".'
+Poprawne nazwy kluczy to: {", ".join(map(str, dataset_names))}.'
     try:
-        assert dataset in ['train', 'val', 'test']
+        assert dataset in dataset_names
     except AssertionError:
         logger_module.log_error(logger, exceptions.WrongDatasetName,
                                 message,
@@ -68,10 +80,21 @@ Poprawne nazwy kluczy to: "train", "val" oraz "test".'
 
 def validate_series(real: pd.Series,
                     predicted: pd.Series,
-                    dataset: str) -> None:
+                    dataset: str,
+                    labels: bool = False) -> None:
+    """ Sprawdzenia typu, typu wartości, długości i pustych tablic
+        korzystają tylko z metadanych (dtype, len), a indeksy RangeIndex
+        lub te same obiekty indeksu porównywane są w czasie stałym. Dane
+        czyta jedynie sprawdzenie wartości nan - jedną redukcją na tablicę
+        (dla 2 * 10^7 wartości float64 około 20 ms). Łączenie tych
+        sprawdzeń w jedno przejście w numpy wymagałoby tablicy tymczasowej
+        (np. real + predicted) i byłoby około trzy razy wolniejsze, więc
+        sprawdzenia pozostają osobne, a kolejność zgłaszanych błędów jest
+        taka sama jak wcześniej.
+    """
 
     validate_type(real, predicted, dataset)
-    validate_values_types(real, predicted, dataset)
+    validate_values_types(real, predicted, dataset, labels)
     validate_not_empty(real, predicted, dataset)
     validate_compatible_lengths(real, predicted, dataset)
     validate_index_match(real, predicted, dataset)
@@ -83,12 +106,13 @@ def validate_type(real: pd.Series,
                   dataset: str) -> None:
 
     message_real = f'Obiekt wartości rzeczywistych nie jest obiektem \
-typu pd.Series w zbiorze "{dataset}"'
-    message_pred = f'Obiekt predykcji nie jest obiektem typu pd.Series \
-w zbiorze "{dataset}"'
+typu pd.Series ani jednowymiarową tablicą np.ndarray w zbiorze "{dataset}"'
+    message_pred = f'Obiekt predykcji nie jest obiektem typu pd.Series, \
+pd.DataFrame ani tablicą np.ndarray w zbiorze "{dataset}"'
 
     try:
-        assert isinstance(real, pd.Series)
+        assert isinstance(real, pd.Series) \
+            or (isinstance(real, np.ndarray) and real.ndim == 1)
     except AssertionError:
         logger_module.log_error(logger, exceptions.WrongType,
                                 message_real,
@@ -96,7 +120,9 @@ w zbiorze "{dataset}"'
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
     try:
-        assert isinstance(predicted, pd.Series)
+        assert isinstance(predicted, (pd.Series, pd.DataFrame)) \
+            or (isinstance(predicted, np.ndarray)
+                and predicted.ndim in (1, 2))
     except AssertionError:
         logger_module.log_error(logger, exceptions.WrongType,
                                 message_pred,
@@ -106,15 +132,20 @@ w zbiorze "{dataset}"'
 
 def validate_values_types(real: pd.Series,
                           predicted: pd.Series,
-                          dataset: str) -> None:
-
+                          dataset: str,
+                          labels: bool = False) -> None:
+    """ Dla labels=True (tryb kompaktowy klasyfikacji) dopuszczalne są
+        również etykiety całkowite, logiczne i kategoryczne.
+    """
+    types = 'float, int, bool lub category' if labels else 'float'
     message_real = f'Obiekt wartości rzeczywistych dla zbioru "{dataset}" \
-zawiera wartości o niepoprawnym typie. Wymagany typ danych to float'
+zawiera wartości o niepoprawnym typie. Wymagany typ danych to {types}'
     message_pred = f'Obiekt predykcji dla zbioru "{dataset}" \
-zawiera wartości o niepoprawnym typie. Wymagany typ danych to float'
+zawiera wartości o niepoprawnym typie. Wymagany typ danych to {types}'
+    has_valid_values = has_label_values if labels else has_float_values
 
     try:
-        assert (real.map(type) == float).all()
+        assert has_valid_values(real)
     except AssertionError:
         logger_module.log_error(logger, exceptions.WrongValuesType,
                                 message_real,
@@ -122,7 +153,7 @@ zawiera wartości o niepoprawnym typie. Wymagany typ danych to float'
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
     try:
-        assert (predicted.map(type) == float).all()
+        assert has_valid_values(predicted)
     except AssertionError:
         logger_module.log_error(logger, exceptions.WrongValuesType,
                                 message_pred,
@@ -136,7 +167,7 @@ def validate_index_match(real: pd.Series,
     message = f'Dla zbioru {dataset} indeksy obiektów pd.Series nie są zgodne'
 
     try:
-        assert (real.index == predicted.index).all()
+        assert indexes_match(real, predicted)
     except AssertionError:
         logger_module.log_error(logger, exceptions.IndexesNotMatch,
                                 message,
@@ -161,7 +192,7 @@ jest zerowa dla zbioru "{dataset}"'
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
     try:
-        assert len(predicted) != 0
+        assert np.size(predicted) != 0
     except AssertionError:
         logger_module.log_error(logger, exceptions.EmptyArray,
                                 message_pred,
@@ -183,6 +214,21 @@ nie zgadza się z ilością predykcji ({len(predicted)}) dla zbioru "{dataset}"'
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
 
+def validate_source_lengths(real_rows: int,
+                            predicted_rows: int,
+                            dataset: str) -> None:
+    message = f'''Ilość wartości rzeczywistych ({real_rows}) \
+nie zgadza się z ilością predykcji ({predicted_rows}) w plikach zbioru \
+"{dataset}"'''
+    try:
+        assert real_rows == predicted_rows
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.IncompatibleLengths,
+                                message,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
 def validate_nan_values(real: pd.Series,
                         predicted: pd.Series,
                         dataset: str) -> None:
@@ -192,7 +238,7 @@ wartości nan dla zbioru "{dataset}"'
 wartości nan dla zbioru "{dataset}"'
 
     try:
-        assert real.isna().sum() == 0
+        assert not has_nan_values(real)
     except AssertionError:
         logger_module.log_error(logger, exceptions.NanValuesDetected,
                                 message_real,
@@ -200,7 +246,7 @@ wartości nan dla zbioru "{dataset}"'
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
     try:
-        assert predicted.isna().sum() == 0
+        assert not has_nan_values(predicted)
     except AssertionError:
         logger_module.log_error(logger, exceptions.NanValuesDetected,
                                 message_pred,
@@ -208,6 +254,60 @@ wartości nan dla zbioru "{dataset}"'
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
 
+def has_float_values(values) -> bool:
+    """ Dla szeregów o numpy'owym typie zmiennoprzecinkowym wystarczy
+        sprawdzić dtype. Sprawdzanie typu element po elemencie zostaje
+        jedynie dla typu object i typów rozszerzeń pandas. Obiekty
+        DataFrame sprawdzane są kolumna po kolumnie.
+    """
+    if isinstance(values, pd.DataFrame):
+        return all(has_float_values(column) for _, column in values.items())
+
+    dtype = values.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind != 'O':
+        return dtype.kind == 'f'
+    if not isinstance(values, pd.Series):
+        values = pd.Series(np.ravel(values))
+    return bool((values.map(type) == float).all())
+
+
+def has_label_values(values) -> bool:
+    if isinstance(values, pd.DataFrame):
+        return all(has_label_values(column) for _, column in values.items())
+
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return True
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biu':
+        return True
+    return has_float_values(values)
+
+
+def has_nan_values(values) -> bool:
+    """ Suma tablicy jest skończona tylko wtedy, gdy tablica nie zawiera
+        wartości nan ani inf, więc w typowym przypadku wystarcza jedna
+        redukcja bez alokowania tablicy masek. Dokładne sprawdzenie
+        wykonywane jest dopiero, gdy suma nie jest skończona. Tablice
+        całkowite i logiczne nie mogą zawierać nan, a dla kategorii
+        sprawdzane są jedynie kody.
+    """
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        return bool((np.asarray(values.cat.codes) < 0).any())
+    array = np.asarray(values)
+    if array.dtype.kind == 'f':
+        return not np.isfinite(array.sum()) and bool(np.isnan(array).any())
+    if array.dtype.kind in 'biu':
+        return False
+    return bool(np.asarray(pd.isna(values)).any())
+
+
+def indexes_match(real, predicted) -> bool:
+    """ Indeksy porównywane są tylko wtedy, gdy oba obiekty je posiadają. """
+    if not (hasattr(real, 'index') and hasattr(predicted, 'index')):
+        return True
+    return real.index is predicted.index or real.index.equals(predicted.index)
+
+
 def validate_metrics(metrics: Tuple[str, ...],
                      problem_type: str,
                      metrics_dict: dict) -> None:
@@ -224,7 +324,8 @@ def validate_metrics(metrics: Tuple[str, ...],
 
 def validate_problem_type(problem_type: str) -> None:
     try:
-        assert problem_type in ['regression', 'classification']
+        assert problem_type in ['regression', 'classification',
+                                'probability']
     except AssertionError:
         logger_module.log_error(logger, exceptions.ProblemTypeNotImplemented,
                                 f'Błąd dla typu problemu "{problem_type}"',
@@ -232,6 +333,123 @@ def validate_problem_type(problem_type: str) -> None:
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
 
 
+def validate_groups(real: pd.Series,
+                    predicted: pd.Series,
+                    groups: pd.Series,
+                    dataset: str,
+                    bootstrap: dict = None) -> None:
+    message_type = f'Klucze grup w zbiorze "{dataset}" muszą być \
+jednowymiarowym obiektem pd.Series lub np.ndarray'
+    message_values = f'Klucze grup w zbiorze "{dataset}" muszą mieć tę samą \
+długość i indeks co wartości rzeczywiste i nie mogą zawierać wartości nan'
+    message_usage = f'Metryki dla grup w zbiorze "{dataset}" wymagają \
+pojedynczego szeregu predykcji i nie obsługują metody bootstrap'
+
+    try:
+        assert isinstance(groups, (pd.Series, np.ndarray))
+        assert np.ndim(groups) == 1
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongGroups,
+                                message_type,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert len(groups) == len(real)
+        assert indexes_match(real, groups)
+        assert not np.asarray(pd.isna(groups)).any()
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongGroups,
+                                message_values,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert np.ndim(predicted) == 1
+        assert bootstrap is None
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongGroups,
+                                message_usage,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_bootstrap_options(options: dict) -> None:
+    keys = ['n_resamples', 'confidence_level', 'seed', 'chunk_size']
+    message_keys = f'Opcje bootstrap muszą być słownikiem z kluczami: \
+{", ".join(keys)}'
+    message_resamples = 'Liczba prób "n_resamples" musi być dodatnią \
+liczbą całkowitą'
+    message_level = 'Poziom ufności "confidence_level" musi należeć do \
+przedziału (0, 1)'
+
+    try:
+        assert isinstance(options, dict)
+        assert set(options.keys()) <= set(keys)
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongBootstrapOptions,
+                                message_keys,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert int(options.get('n_resamples', 1)) > 0
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongBootstrapOptions,
+                                message_resamples,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert 0 < options.get('confidence_level', 0.95) < 1
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongBootstrapOptions,
+                                message_level,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_metadata_option(metadata: dict,
+                             key: str,
+                             values: Tuple[str, ...]) -> None:
+    message = f'Pole "{key}" w słowniku metadata może przyjmować wartości: \
+{", ".join(values)}'
+    try:
+        assert metadata.get(key) is None or metadata[key] in values
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongMetadataValue,
+                                message,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_incremental_options(metadata: dict) -> None:
+    message = 'Pola "bootstrap" i "cache" w słowniku metadata nie są \
+obsługiwane przy liczeniu metryk przyrostowo (MetricsAccumulator, \
+calculate_metrics_from_files)'
+    try:
+        assert metadata.get('bootstrap') is None
+        assert metadata.get('cache') is None
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongMetadataValue,
+                                message,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_incremental_groups(values: dict, dataset: str) -> None:
+    message = f'Metryki dla grup (klucz "groups" w zbiorze "{dataset}") \
+nie są obsługiwane przy liczeniu metryk przyrostowo (MetricsAccumulator, \
+calculate_metrics_from_files)'
+    try:
+        assert values.get('groups') is None
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongGroups,
+                                message,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
 def validate_metadata_dict(metadata: dict) -> None:
 
     keys = ['problem_type', 'metrics', 'results_file_name',
@@ -244,3 +462,105 @@ def validate_metadata_dict(metadata: dict) -> None:
                                 f'W słowniku metadata brakuje klucza "{key}"',
                                 inspect.stack()[0].function,
                                 sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_threshold_inputs(real, scores) -> None:
+    message_lengths = f'''Ilość wartości rzeczywistych ({len(real)}) \
+nie zgadza się z ilością wyników modelu ({len(scores)})'''
+    message_labels = 'Wartości rzeczywiste muszą być etykietami 0 i 1'
+    message_nan = 'Tablica wyników modelu zawiera wartości nan'
+
+    try:
+        assert len(real) == len(scores)
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.IncompatibleLengths,
+                                message_lengths,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert np.isin(real, (0, 1)).all()
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongValuesType,
+                                message_labels,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert not has_nan_values(scores)
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.NanValuesDetected,
+                                message_nan,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_rolling_metrics(problem_type: str,
+                             metrics: Tuple[str, ...]) -> None:
+    message_problem = f'Metryki w oknach przesuwnych są dostępne dla \
+regresji i klasyfikacji, a nie dla typu problemu "{problem_type}"'
+    message_metrics = 'Percentyle błędu bezwzględnego nie są dostępne \
+w oknach przesuwnych'
+
+    try:
+        assert problem_type in ['regression', 'classification']
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.ProblemTypeNotImplemented,
+                                message_problem,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert not set(metrics) & set(regression.QUANTILE_METRICS)
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.MetricNotImplemented,
+                                message_metrics,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_rolling_series(real: np.ndarray,
+                            predicted: np.ndarray) -> None:
+    message_type = 'Wartości rzeczywiste i predykcje w oknach przesuwnych \
+muszą być jednowymiarowe'
+    message_lengths = f'''Ilość wartości rzeczywistych ({len(real)}) \
+nie zgadza się z ilością predykcji ({len(predicted)}) w oknie przesuwnym'''
+
+    try:
+        assert real.ndim == 1 and predicted.ndim == 1
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongType,
+                                message_type,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+    try:
+        assert len(real) == len(predicted)
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.IncompatibleLengths,
+                                message_lengths,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_window_timestamps(window, timestamps) -> None:
+    message = f'Okno czasowe "{pd.Timedelta(window)}" wymaga podania \
+timestamps'
+    try:
+        assert timestamps is not None
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongType,
+                                message,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore
+
+
+def validate_increasing_timestamps(index: pd.DatetimeIndex) -> None:
+    message = 'Okno czasowe wymaga rosnących wartości timestamps'
+    try:
+        assert index.is_monotonic_increasing
+    except AssertionError:
+        logger_module.log_error(logger, exceptions.WrongValuesType,
+                                message,
+                                inspect.stack()[0].function,
+                                sys.exc_info()[-1].tb_lineno)  # type: ignore